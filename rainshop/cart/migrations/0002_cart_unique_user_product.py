@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    duplicates = Cart.objects.values('user_id', 'product_id').annotate(
+        rows=Count('id'),
+        keep_id=Min('id'),
+        total=Sum('quantity'),
+    ).filter(rows__gt=1).order_by()
+    for duplicate in duplicates.iterator():
+        Cart.objects.filter(id=duplicate['keep_id']).update(quantity=duplicate['total'])
+        Cart.objects.filter(
+            user_id=duplicate['user_id'],
+            product_id=duplicate['product_id'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='carts_unique_user_product'),
+        ),
+    ]
@@ -8,6 +8,10 @@ class Cart(models.Model):
 	class Meta:
 		db_table = 'carts'
 		verbose_name_plural = 'Carts'
+		constraints = [
+			# one row per product in a cart, see cart.services.add_to_cart
+			models.UniqueConstraint(fields=['user', 'product'], name='carts_unique_user_product'),
+		]
 	user = models.ForeignKey(
 		settings.AUTH_USER_MODEL,
 		related_name='carts',
@@ -1,13 +1,14 @@
 from rest_framework import serializers
-from rest_framework.reverse import reverse
 
 from products.models import Product
 from products.serializers import ProductShortSerializer
-from rainshop.custom_drf_errors import CustomError
+from rainshop.fieldsets import SparseFieldsetMixin
+from rainshop.links import link_builder
 from .models import Cart
+from .services import add_one_to_cart, add_to_cart
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 	product = ProductShortSerializer(many=False)
 	max_quantity = serializers.SerializerMethodField('get_max_quantity')
 	is_available_as_selected = serializers.SerializerMethodField('get_is_available_as_selected')
@@ -25,6 +26,12 @@ class CartSerializer(serializers.ModelSerializer):
 			'total_price',
 			'self'
 		]
+		field_sources = {
+			'max_quantity'            : ['product', 'product__quantity'],
+			'is_available_as_selected': ['quantity', 'product', 'product__quantity'],
+			'total_price'             : ['quantity', 'product', 'product__price', 'product__price_currency'],
+			'self'                    : ['id'],
+		}
 
 	def get_is_available_as_selected(self, obj):
 		if obj.product.quantity >= obj.quantity:
@@ -39,8 +46,7 @@ class CartSerializer(serializers.ModelSerializer):
 		return obj.product.quantity
 
 	def get_self_link(self, obj):
-		return reverse('cart:cart-detail', request=self.context['request'],
-					   args=(obj.id,))
+		return link_builder(self.context['request']).url('cart:cart-detail', obj.id)
 
 
 class AddToCartSerializer(serializers.ModelSerializer):
@@ -54,44 +60,90 @@ class AddToCartSerializer(serializers.ModelSerializer):
 			'quantity',
 		]
 
+	def create(self, validated_data):
+		# one INSERT ... ON CONFLICT round trip, see cart.services
+		return add_one_to_cart(
+			self.context['request'].user,
+			validated_data['product_id'],
+			validated_data['quantity']
+		)
+
+
+class CartLineSerializer(serializers.Serializer):
+	product_id = serializers.IntegerField(required=True, min_value=1)
+	quantity = serializers.IntegerField(required=True, min_value=1, max_value=999)
+
+
+class BulkAddToCartSerializer(serializers.Serializer):
+	"""
+	Adds many products to the cart at once. Lines are validated one by one,
+	so a bad line is reported in line_errors without failing the others.
+	Validation needs one Product and one Cart query for the whole batch.
+	"""
+	max_lines = 200
+	items = serializers.ListField(
+		child=serializers.DictField(),
+		allow_empty=False,
+		max_length=max_lines
+	)
+
 	def validate(self, attrs):
-		try:
-			cart_object = Cart.objects.get(
+		self.line_errors = []
+		requested = {}
+		for index, line in enumerate(attrs['items']):
+			line_serializer = CartLineSerializer(data=line)
+			if not line_serializer.is_valid():
+				self.line_errors.append({'index': index, 'errors': line_serializer.errors})
+				continue
+			product_id = line_serializer.validated_data['product_id']
+			indexes, quantity = requested.get(product_id, ([], 0))
+			requested[product_id] = (indexes + [index], quantity + line_serializer.validated_data['quantity'])
+
+		products = Product.objects.in_bulk(list(requested))
+		carts = {
+			cart_object.product_id: cart_object
+			for cart_object in Cart.objects.filter(
 				user=self.context['request'].user,
-				product_id=attrs['product_id']
-			)
-			attrs['quantity'] = attrs['quantity'] + cart_object.quantity
-			self.context['cart'] = cart_object
-		except Cart.DoesNotExist:
-			self.context['cart'] = None
-		try:
-			target_product = Product.objects.get(id=attrs['product_id'])
-		except Product.DoesNotExist:
-			raise CustomError(
-				detail='Product does not exist',
-				status_code=404,
-				field='product_id'
-			)
-		if target_product.quantity < attrs['quantity']:
-			raise CustomError(
-				detail=f'Not enough product left. Remaining at the moment: {target_product.quantity}',
-				status_code=400,
-				field='quantity'
+				product_id__in=list(requested)
 			)
+		}
+		lines = []
+		for product_id, (indexes, quantity) in requested.items():
+			target_product = products.get(product_id)
+			cart_object = carts.get(product_id)
+			if cart_object is not None:
+				quantity += cart_object.quantity
+			if target_product is None:
+				errors = {'product_id': ['Product does not exist']}
+			elif target_product.quantity < quantity:
+				errors = {'quantity': [
+					f'Not enough product left. Remaining at the moment: {target_product.quantity}'
+				]}
+			else:
+				lines.append((target_product, cart_object, quantity, indexes))
+				continue
+			for index in indexes:
+				self.line_errors.append({'index': index, 'errors': errors})
+		self.line_errors.sort(key=lambda line_error: line_error['index'])
+		attrs['lines'] = lines
 		return attrs
 
 	def create(self, validated_data):
-		if self.context['cart'] is not None:
-			cart_object = self.context['cart']
-			cart_object.quantity = validated_data['quantity']
-		else:
-			cart_object = Cart(
-				user=self.context['request'].user,
-				product_id=validated_data['product_id'],
-				quantity=validated_data['quantity']
-			)
-		cart_object.save()
-		return cart_object
+		user = self.context['request'].user
+		# only the requested amounts are sent, the upsert adds them to whatever is in the cart by now
+		added = add_to_cart(user, {
+			target_product.id: quantity - (cart_object.quantity if cart_object is not None else 0)
+			for target_product, cart_object, quantity, _ in validated_data['lines']
+		})
+		for target_product, _, _, indexes in validated_data['lines']:
+			if target_product.id not in added:
+				# stock was taken between validation and the write
+				for index in indexes:
+					self.line_errors.append({'index': index, 'errors': {'quantity': [
+						'Not enough product left.'
+					]}})
+		self.line_errors.sort(key=lambda line_error: line_error['index'])
+		return list(Cart.objects.filter(id__in=added.values()).select_related('product'))
 
 
 class CartUpdateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,112 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products.models import Product
+from rainshop.custom_drf_errors import CustomError
+from .models import Cart
+
+
+def _supports_upsert():
+	if connection.vendor == 'postgresql':
+		return True
+	if connection.vendor == 'sqlite':
+		# ON CONFLICT ... DO UPDATE needs 3.24, RETURNING needs 3.35
+		return connection.Database.sqlite_version_info >= (3, 35)
+	return False
+
+
+def _upsert(user, quantities):
+	"""
+	Adds all quantities in one INSERT ... ON CONFLICT DO UPDATE statement.
+	Both the insert and the update are guarded, so a line is only written
+	if the resulting cart quantity is still in stock.
+	"""
+	now = connection.ops.adapt_datetimefield_value(timezone.now())
+	carts = connection.ops.quote_name(Cart._meta.db_table)
+	products = connection.ops.quote_name(Product._meta.db_table)
+	values = ', '.join(['(%s, %s)'] * len(quantities))
+	params = []
+	for product_id, quantity in quantities.items():
+		params += [product_id, quantity]
+	sql = (
+		f'WITH requested (product_id, quantity) AS (VALUES {values}) '
+		f'INSERT INTO {carts} (user_id, product_id, quantity, created_at, updated_at) '
+		f'SELECT %s, p.id, requested.quantity, %s, %s '
+		f'FROM {products} p JOIN requested ON p.id = requested.product_id '
+		f'WHERE p.quantity >= requested.quantity '
+		f'ON CONFLICT (user_id, product_id) DO UPDATE '
+		f'SET quantity = {carts}.quantity + excluded.quantity, updated_at = excluded.updated_at '
+		f'WHERE {carts}.quantity + excluded.quantity <= '
+		f'(SELECT quantity FROM {products} WHERE id = excluded.product_id) '
+		f'RETURNING product_id, id'
+	)
+	with connection.cursor() as cursor:
+		cursor.execute(sql, params + [user.id, now, now])
+		return dict(cursor.fetchall())
+
+
+def _add_one_by_one(user, quantities):
+	added = {}
+	with transaction.atomic():
+		stock = dict(
+			Product.objects.select_for_update().filter(
+				id__in=sorted(quantities)
+			).order_by('id').values_list('id', 'quantity')
+		)
+		for product_id in sorted(quantities):
+			if product_id not in stock:
+				continue
+			cart_object, _ = Cart.objects.select_for_update().get_or_create(
+				user=user,
+				product_id=product_id,
+				defaults={'quantity': 0}
+			)
+			if cart_object.quantity + quantities[product_id] > stock[product_id]:
+				if cart_object.quantity == 0:
+					cart_object.delete()
+				continue
+			cart_object.quantity += quantities[product_id]
+			cart_object.save()
+			added[product_id] = cart_object.id
+	return added
+
+
+def add_to_cart(user, quantities):
+	"""
+	Atomically adds products to the user's cart, creating or incrementing
+	the (user, product) rows. On Postgres and sqlite this is a single round trip.
+
+	@param user: owner of the cart
+	@param quantities: dict of product id -> quantity to add
+	@return: dict of product id -> cart id for the lines that were added;
+			 lines that are missing ran out of stock or the product does not exist
+	"""
+	if not quantities:
+		return {}
+	if _supports_upsert():
+		return _upsert(user, quantities)
+	return _add_one_by_one(user, quantities)
+
+
+def add_one_to_cart(user, product_id, quantity):
+	"""
+	Adds a single product to the cart, raising the same errors the
+	add to cart endpoint always did.
+
+	@return: the updated Cart with its product loaded
+	"""
+	added = add_to_cart(user, {product_id: quantity})
+	if product_id in added:
+		return Cart.objects.select_related('product').get(id=added[product_id])
+	remaining = Product.objects.filter(id=product_id).values_list('quantity', flat=True).first()
+	if remaining is None:
+		raise CustomError(
+			detail='Product does not exist',
+			status_code=404,
+			field='product_id'
+		)
+	raise CustomError(
+		detail=f'Not enough product left. Remaining at the moment: {remaining}',
+		status_code=400,
+		field='quantity'
+	)
@@ -1,3 +1,95 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from products.models import Product
+from .models import Cart
+
+
+class BulkCartTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+		self.case = Product.objects.create(name='Case', cost=2, price=15, quantity=10)
+		self.charger = Product.objects.create(name='Charger', cost=5, price=30, quantity=1)
+
+	def bulk(self, items):
+		return self.client.post(reverse('cart:cart-bulk-create'), {'items': items}, format='json')
+
+	def cart(self):
+		return dict(Cart.objects.filter(user=self.user).values_list('product__name', 'quantity'))
+
+	def test_sparse_fieldset_skips_product_join(self):
+		Cart.objects.create(user=self.user, product=self.case, quantity=2)
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('cart:cart-list-create'), {'fields': 'id,quantity'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([set(item) for item in response.data['results']], [{'id', 'quantity'}])
+		self.assertFalse([query for query in queries.captured_queries if 'products' in query['sql']])
+
+	def test_applies_valid_lines_and_reports_the_rest(self):
+		Cart.objects.create(user=self.user, product=self.case, quantity=2)
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.bulk([
+				{'product_id': self.phone.id, 'quantity': 2},
+				{'product_id': self.case.id, 'quantity': 3},
+				{'product_id': 999, 'quantity': 1},
+				{'product_id': self.charger.id, 'quantity': 2},
+				{'product_id': self.phone.id, 'quantity': 1},
+				{'product_id': 'x'},
+			])
+
+		self.assertEqual(response.status_code, 200, response.data)
+		product_reads = [q for q in queries.captured_queries if q['sql'].startswith('SELECT "products"')]
+		self.assertEqual(len(product_reads), 1)
+		self.assertLessEqual(len(queries), 7)
+		self.assertEqual(self.cart(), {'Phone': 3, 'Case': 5})
+		self.assertEqual(
+			[(line_error['index'], list(line_error['errors'])) for line_error in response.data['errors']],
+			[(2, ['product_id']), (3, ['quantity']), (5, ['product_id', 'quantity'])]
+		)
+		self.assertEqual(
+			sorted((line['product']['name'], line['quantity']) for line in response.data['results']),
+			[('Case', 5), ('Phone', 3)]
+		)
+
+	def test_nothing_applied(self):
+		response = self.bulk([{'product_id': self.charger.id, 'quantity': 5}])
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(self.cart(), {})
+		self.assertEqual(self.bulk([]).status_code, 400)
+
+
+class AddToCartTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+
+	def add(self, product_id, quantity):
+		return self.client.post(reverse('cart:cart-list-create'), {'product_id': product_id, 'quantity': quantity}, format='json')
+
+	def test_repeated_adds_increment_one_row(self):
+		self.assertEqual(self.add(self.phone.id, 2).status_code, 201)
+		response = self.add(self.phone.id, 3)
+		self.assertEqual(response.status_code, 201, response.data)
+		self.assertEqual(response.data['quantity'], 5)
+		self.assertEqual(
+			list(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+			[(self.phone.id, 5)]
+		)
+
+	def test_stock_and_missing_product(self):
+		self.add(self.phone.id, 4)
+		response = self.add(self.phone.id, 2)
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(Cart.objects.get(user=self.user).quantity, 4)
+		self.assertEqual(self.add(999, 1).status_code, 404)
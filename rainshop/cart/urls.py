@@ -1,9 +1,12 @@
 from . import views
 from django.urls import path
 
+from rainshop.async_views import async_view
+
 app_name = 'cart'
 urlpatterns = [
-	path('', views.CartListCreateView.as_view(), name='cart-list-create'),
+	path('', async_view(views.CartListCreateView.as_view()), name='cart-list-create'),
+	path('bulk/', views.CartBulkCreateView.as_view(), name='cart-bulk-create'),
 	path('<int:pk>/', views.CartItemRetrieveUpdateRemoveView.as_view(), name='cart-detail'),
 
 ]
\ No newline at end of file
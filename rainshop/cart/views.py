@@ -7,12 +7,14 @@ from rest_framework import generics, status
 from rest_framework import permissions
 from rest_framework.response import Response
 
+from rainshop.conditional import ConditionalGetMixin, queryset_validators
+from rainshop.fieldsets import SparseFieldsetViewMixin, fields_parameter
 from .permissions import CartOwner
 from .models import Cart
-from .serializers import CartSerializer, AddToCartSerializer, CartUpdateSerializer
+from .serializers import CartSerializer, AddToCartSerializer, BulkAddToCartSerializer, CartUpdateSerializer
 
 
-class CartListCreateView(generics.ListCreateAPIView):
+class CartListCreateView(ConditionalGetMixin, SparseFieldsetViewMixin, generics.ListCreateAPIView):
 
 	def get_queryset(self):
 		if getattr(self, "swagger_fake_view", False):
@@ -23,10 +25,20 @@ class CartListCreateView(generics.ListCreateAPIView):
 			user=self.request.user
 		).select_related('product')
 
+	def get_list_validators(self):
+		updated_at = ['updated_at']
+		# these fields show the stock and price of the products
+		if any(self.wants_field(name) for name in ('product', 'max_quantity', 'is_available_as_selected', 'total_price')):
+			updated_at.append('product__updated_at')
+		return queryset_validators(
+			self.filter_queryset(self.get_queryset()), self.request.user.pk, updated_at=updated_at
+		)
+
 	@swagger_auto_schema(
 		tags=['Cart'],
 		operation_summary='List cart products',
 		operation_id='get_cart',
+		manual_parameters=[fields_parameter],
 
 	)
 	def get(self, request, *args, **kwargs):
@@ -77,7 +89,35 @@ class CartListCreateView(generics.ListCreateAPIView):
 		return [permission() for permission in permission_classes]
 
 
-class CartItemRetrieveUpdateRemoveView(generics.RetrieveUpdateDestroyAPIView):
+class CartBulkCreateView(generics.GenericAPIView):
+	serializer_class = BulkAddToCartSerializer
+	permission_classes = [permissions.IsAuthenticated]
+
+	@swagger_auto_schema(
+		request_body=BulkAddToCartSerializer,
+		operation_id='bulk_add_to_cart',
+		operation_summary='Add many products to the cart',
+		operation_description='Valid lines are applied even if other lines fail; '
+							  'failed lines are listed in "errors" with their index.',
+		tags=['Cart'],
+		responses={
+			200: CartSerializer(many=True),
+		},
+	)
+	def post(self, request, *args, **kwargs):
+		serializer = self.get_serializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		cart_objects = serializer.save()
+		data = {
+			'results': CartSerializer(cart_objects, many=True, context=self.get_serializer_context()).data,
+			'errors' : serializer.line_errors
+		}
+		if serializer.line_errors and not cart_objects:
+			return Response(data, status=status.HTTP_400_BAD_REQUEST)
+		return Response(data, status=status.HTTP_200_OK)
+
+
+class CartItemRetrieveUpdateRemoveView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
 	queryset = Cart.objects.all()
 	serializer_class = CartSerializer
 	permission_classes = [permissions.IsAuthenticated & CartOwner]
@@ -87,6 +127,7 @@ class CartItemRetrieveUpdateRemoveView(generics.RetrieveUpdateDestroyAPIView):
 		operation_id='retrieve_cart_item',
 		operation_summary='Get a single cart item',
 		tags=['Cart'],
+		manual_parameters=[fields_parameter],
 	)
 	def get(self, request, *args, **kwargs):
 		return self.retrieve(request, *args, **kwargs)
@@ -14,5 +14,5 @@ User = get_user_model()
 if not User.objects.filter(email='$DJANGO_ADMIN_EMAIL').exists(): User.objects.create_superuser(username='$DJANGO_ADMIN_USERNAME', email='$DJANGO_ADMIN_EMAIL', password='$DJANGO_ADMIN_PASSWORD')" | python manage.py shell
 
 python manage.py migrate
-python manage.py loaddata products.json --app products.Products
+python manage.py import_products products.json
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Gunicorn runtime profile: gunicorn -c gunicorn.conf.py
+Every setting can be overridden with the GUNICORN_* environment variable named next to it.
+
+Each worker thread keeps its own database connection for DB_CONN_MAX_AGE seconds,
+so up to workers * threads connections are open per instance. Keep that (times the
+number of instances) below Postgres' max_connections, or put pgbouncer in front and
+set DB_PGBOUNCER.
+"""
+import multiprocessing
+import os
+
+
+def _int(name, default):
+	return int(os.environ.get(name, default))
+
+
+cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8081')
+
+# gthread: a request waiting on the database releases the GIL, so threads of one
+# worker overlap their queries, writes included (unlike Django 3.2 under ASGI,
+# which runs every sync view of a worker on one thread).
+# uvicorn.workers.UvicornWorker serves rainshop.asgi instead, see rainshop.async_views.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class.startswith('uvicorn.'):
+	wsgi_app = 'rainshop.asgi:application'
+	workers = _int('GUNICORN_WORKERS', cpus * 2 + 1)
+else:
+	wsgi_app = 'rainshop.wsgi:application'
+	# threads do the waiting, processes only need to cover the CPUs
+	workers = _int('GUNICORN_WORKERS', cpus + 1)
+	threads = _int('GUNICORN_THREADS', 4)
+
+# import Django once in the master and fork the workers from it: faster boots,
+# shared memory pages and import errors fail the start instead of every worker
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# recycle workers now and then against slow memory growth, jittered so they do not restart together
+max_requests = _int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+timeout = _int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _int('GUNICORN_KEEPALIVE', 5)
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = os.environ.get('GUNICORN_ERRORLOG', '-')
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def pre_fork(server, worker):
+	# runs in the master before every fork: importing the app opens no connection,
+	# should anything have opened one anyway it is closed before a worker could share its socket
+	if preload_app:
+		from django.db import connections
+		connections.close_all()
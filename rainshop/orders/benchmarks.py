@@ -0,0 +1,61 @@
+import random
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from rainshop.factories import ProductFactory, UserFactory
+
+CHECKOUT_STEPS = ['list_products', 'add_to_cart', 'checkout', 'pay', 'cancel']
+
+
+def seed(users, products):
+	"""Creates the benchmark users and a catalog with enough stock for every round."""
+	return (
+		UserFactory.create_batch(users),
+		[product.id for product in ProductFactory.create_batch(products)],
+	)
+
+
+def checkout(recorder, users, product_ids, rounds=5, items=3, page_size=20, rng=None):
+	"""
+	Drives list products -> add to cart -> checkout -> pay -> cancel through the
+	DRF test client for every user, rounds times, recording each request.
+	Cancelling restores the stock, so the catalog never runs out.
+	"""
+	rng = rng or random.Random(0)
+	clients = []
+	for user in users:
+		client = APIClient()
+		client.force_authenticate(user)
+		clients.append(client)
+
+	recorder.start()
+	for _ in range(rounds):
+		for client in clients:
+			recorder.call(
+				'list_products', client.get, reverse('products:products-list-create'),
+				{'limit': page_size, 'offset': rng.randrange(max(len(product_ids) - page_size, 1))},
+				expected=(status.HTTP_200_OK,)
+			)
+			for product_id in rng.sample(product_ids, min(items, len(product_ids))):
+				recorder.call(
+					'add_to_cart', client.post, reverse('cart:cart-list-create'),
+					{'product_id': product_id, 'quantity': rng.randint(1, 3)}, format='json',
+					expected=(status.HTTP_201_CREATED,)
+				)
+			order = recorder.call(
+				'checkout', client.post, reverse('orders:order-list-create'), {}, format='json',
+				expected=(status.HTTP_201_CREATED,)
+			).data
+			# the dummy callback answers 400 for both outcomes, success is checked by the cancel below
+			recorder.call(
+				'pay', client.get, reverse('orders:order-payment-callback', args=[order['id']]),
+				expected=(status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST)
+			)
+			recorder.call(
+				'cancel', client.delete, reverse('orders:order-detail', args=[order['id']]),
+				expected=(status.HTTP_204_NO_CONTENT,)
+			)
+	recorder.stop()
+	return recorder.summary()
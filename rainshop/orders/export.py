@@ -0,0 +1,113 @@
+import csv
+import datetime
+import json
+from itertools import groupby
+
+from rest_framework import serializers
+
+from rainshop.dates import day_range
+from .models import OrderItem
+
+EXPORT_FORMATS = ['ndjson', 'csv']
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = [
+	('order_id', 'order_id'),
+	('order_user_id', 'order__user_id'),
+	('order_status', 'order__status'),
+	('order_price', 'order__order_price'),
+	('order_price_currency', 'order__order_price_currency'),
+	('order_created_at', 'order__created_at'),
+	('order_updated_at', 'order__updated_at'),
+]
+ITEM_COLUMNS = [
+	('item_id', 'id'),
+	('product_id', 'product_id'),
+	('product_name', 'product_name'),
+	('product_price', 'product_price'),
+	('product_price_currency', 'product_price_currency'),
+	('product_final_price', 'product_final_price'),
+	('product_final_price_currency', 'product_final_price_currency'),
+	('quantity', 'quantity'),
+]
+CSV_HEADER = [name for name, _ in ORDER_COLUMNS + ITEM_COLUMNS]
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _plain(value):
+	if value is None or isinstance(value, (int, str)):
+		return value
+	if hasattr(value, 'tzinfo'):
+		return _datetime_field.to_representation(value)
+	# Decimal amounts are exported as strings, like the API does
+	return str(value)
+
+
+def export_rows(start_date=None, end_date=None, statuses=None, chunk_size=EXPORT_CHUNK_SIZE):
+	"""
+	Streams order items joined with their orders, ordered by order id.
+	Rows are fetched through a server side cursor chunk by chunk,
+	so memory use does not depend on how much history is exported.
+
+	@param start_date: first order day to export (inclusive)
+	@param end_date: last order day to export (inclusive)
+	@param statuses: order statuses to export, all when empty
+	@param chunk_size: rows fetched from the database at a time
+	@return: iterator of value tuples in ORDER_COLUMNS + ITEM_COLUMNS order
+	"""
+	items = OrderItem.objects.filter(day_range('order__created_at', start_date, end_date))
+	if statuses:
+		items = items.filter(order__status__in=statuses)
+	lookups = [lookup for _, lookup in ORDER_COLUMNS + ITEM_COLUMNS]
+	return items.order_by('order_id', 'id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+	"""File-like object that hands back what is written, for csv.writer."""
+
+	def write(self, value):
+		return value
+
+
+def iter_csv(rows):
+	writer = csv.writer(_Echo())
+	yield writer.writerow(CSV_HEADER)
+	for row in rows:
+		yield writer.writerow([_plain(value) for value in row])
+
+
+def iter_ndjson(rows):
+	"""
+	Yields one JSON document per order with its items nested.
+	Relies on rows being ordered by order id, so only one order is held at a time.
+	"""
+	order_width = len(ORDER_COLUMNS)
+	for _, order_rows in groupby(rows, key=lambda row: row[0]):
+		items = []
+		order = None
+		for row in order_rows:
+			if order is None:
+				order = {name: _plain(value) for (name, _), value in zip(ORDER_COLUMNS, row[:order_width])}
+			items.append({name: _plain(value) for (name, _), value in zip(ITEM_COLUMNS, row[order_width:])})
+		order['items'] = items
+		yield json.dumps(order) + '\n'
+
+
+def parse_date(value):
+	if not value:
+		return None
+	return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_statuses(value):
+	if not value:
+		return []
+	return [status.strip().upper() for status in value.split(',') if status.strip()]
+
+
+def iter_export(file_format, **filters):
+	rows = export_rows(**filters)
+	if file_format == 'csv':
+		return iter_csv(rows)
+	return iter_ndjson(rows)
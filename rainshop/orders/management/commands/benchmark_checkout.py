@@ -0,0 +1,74 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import benchmarks
+from rainshop import benchmarking
+
+
+class Command(BaseCommand):
+	help = (
+		'Benchmarks list products -> add to cart -> checkout -> pay -> cancel in a throwaway test database '
+		'and writes p50/p95/p99 latency, queries per request and throughput to a JSON report.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--users', type=int, default=20)
+		parser.add_argument('--products', type=int, default=200)
+		parser.add_argument('--rounds', type=int, default=5, help='Checkouts per user.')
+		parser.add_argument('--items', type=int, default=3, help='Products added to the cart per checkout.')
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--output', '-o', default='benchmark-checkout.json')
+		parser.add_argument('--baseline', help='Report of an earlier run to compare against.')
+		parser.add_argument(
+			'--tolerance', type=float, default=0.2,
+			help='Allowed relative p95 slowdown against the baseline.'
+		)
+		parser.add_argument(
+			'--fail-on-regression', action='store_true',
+			help='Exit with an error when the run regressed against the baseline.'
+		)
+		parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+	def handle(self, *args, **options):
+		for name in ('users', 'products', 'rounds', 'items'):
+			if options[name] < 1:
+				raise CommandError(f'--{name} must be positive')
+		baseline = benchmarking.load_report(options['baseline']) if options['baseline'] else None
+
+		with benchmarking.isolated_database(keepdb=options['keepdb']):
+			users, product_ids = benchmarks.seed(options['users'], options['products'])
+			try:
+				report = benchmarks.checkout(
+					benchmarking.Recorder(),
+					users,
+					product_ids,
+					rounds=options['rounds'],
+					items=options['items'],
+					rng=random.Random(options['seed'])
+				)
+			except benchmarking.BenchmarkError as exc:
+				raise CommandError(str(exc))
+			report['environment'] = benchmarking.environment()
+		report['parameters'] = {
+			name: options[name] for name in ('users', 'products', 'rounds', 'items', 'seed')
+		}
+		benchmarking.write_report(options['output'], report)
+
+		for step in benchmarks.CHECKOUT_STEPS:
+			summary = report['steps'][step]
+			self.stdout.write(
+				f'{step:<14} p50 {summary["p50_ms"]:8.2f}ms  p95 {summary["p95_ms"]:8.2f}ms  '
+				f'p99 {summary["p99_ms"]:8.2f}ms  {summary["queries_mean"]:6.2f} queries  '
+				f'{summary["throughput_rps"]:8.1f} req/s'
+			)
+		self.stdout.write(f'{report["total"]["throughput_rps"]} req/s overall, written to {options["output"]}')
+
+		if baseline is not None:
+			regressions = benchmarking.compare(report, baseline, options['tolerance'])
+			for regression in regressions:
+				self.stdout.write(self.style.WARNING(f'Regression: {regression}'))
+			if not regressions:
+				self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+			elif options['fail_on_regression']:
+				raise CommandError(f'{len(regressions)} regressions against the baseline')
@@ -0,0 +1,26 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.services import expire_unpaid_orders
+
+
+class Command(BaseCommand):
+	help = 'Cancels unpaid orders older than the TTL and returns their stock, in batches.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--ttl-minutes', type=int, default=settings.ORDER_EXPIRY_MINUTES,
+			help='Age after which an unpaid order expires.'
+		)
+		parser.add_argument('--batch-size', type=int, default=settings.ORDER_EXPIRY_BATCH_SIZE)
+
+	def handle(self, *args, **options):
+		if options['ttl_minutes'] < 0 or options['batch_size'] < 1:
+			raise CommandError('--ttl-minutes must not be negative and --batch-size must be positive')
+		expired = expire_unpaid_orders(
+			ttl=datetime.timedelta(minutes=options['ttl_minutes']),
+			batch_size=options['batch_size']
+		)
+		self.stdout.write(self.style.SUCCESS(f'Expired {expired} unpaid orders.'))
@@ -0,0 +1,42 @@
+import argparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import export
+
+
+def _date(value):
+	try:
+		return export.parse_date(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError('dates must be in YYYY-MM-DD format')
+
+
+class Command(BaseCommand):
+	help = 'Streams orders and their items as NDJSON or CSV, in constant memory.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--format', dest='file_format', choices=export.EXPORT_FORMATS, default='ndjson')
+		parser.add_argument('--start-date', type=_date, help='First order date to export (YYYY-MM-DD).')
+		parser.add_argument('--end-date', type=_date, help='Last order date to export (YYYY-MM-DD).')
+		parser.add_argument('--status', default='', help='Comma separated order statuses.')
+		parser.add_argument('--chunk-size', type=int, default=export.EXPORT_CHUNK_SIZE)
+		parser.add_argument('--output', '-o', help='File to write to, stdout by default.')
+
+	def handle(self, *args, **options):
+		if options['chunk_size'] < 1:
+			raise CommandError('--chunk-size must be positive')
+		content = export.iter_export(
+			options['file_format'],
+			start_date=options['start_date'],
+			end_date=options['end_date'],
+			statuses=export.parse_statuses(options['status']),
+			chunk_size=options['chunk_size']
+		)
+		if options['output']:
+			with open(options['output'], 'w', newline='') as output:
+				for chunk in content:
+					output.write(chunk)
+		else:
+			for chunk in content:
+				self.stdout.write(chunk, ending='')
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_orders_as_rolled_up(apps, schema_editor):
+    # existing orders were added to the rollup synchronously, under their current status
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.update(rollup_status=F('status'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='confirmation',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rollup_status',
+            field=models.CharField(blank=True, editable=False, max_length=10, null=True),
+        ),
+        migrations.RunPython(mark_orders_as_rolled_up, migrations.RunPython.noop),
+    ]
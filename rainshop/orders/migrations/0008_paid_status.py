@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def rename_status(old, new):
+    def rename(apps, schema_editor):
+        Order = apps.get_model('orders', 'Order')
+        ProductDailySales = apps.get_model('products', 'ProductDailySales')
+        Order.objects.filter(status=old).update(status=new)
+        Order.objects.filter(rollup_status=old).update(rollup_status=new)
+        ProductDailySales.objects.filter(status=old).update(status=new)
+    return rename
+
+
+class Migration(migrations.Migration):
+    # paid orders were stored as 'PAYED', which is not one of Order.STATUS_OPTIONS
+
+    dependencies = [
+        ('orders', '0007_order_item_count_total_quantity'),
+        ('products', '0007_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_status('PAYED', 'PAID'), rename_status('PAID', 'PAYED')),
+    ]
@@ -8,6 +8,18 @@ class Order(models.Model):
 	class Meta:
 		db_table = 'orders'
 		verbose_name_plural = 'Orders'
+		indexes = [
+			# order history of a user, keyset paginated, see rainshop.pagination
+			models.Index(fields=['user', 'created_at', 'id'], name='orders_user_created_id_idx'),
+			# order counts per status over a date range, see products.views.stats
+			models.Index(fields=['created_at', 'status'], name='orders_created_status_idx'),
+			# unpaid orders by age, see orders.services.expire_unpaid_orders
+			models.Index(
+				fields=['created_at', 'id'],
+				name='orders_unpaid_created_id_idx',
+				condition=models.Q(status='CREATED')
+			),
+		]
 
 	STATUS_OPTIONS = [
 		('PAID', 'Paid'),
@@ -29,6 +41,13 @@ class Order(models.Model):
 	)
 	order_price = MoneyField(default=0, null=False, blank=False, default_currency='USD',
 							 max_digits=10, decimal_places=2)
+	# items never change after checkout, so these are set once there
+	item_count = models.PositiveIntegerField(default=0, null=False, blank=False, editable=False)
+	total_quantity = models.PositiveIntegerField(default=0, null=False, blank=False, editable=False)
+	# status the order is counted under in the sales rollup, see products.rollup.sync_orders
+	rollup_status = models.CharField(max_length=10, null=True, blank=True, editable=False)
+	# filled once by orders.tasks.build_order_confirmation
+	confirmation = models.JSONField(null=True, blank=True, editable=False)
 	created_at = models.DateTimeField(auto_now_add=True, editable=False)
 	updated_at = models.DateTimeField(auto_now=True, editable=False)
 
@@ -54,6 +73,9 @@ class OrderItem(models.Model):
 					  max_digits=10, decimal_places=2)
 	product_final_price = MoneyField(default=0, null=False, blank=False, default_currency='USD',
 							 max_digits=10, decimal_places=2)
+	# unit cost at checkout, the sales rollup sums it, see products.rollup
+	product_cost = MoneyField(default=0, null=False, blank=False, default_currency='USD',
+							 max_digits=10, decimal_places=2, editable=False)
 	quantity = models.IntegerField(default=1, blank=False, null=False)
 	created_at = models.DateTimeField(auto_now_add=True, editable=False)
 	updated_at = models.DateTimeField(auto_now=True, editable=False)
@@ -1,14 +1,17 @@
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import DatabaseError, transaction
 from django.db.models import Q
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
-from rest_framework.reverse import reverse
 from .models import Order, OrderItem
+from .services import reserve_stock
+from .tasks import order_placed
 from djmoney.contrib.django_rest_framework import MoneyField
 from products.serializers import ProductSerializer
 from products.models import Product
 from rainshop.custom_drf_errors import CustomError
+from rainshop.fieldsets import SparseFieldsetMixin
+from rainshop.links import link_builder
 from cart.models import Cart
 
 
@@ -26,8 +29,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
 		]
 
 
-class OrderSerializer(serializers.ModelSerializer):
-	items = serializers.SerializerMethodField('get_items')
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+	# a nested field is bound once for the whole list, unlike a serializer per order
+	items = OrderItemSerializer(many=True, read_only=True)
 	self = serializers.SerializerMethodField('get_self')
 
 	class Meta:
@@ -41,17 +45,27 @@ class OrderSerializer(serializers.ModelSerializer):
 			'updated_at',
 			'self'
 		]
+		field_sources = {'self': ['id']}
 
 	@swagger_serializer_method(serializer_or_field=serializers.URLField())
 	def get_self(self, obj):
-		return reverse('orders:order-detail', request=self.context['request'],
-					   args=(obj.id,))
+		return link_builder(self.context['request']).url('orders:order-detail', obj.id)
 
-	@swagger_serializer_method(serializer_or_field=OrderItemSerializer(many=True))
-	def get_items(self, obj):
-		return OrderItemSerializer(
-			obj.items.all(), many=True
-		).data
+
+class OrderSummarySerializer(OrderSerializer):
+	"""Order without its items, for history pages. Reads nothing but the orders table."""
+
+	class Meta(OrderSerializer.Meta):
+		fields = [
+			'id',
+			'status',
+			'item_count',
+			'total_quantity',
+			'order_price',
+			'created_at',
+			'updated_at',
+			'self'
+		]
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -92,39 +106,61 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 					status_code=400,
 					field='quantity'
 				)
-		self.context['cart_objects'] = cart_objects
 		return attrs
 
 	def create(self, validated_data):
-		cart_objects = self.context['cart_objects']
-		order_items = []
-		order = Order(
-			user=self.context['request'].user
-		)
-		order_price = 0.0
-		for cart_object in cart_objects:
-			new_order_item = OrderItem(
-				order=order,
-				product=cart_object.product,
-				product_name=cart_object.product.name,
-				product_price=cart_object.product.price,
-				product_final_price=cart_object.product.price * cart_object.quantity,
-				quantity=cart_object.quantity
-			)
-			order_price += cart_object.product.price * cart_object.quantity
-			cart_object.product.quantity = cart_object.product.quantity - cart_object.quantity
-			order_items.append(new_order_item)
-		order.order_price = order_price
+		user = self.context['request'].user
 		try:
 			with transaction.atomic():
+				# re-read the cart under lock, so a repeated checkout request
+				# waits for this one and then finds the cart empty
+				cart_objects = list(
+					Cart.objects.select_for_update().filter(user=user).order_by('id')
+				)
+				if len(cart_objects) == 0:
+					raise CustomError(
+						detail='Empty Cart.',
+						status_code=400,
+						field='cart'
+					)
+				quantities = {}
+				for cart_object in cart_objects:
+					quantities[cart_object.product_id] = quantities.get(cart_object.product_id, 0) + cart_object.quantity
+				products = reserve_stock(quantities)
+
+				order_items = []
+				order = Order(
+					user=user
+				)
+				order_price = 0.0
+				for cart_object in cart_objects:
+					product = products[cart_object.product_id]
+					new_order_item = OrderItem(
+						order=order,
+						product=product,
+						product_name=product.name,
+						product_price=product.price,
+						product_final_price=product.price * cart_object.quantity,
+						product_cost=product.cost,
+						quantity=cart_object.quantity
+					)
+					order_price += product.price * cart_object.quantity
+					order_items.append(new_order_item)
+				order.order_price = order_price
+				order.item_count = len(order_items)
+				order.total_quantity = sum(order_item.quantity for order_item in order_items)
 				order.save()
 				OrderItem.objects.bulk_create(
 					order_items
 				)
-				for cart_object in cart_objects:
-					cart_object.product.save()
-				cart_objects.delete()
-		except Exception as e:
+				# the cart is emptied in the same transaction on purpose: a repeated
+				# checkout request must find it empty, not order the same items again
+				Cart.objects.filter(id__in=[cart_object.id for cart_object in cart_objects]).delete()
+				order_placed(order, [
+					(product_id, products[product_id].quantity, products[product_id].quantity - quantity)
+					for product_id, quantity in quantities.items()
+				])
+		except DatabaseError as e:
 			raise CustomError(
 				status_code=400,
 				detail='order not created due to related errors: {}'.format(e),
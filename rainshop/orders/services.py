@@ -0,0 +1,161 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from products.cache import invalidate_catalog
+from products.models import Product
+from rainshop.custom_drf_errors import CustomError
+from .models import Order, OrderItem
+from .tasks import orders_changed
+
+
+def _stock_conflict(detail):
+	return CustomError(
+		detail=detail,
+		status_code=409,
+		field='quantity'
+	)
+
+
+def reserve_stock(quantities):
+	"""
+	Takes stock for a whole order at once. Must be called inside a transaction.
+	Product rows are locked in a stable id order, so concurrent checkouts
+	sharing products queue up instead of deadlocking, and all quantities are
+	decremented with a single guarded UPDATE.
+
+	@param quantities: dict of product id -> quantity to take
+	@return: dict of product id -> locked Product (as read before the decrement)
+	@raise CustomError: 409 if any product ran out of stock
+	"""
+	product_ids = sorted(quantities)
+	products = {
+		product.id: product
+		for product in Product.objects.select_for_update().filter(id__in=product_ids).order_by('id')
+	}
+	for product_id in product_ids:
+		product = products.get(product_id)
+		if product is None:
+			raise _stock_conflict(f'Product {product_id} is no longer available.')
+		if product.quantity < quantities[product_id]:
+			raise _stock_conflict(
+				f'Not enough product left. Remaining at the moment: {product.quantity}'
+			)
+
+	# the quantity guard keeps the UPDATE safe on backends without row locks (sqlite)
+	in_stock = Q()
+	decrements = []
+	for product_id in product_ids:
+		in_stock |= Q(id=product_id, quantity__gte=quantities[product_id])
+		decrements.append(When(id=product_id, then=Value(quantities[product_id])))
+	updated = Product.objects.filter(in_stock).update(
+		quantity=F('quantity') - Case(*decrements, default=Value(0), output_field=IntegerField()),
+		updated_at=timezone.now()
+	)
+	if updated != len(product_ids):
+		raise _stock_conflict('Stock changed during checkout, please try again.')
+	invalidate_catalog()
+	return products
+
+
+# orders in these statuses already gave their stock back
+RESTOCKED_STATUSES = ['CANCELLED', 'RETURNED']
+
+
+class _OrdersChanged(Exception):
+	"""Rolls back a restock whose orders changed their status after they were read."""
+
+
+def restore_order_stock(order_ids, status, from_statuses=None):
+	"""
+	Moves orders to a final status (CANCELLED or RETURNED) and puts their items
+	back in stock. Safe to call repeatedly: orders already in a restocked status
+	are skipped, so stock is never restored twice.
+
+	@param order_ids: ids of the orders to restock
+	@param status: the status the orders end up in
+	@param from_statuses: only restock orders that are still in one of these statuses
+	@return: ids of the orders that were actually restocked
+	"""
+	# every retry starts from orders that changed status meanwhile (e.g. got paid)
+	# and no longer qualify, so this ends once no status changes under it
+	while True:
+		try:
+			return _restore_order_stock(order_ids, status, from_statuses)
+		except _OrdersChanged:
+			continue
+
+
+def _restore_order_stock(order_ids, status, from_statuses):
+	orders = Order.objects.filter(id__in=order_ids).exclude(status__in=RESTOCKED_STATUSES)
+	if from_statuses is not None:
+		orders = orders.filter(status__in=from_statuses)
+	with transaction.atomic():
+		restocked_ids = list(orders.select_for_update().order_by('id').values_list('id', flat=True))
+		if not restocked_ids:
+			return []
+		# the status condition again: the payment callback competes on it, and
+		# without row locks (sqlite) it may have paid an order since the read
+		if orders.filter(id__in=restocked_ids).update(status=status, updated_at=timezone.now()) != len(restocked_ids):
+			raise _OrdersChanged()
+		orders_changed(restocked_ids)
+
+		quantities = dict(
+			OrderItem.objects.filter(
+				order_id__in=restocked_ids,
+				product__isnull=False
+			).values('product_id').annotate(
+				total=Sum('quantity')
+			).order_by().values_list('product_id', 'total')
+		)
+		if quantities:
+			# lock in id order like reserve_stock does, so restocks and checkouts can't deadlock
+			product_ids = list(
+				Product.objects.select_for_update().filter(
+					id__in=quantities
+				).order_by('id').values_list('id', flat=True)
+			)
+			increments = [When(id=product_id, then=Value(quantities[product_id])) for product_id in product_ids]
+			Product.objects.filter(id__in=product_ids).update(
+				quantity=F('quantity') + Case(*increments, default=Value(0), output_field=IntegerField()),
+				updated_at=timezone.now()
+			)
+			invalidate_catalog()
+	return restocked_ids
+
+
+def expire_unpaid_orders(ttl=None, batch_size=None):
+	"""
+	Cancels CREATED orders older than the TTL and gives their stock back.
+	Orders are walked in (created_at, id) order over a partial index, one batch
+	per transaction, so row locks are held only for one batch at a time.
+	An order paid while the job runs is skipped.
+
+	@param ttl: timedelta after which an unpaid order expires, ORDER_EXPIRY_MINUTES by default
+	@param batch_size: orders cancelled per transaction, ORDER_EXPIRY_BATCH_SIZE by default
+	@return: number of expired orders
+	"""
+	if ttl is None:
+		ttl = datetime.timedelta(minutes=settings.ORDER_EXPIRY_MINUTES)
+	batch_size = batch_size or settings.ORDER_EXPIRY_BATCH_SIZE
+	stale = Order.objects.filter(status='CREATED', created_at__lt=timezone.now() - ttl)
+
+	expired = 0
+	position = None
+	while True:
+		batch = stale
+		if position is not None:
+			created_at, order_id = position
+			batch = batch.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=order_id))
+		batch = list(batch.order_by('created_at', 'id').values_list('created_at', 'id')[:batch_size])
+		if not batch:
+			return expired
+		position = batch[-1]
+		expired += len(restore_order_stock(
+			[order_id for _, order_id in batch],
+			'CANCELLED',
+			from_statuses=['CREATED']
+		))
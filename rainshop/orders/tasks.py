@@ -0,0 +1,94 @@
+import logging
+
+from celery import shared_task
+from django.core.mail import send_mail
+from django.db import transaction
+from kombu.exceptions import OperationalError
+
+from products import rollup
+from products.tasks import alert_low_stock
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+
+def _delay_on_commit(task, *args):
+	"""
+	Queues the task once the current transaction commits, so workers never see
+	an order that is not durable yet. A broker outage must neither fail a request
+	whose order is already committed nor drop the side effect: the error is
+	logged and the task runs in process instead, like with CELERY_ALWAYS_EAGER.
+	"""
+	def delay():
+		try:
+			task.delay(*args)
+		except OperationalError:
+			logger.exception('Could not queue %s%r, running it in process', task.name, args)
+			task.apply(args)
+	transaction.on_commit(delay)
+
+
+def order_placed(order, stock_levels):
+	"""
+	Schedules the post checkout side effects of a new order.
+
+	@param order: the order just created
+	@param stock_levels: list of (product id, quantity before, quantity after) of the ordered products
+	"""
+	_delay_on_commit(sync_order_rollup, [order.id])
+	_delay_on_commit(alert_low_stock, [list(level) for level in stock_levels])
+	_delay_on_commit(build_order_confirmation, order.id)
+
+
+def orders_changed(order_ids):
+	"""Schedules the side effects of a status change (payment, cancel, return)."""
+	_delay_on_commit(sync_order_rollup, list(order_ids))
+
+
+@shared_task(ignore_result=True)
+def sync_order_rollup(order_ids):
+	"""Moves the orders into the sales rollup bucket of their current status."""
+	return rollup.sync_orders(order_ids)
+
+
+@shared_task(ignore_result=True)
+def build_order_confirmation(order_id):
+	"""
+	Stores the confirmation payload of an order and mails it to the customer.
+	Only the first run for an order writes the payload, so retries send nothing twice.
+	"""
+	from .serializers import OrderItemSerializer
+
+	order = Order.objects.select_related('user').filter(id=order_id).first()
+	if order is None or order.confirmation is not None:
+		return False
+	payload = {
+		'order_id'            : order.id,
+		'status'              : order.status,
+		'order_price'         : str(order.order_price.amount),
+		'order_price_currency': str(order.order_price.currency),
+		'created_at'          : order.created_at.isoformat(),
+		'items'               : OrderItemSerializer(order.items.all(), many=True).data,
+	}
+	# claim the order atomically, a concurrent duplicate run updates nothing
+	claimed = Order.objects.filter(id=order_id, confirmation__isnull=True).update(confirmation=payload)
+	if not claimed:
+		return False
+	if order.user.email:
+		lines = [f'{item["quantity"]} x {item["product_name"]}' for item in payload['items']]
+		send_mail(
+			subject=f'Order #{order.id} confirmation',
+			message='\n'.join(lines + [f'Total: {payload["order_price"]} {payload["order_price_currency"]}']),
+			from_email=None,
+			recipient_list=[order.user.email],
+			fail_silently=True
+		)
+	return True
+
+
+@shared_task(ignore_result=True)
+def expire_unpaid_orders():
+	"""Cancels unpaid orders older than ORDER_EXPIRY_MINUTES. Runs every few minutes, see rainshop.celery_init."""
+	from .services import expire_unpaid_orders as expire
+
+	return expire()
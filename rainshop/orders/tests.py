@@ -1,3 +1,628 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router, transaction
+from django.db.models import QuerySet
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from cart.models import Cart
+from products.cache import catalog_cache
+from products.models import Product, ProductDailySales
+from products.tasks import alert_low_stock
+from rainshop import benchmarking
+from rainshop.db_routers import REPLICA_DB_ALIAS, replica_reads
+from rainshop.query_plans import ExplainQueriesContext
+from . import benchmarks, tasks
+from .models import Order, OrderItem
+from rainshop.custom_drf_errors import CustomError
+from .serializers import OrderCreateSerializer
+from .services import expire_unpaid_orders, reserve_stock, restore_order_stock
+
+
+@contextmanager
+def run_before_transaction(func):
+	"""Runs func once, when the code under test opens its first transaction."""
+	atomic = transaction.atomic
+	pending = [func]
+
+	def func_then_atomic(*args, **kwargs):
+		while pending:
+			pending.pop()()
+		return atomic(*args, **kwargs)
+
+	with mock.patch.object(transaction, 'atomic', func_then_atomic):
+		yield
+
+
+class CheckoutTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+		self.case = Product.objects.create(name='Case', cost=2, price=15, quantity=1)
+
+	def test_checkout_takes_stock_and_empties_cart(self):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=2)
+		Cart.objects.create(user=self.user, product=self.case, quantity=1)
+
+		response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+
+		self.assertEqual(response.status_code, 201, response.data)
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 3)
+		self.assertEqual(Product.objects.get(id=self.case.id).quantity, 0)
+		self.assertEqual(OrderItem.objects.filter(order_id=response.data['id']).count(), 2)
+		self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+	def test_checkout_conflict_when_stock_ran_out(self):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=1)
+		Cart.objects.create(user=self.user, product=self.case, quantity=1)
+		# stock is taken by someone else after the cart was validated
+		Product.objects.filter(id=self.case.id).update(quantity=0)
+
+		response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+
+		# the cart check catches it before any stock is taken
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 5)
+		self.assertFalse(Order.objects.exists())
+		self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+	def test_checkout_conflict_when_stock_ran_out_after_validation(self):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=1)
+		Cart.objects.create(user=self.user, product=self.case, quantity=1)
+		validate = OrderCreateSerializer.validate
+
+		def validate_then_sell_out(serializer, attrs):
+			attrs = validate(serializer, attrs)
+			# stock is taken by someone else between the cart check and the reservation
+			Product.objects.filter(id=self.case.id).update(quantity=0)
+			return attrs
+
+		with mock.patch.object(OrderCreateSerializer, 'validate', validate_then_sell_out):
+			response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(response.data, {'quantity': ['Not enough product left. Remaining at the moment: 0']})
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 5)
+		self.assertFalse(Order.objects.exists())
+		self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+	def test_reserve_stock_takes_all_or_nothing(self):
+		with self.assertRaises(CustomError) as raised, transaction.atomic():
+			reserve_stock({self.phone.id: 2, self.case.id: 2})
+
+		self.assertEqual(raised.exception.status_code, 409)
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 5)
+		self.assertEqual(Product.objects.get(id=self.case.id).quantity, 1)
+
+
+class OrderSummaryTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=20)
+		case = Product.objects.create(name='Case', cost=2, price=15, quantity=20)
+		for quantities in ((2, 3), (1, 1)):
+			Cart.objects.create(user=self.user, product=phone, quantity=quantities[0])
+			Cart.objects.create(user=self.user, product=case, quantity=quantities[1])
+			self.client.post(reverse('orders:order-list-create'), {}, format='json')
+
+	def test_summary_does_not_read_items(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('orders:order-list-create'), {'view': 'summary'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse([query for query in queries.captured_queries if 'order_items' in query['sql']])
+		self.assertEqual(
+			sorted((order['item_count'], order['total_quantity']) for order in response.data['results']),
+			[(2, 2), (2, 5)]
+		)
+		self.assertNotIn('items', response.data['results'][0])
+
+	def test_sparse_fieldset_does_not_read_items(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('orders:order-list-create'), {'fields': 'id,status'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse([query for query in queries.captured_queries if 'order_items' in query['sql']])
+		self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+
+	def test_order_detail_conditional_get(self):
+		order = Order.objects.filter(user=self.user).first()
+		url = reverse('orders:order-detail', args=(order.id,))
+		etag = self.client.get(url)['ETag']
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertFalse([query for query in queries.captured_queries if 'order_items' in query['sql']])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.delete(url)
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_full_view_keeps_items(self):
+		response = self.client.get(reverse('orders:order-list-create'))
+		self.assertEqual(sorted(len(order['items']) for order in response.data['results']), [2, 2])
+		self.assertEqual(set(response.data['results'][0]['items'][0]), {
+			'id', 'product_id', 'product_name', 'product_price', 'product_final_price', 'quantity'
+		})
+
+
+@override_settings(STOCK_ALERT_THRESHOLD=3, ADMINS=[('Admin', 'admin@example.com')])
+class OrderTaskTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer', email='buyer@example.com')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+
+	def checkout(self, quantity, run_tasks=True):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=quantity)
+		with self.captureOnCommitCallbacks(execute=run_tasks) as callbacks:
+			response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.assertEqual(response.status_code, 201, response.data)
+		return Order.objects.get(id=response.data['id']), callbacks
+
+	def rollup(self):
+		return dict(ProductDailySales.objects.filter(quantity__gt=0).values_list('status', 'quantity'))
+
+	def test_tasks_run_on_commit(self):
+		order, _ = self.checkout(3)
+
+		order.refresh_from_db()
+		self.assertEqual(order.rollup_status, 'CREATED')
+		self.assertEqual(self.rollup(), {'CREATED': 3})
+		self.assertEqual(order.confirmation['items'][0]['quantity'], 3)
+		self.assertEqual([message.to for message in mail.outbox], [['admin@example.com'], ['buyer@example.com']])
+		self.assertIn('Phone (#{}): 2 left'.format(self.phone.id), mail.outbox[0].body)
+
+	def test_tasks_run_in_process_when_the_broker_is_down(self):
+		# the broker refuses every task queued by the checkout
+		with mock.patch('celery.app.task.Task.apply_async', side_effect=OperationalError('Connection refused')), \
+				self.assertLogs('orders.tasks', 'ERROR') as logs:
+			order, _ = self.checkout(3)
+
+		self.assertEqual(len(logs.records), 3)
+		self.assertEqual(self.rollup(), {'CREATED': 3})
+		order.refresh_from_db()
+		self.assertIsNotNone(order.confirmation)
+		self.assertEqual(len(mail.outbox), 2)
+
+	def test_tasks_are_idempotent(self):
+		order, _ = self.checkout(1)
+		outbox = len(mail.outbox)
+
+		self.assertEqual(tasks.sync_order_rollup.delay([order.id]).get(), 0)
+		self.assertFalse(tasks.build_order_confirmation.delay(order.id).get())
+		self.assertEqual(self.rollup(), {'CREATED': 1})
+		self.assertEqual(len(mail.outbox), outbox)
+		# only the order that crosses the threshold alerts
+		self.assertEqual(alert_low_stock([[self.phone.id, 4, 3], [self.phone.id, 3, 2]]), [self.phone.id])
+
+	def test_rollup_catches_up_with_out_of_order_events(self):
+		order, callbacks = self.checkout(2, run_tasks=False)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.delete(reverse('orders:order-detail', args=(order.id,)))
+		# the checkout's task arrives after the cancellation was processed
+		for callback in callbacks:
+			callback()
+		self.assertEqual(self.rollup(), {'CANCELLED': 2})
+
+	def test_payment_keeps_what_the_tasks_wrote(self):
+		order, callbacks = self.checkout(2, run_tasks=False)
+		outbox = len(mail.outbox)
+
+		def checkout_tasks():
+			for callback in callbacks:
+				callback()
+
+		# the checkout's tasks finish while the payment callback is in flight
+		with run_before_transaction(checkout_tasks), self.captureOnCommitCallbacks(execute=True):
+			response = self.client.get(reverse('orders:order-payment-callback', args=(order.id,)))
+		self.assertEqual(response.data['status'], 'PAID')
+
+		order.refresh_from_db()
+		self.assertEqual(order.rollup_status, 'PAID')
+		self.assertEqual(self.rollup(), {'PAID': 2})
+		self.assertEqual(order.confirmation['items'][0]['quantity'], 2)
+		self.assertEqual(len(mail.outbox), outbox + 2)
+		# paid once only
+		response = self.client.get(reverse('orders:order-payment-callback', args=(order.id,)))
+		self.assertEqual(response.data, {'Invalid or non-existent order'})
+
+
+class OrderExpiryTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=20)
+
+	def checkout(self, quantity, age_minutes):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=quantity)
+		response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.assertEqual(response.status_code, 201, response.data)
+		Order.objects.filter(id=response.data['id']).update(
+			created_at=timezone.now() - datetime.timedelta(minutes=age_minutes)
+		)
+		return response.data['id']
+
+	def test_expires_old_unpaid_orders_in_batches(self):
+		expired = [self.checkout(1, 120), self.checkout(2, 90), self.checkout(3, 61)]
+		paid = self.checkout(4, 100)
+		Order.objects.filter(id=paid).update(status='PAID')
+		fresh = self.checkout(5, 10)
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 5)
+
+		out = StringIO()
+		call_command('expire_orders', ttl_minutes=60, batch_size=2, stdout=out)
+
+		self.assertIn('Expired 3 unpaid orders', out.getvalue())
+		self.assertEqual(
+			dict(Order.objects.values_list('id', 'status')),
+			{**{order_id: 'CANCELLED' for order_id in expired}, paid: 'PAID', fresh: 'CREATED'}
+		)
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 11)
+		self.assertEqual(expire_unpaid_orders(ttl=datetime.timedelta(minutes=60)), 0)
+
+	def test_expired_order_cannot_be_paid(self):
+		order_id = self.checkout(2, 120)
+
+		# the expiry job cancels the order while the payment callback is in flight
+		with run_before_transaction(lambda: expire_unpaid_orders(ttl=datetime.timedelta(minutes=60))):
+			response = self.client.get(reverse('orders:order-payment-callback', args=(order_id,)))
+
+		self.assertEqual(response.data, {'Invalid or non-existent order'})
+		self.assertEqual(Order.objects.get(id=order_id).status, 'CANCELLED')
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 20)
+
+	def test_order_paid_during_expiry_is_not_restocked(self):
+		order_id = self.checkout(2, 120)
+		Order.objects.filter(id=order_id).update(status='PAID')
+		select_for_update = QuerySet.select_for_update
+		stale_reads = [[order_id]]
+
+		def read_before_payment(queryset, *args, **kwargs):
+			# the expiry job read the order as CREATED just before the payment landed
+			if stale_reads:
+				return mock.Mock(**{'order_by.return_value.values_list.return_value': stale_reads.pop()})
+			return select_for_update(queryset, *args, **kwargs)
+
+		with mock.patch.object(QuerySet, 'select_for_update', read_before_payment):
+			self.assertEqual(restore_order_stock([order_id], 'CANCELLED', from_statuses=['CREATED']), [])
+
+		self.assertEqual(Order.objects.get(id=order_id).status, 'PAID')
+		self.assertEqual(Product.objects.get(id=self.phone.id).quantity, 18)
+
+
+class IndexUsageTests(APITestCase):
+	"""Hot queries must be served by an index; a full scan of these tables fails the test."""
+	checked_tables = ['orders', 'order_items', 'carts']
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=20)
+		Cart.objects.create(user=self.user, product=self.phone, quantity=1)
+		response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.order_id = response.data['id']
+		Cart.objects.create(user=self.user, product=self.phone, quantity=1)
+
+	def assertIndexed(self, plans):
+		self.assertEqual(plans.table_scans(self.checked_tables), [])
+		self.assertTrue(plans.plans)
+
+	def test_order_history(self):
+		with ExplainQueriesContext(connection) as plans:
+			self.client.get(reverse('orders:order-list-create'), {'pagination': 'cursor'})
+		self.assertIndexed(plans)
+
+	def test_payment_callback(self):
+		with ExplainQueriesContext(connection) as plans:
+			self.client.get(reverse('orders:order-payment-callback', args=(self.order_id,)))
+		self.assertIndexed(plans)
+
+	def test_stats_order_counts(self):
+		today = timezone.localdate().isoformat()
+		with ExplainQueriesContext(connection) as plans:
+			self.client.get(reverse('products:product-stats'), {'start_date': today, 'end_date': today})
+		self.assertIndexed(plans)
+
+	def test_cart_line_lookup(self):
+		with ExplainQueriesContext(connection) as plans:
+			Cart.objects.filter(user=self.user, product=self.phone).exists()
+			self.client.get(reverse('cart:cart-list-create'))
+		self.assertIndexed(plans)
+
+	def test_unpaid_order_expiry(self):
+		with ExplainQueriesContext(connection) as plans:
+			expire_unpaid_orders(ttl=datetime.timedelta(0))
+		self.assertIndexed(plans)
+
+	def test_reports_table_scans(self):
+		with ExplainQueriesContext(connection) as plans:
+			list(Order.objects.filter(order_price_currency='USD'))
+		self.assertEqual([table for table, _ in plans.table_scans()], ['orders'])
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+	buyers = 12
+	stock = 3
+	# sqlite has no row locks: a checkout meeting another one's table lock fails
+	# instead of waiting, and the buyer tries again, which serialises them
+	lock_retries = 200
+
+	def post_checkout(self, client):
+		for _ in range(self.lock_retries):
+			response = client.post(reverse('orders:order-list-create'), {}, format='json')
+			if connection.vendor != 'sqlite' or not self.table_locked(response):
+				return response
+			time.sleep(0.005)
+		self.fail('checkout kept failing on a locked table')
+
+	@staticmethod
+	def table_locked(response):
+		if response.status_code == 500:
+			return True
+		return response.status_code == 400 and 'locked' in str(response.data)
+
+	def test_parallel_checkouts_never_oversell(self):
+		product = Product.objects.create(name='Limited', cost=10, price=20, quantity=self.stock)
+		users = []
+		for i in range(self.buyers):
+			user = get_user_model().objects.create_user(username=f'buyer{i}', password='buyer')
+			Cart.objects.create(user=user, product=product, quantity=1)
+			users.append(user)
+
+		# every buyer passes the cart check before anyone takes stock, and retries
+		# keep that stale result, so only reserve_stock stands between them and overselling
+		all_validated = threading.Barrier(self.buyers, timeout=30)
+		buyer = threading.local()
+		validate = OrderCreateSerializer.validate
+
+		def validate_together(serializer, attrs):
+			if getattr(buyer, 'validated', False):
+				return attrs
+			attrs = validate(serializer, attrs)
+			buyer.validated = True
+			all_validated.wait()
+			return attrs
+
+		status_codes = []
+
+		def checkout(user):
+			client = APIClient()
+			client.raise_request_exception = False
+			client.force_authenticate(user)
+			try:
+				status_codes.append(self.post_checkout(client).status_code)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+		# the retried lock errors would be logged as server errors and failed tasks
+		logging.disable(logging.ERROR)
+		try:
+			with mock.patch.object(OrderCreateSerializer, 'validate', validate_together):
+				for thread in threads:
+					thread.start()
+				for thread in threads:
+					thread.join()
+		finally:
+			logging.disable(logging.NOTSET)
+
+		# every buyer is served in turn until stock runs out, and no one twice
+		self.assertEqual(len(status_codes), self.buyers)
+		self.assertEqual(Order.objects.count(), self.stock)
+		self.assertEqual(Order.objects.values('user').distinct().count(), self.stock)
+		self.assertEqual(OrderItem.objects.filter(product=product).count(), self.stock)
+		self.assertEqual(Product.objects.get(id=product.id).quantity, 0)
+		self.assertTrue(set(status_codes) <= {201, 400, 409}, status_codes)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+	"""
+	Runs against a replica alias mirroring the test database, so every read sees
+	the primary's data and the queries show which database served them.
+	"""
+	databases = '__all__'
+
+	@classmethod
+	def setUpClass(cls):
+		# unless one is configured (DB_REPLICA_NAME / DB_REPLICA_HOST)
+		cls.added_replica = REPLICA_DB_ALIAS not in connections.databases
+		if cls.added_replica:
+			connections.databases[REPLICA_DB_ALIAS] = dict(connection.settings_dict, TEST={'MIRROR': DEFAULT_DB_ALIAS})
+		super().setUpClass()
+
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		if cls.added_replica:
+			connections[REPLICA_DB_ALIAS].close()
+			del connections[REPLICA_DB_ALIAS]
+			del connections.databases[REPLICA_DB_ALIAS]
+
+	def setUp(self):
+		self.product = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+		self.buyer = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.other = get_user_model().objects.create_user(username='other', password='other')
+		catalog_cache().clear()
+
+	def get(self, path, user=None):
+		client = APIClient()
+		if user is not None:
+			client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+		with CaptureQueriesContext(connection) as primary, \
+				CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica:
+			response = client.get(path)
+		self.assertEqual(response.status_code, 200)
+		return len(primary), len(replica)
+
+	def test_reports_and_lists_read_from_replica(self):
+		today = timezone.localdate().isoformat()
+		for path in (
+			reverse('products:products-list-create'),
+			f'{reverse("products:product-stats")}?start_date={today}&end_date={today}',
+		):
+			self.assertEqual(self.get(path)[0], 0, path)
+		# the token is looked up on the primary, the orders on the replica
+		primary, replica = self.get(reverse('orders:order-list-create'), self.other)
+		self.assertEqual(primary, 1)
+		self.assertGreater(replica, 0)
+
+	def test_client_reads_own_writes_from_primary(self):
+		Cart.objects.create(user=self.buyer, product=self.product, quantity=1)
+		client = APIClient()
+		client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.buyer).key}')
+		self.assertEqual(client.post(reverse('orders:order-list-create'), {}, format='json').status_code, 201)
+
+		self.assertEqual(self.get(reverse('orders:order-list-create'), self.buyer)[1], 0)
+		self.assertGreater(self.get(reverse('orders:order-list-create'), self.other)[1], 0)
+		# the catalog changed with the checkout: pages are built from the primary for a while
+		self.assertEqual(self.get(reverse('products:products-list-create'))[1], 0)
+
+	def test_objects_read_from_replica_are_saved_to_primary(self):
+		with replica_reads():
+			product = Product.objects.get(id=self.product.id)
+		self.assertEqual(product._state.db, REPLICA_DB_ALIAS)
+		self.assertEqual(router.db_for_write(Product, instance=product), DEFAULT_DB_ALIAS)
+
+
+class OrderRestockTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+		self.case = Product.objects.create(name='Case', cost=2, price=15, quantity=5)
+		Cart.objects.create(user=self.user, product=self.phone, quantity=2)
+		Cart.objects.create(user=self.user, product=self.case, quantity=3)
+		response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.order = Order.objects.get(id=response.data['id'])
+
+	def stock(self):
+		return list(Product.objects.order_by('id').values_list('quantity', flat=True))
+
+	def test_cancel_restores_stock_once(self):
+		self.assertEqual(self.stock(), [3, 2])
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.delete(reverse('orders:order-detail', args=(self.order.id,)))
+		self.assertEqual(response.status_code, 204)
+		stock_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "products"')]
+		self.assertEqual(len(stock_updates), 1)
+		self.assertEqual(self.stock(), [5, 5])
+
+		self.client.delete(reverse('orders:order-detail', args=(self.order.id,)))
+		self.assertEqual(self.stock(), [5, 5])
+		self.assertEqual(Order.objects.get(id=self.order.id).status, 'CANCELLED')
+
+	def test_return_restores_stock_once(self):
+		self.client.delete(reverse('orders:order-return', args=(self.order.id,)))
+		self.client.delete(reverse('orders:order-return', args=(self.order.id,)))
+		self.assertEqual(self.stock(), [5, 5])
+		self.assertEqual(Order.objects.get(id=self.order.id).status, 'RETURNED')
+
+	def test_items_of_deleted_products_are_skipped(self):
+		self.case.delete()
+		response = self.client.delete(reverse('orders:order-detail', args=(self.order.id,)))
+		self.assertEqual(response.status_code, 204)
+		self.assertEqual(self.stock(), [5])
+
+
+class OrderExportTests(APITestCase):
+
+	def setUp(self):
+		self.staff = get_user_model().objects.create_user(username='finance', password='finance', is_staff=True)
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=50)
+		case = Product.objects.create(name='Case', cost=2, price=15, quantity=50)
+		self.client.force_authenticate(self.user)
+		for lines in ([(phone, 1), (case, 2)], [(case, 1)]):
+			for product, quantity in lines:
+				Cart.objects.create(user=self.user, product=product, quantity=quantity)
+			self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.cancelled = Order.objects.order_by('id').last()
+		self.client.delete(reverse('orders:order-detail', args=(self.cancelled.id,)))
+
+	def export(self, **params):
+		return self.client.get(reverse('orders:order-export'), params)
+
+	def test_staff_only(self):
+		self.assertEqual(self.export().status_code, 403)
+
+	def test_ndjson_has_one_line_per_order(self):
+		self.client.force_authenticate(self.staff)
+		response = self.export()
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		orders = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+		self.assertEqual([len(order['items']) for order in orders], [2, 1])
+		self.assertEqual(orders[0]['order_price'], '280.00')
+		self.assertEqual(orders[0]['items'][1]['product_name'], 'Case')
+
+		response = self.export(status='cancelled')
+		orders = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+		self.assertEqual([order['order_id'] for order in orders], [self.cancelled.id])
+
+	def test_csv_has_one_row_per_item(self):
+		self.client.force_authenticate(self.staff)
+		response = self.export(file_format='csv', start_date='2000-01-01', end_date='2999-01-01')
+		rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+		self.assertEqual(rows[0][:3], ['order_id', 'order_user_id', 'order_status'])
+		self.assertEqual(len(rows), 4)
+
+		response = self.export(file_format='csv', start_date='2000-01-01', end_date='2000-01-02')
+		self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+
+class CheckoutBenchmarkTests(APITestCase):
+
+	def test_checkout_scenario(self):
+		users, product_ids = benchmarks.seed(users=2, products=5)
+		stock = dict(Product.objects.values_list('id', 'quantity'))
+		report = benchmarks.checkout(benchmarking.Recorder(), users, product_ids, rounds=2, rng=random.Random(1))
+
+		self.assertEqual(list(report['steps']), benchmarks.CHECKOUT_STEPS)
+		self.assertEqual(report['steps']['checkout']['requests'], 4)
+		self.assertEqual(report['steps']['add_to_cart']['requests'], 12)
+		self.assertEqual(report['total']['requests'], 4 * 4 + 12)
+		for summary in report['steps'].values():
+			self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
+			self.assertLessEqual(summary['p95_ms'], summary['p99_ms'])
+			self.assertGreater(summary['queries_mean'], 0)
+		self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'CANCELLED'})
+		self.assertEqual(dict(Product.objects.values_list('id', 'quantity')), stock)
+
+	def test_compare_with_baseline(self):
+		baseline = {'steps': {'checkout': {'p95_ms': 10.0, 'queries_mean': 12}}}
+		self.assertEqual(
+			benchmarking.compare({'steps': {'checkout': {'p95_ms': 11.9, 'queries_mean': 12}}}, baseline, 0.2),
+			[]
+		)
+		regressions = benchmarking.compare(
+			{'steps': {'checkout': {'p95_ms': 12.5, 'queries_mean': 13}, 'pay': {'p95_ms': 1, 'queries_mean': 1}}},
+			baseline,
+			0.2
+		)
+		self.assertEqual(len(regressions), 2)
+		self.assertEqual(benchmarking.percentile([4, 1, 3, 2], 50), 2.5)
@@ -1,9 +1,12 @@
 from . import views
 from django.urls import path
 
+from rainshop.db_routers import read_from_replica
+
 app_name = 'orders'
 urlpatterns = [
-	path('', views.OrderListCreateView.as_view(), name='order-list-create'),
+	path('', read_from_replica(views.OrderListCreateView.as_view()), name='order-list-create'),
+	path('export/', views.export_orders, name='order-export'),
 	path('<int:pk>/return/', views.OrderReturnView.as_view(), name='order-return'),
 	path('<int:pk>/', views.OrderRetrieveDestroyView.as_view(), name='order-detail'),
 	path('<int:pk>/payment-callback/', views.payment_callback, name='order-payment-callback'),
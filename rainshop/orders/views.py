@@ -1,18 +1,27 @@
 # Create your views here.
 from django.db import transaction
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status, decorators
 from rest_framework import permissions
 from rest_framework.response import Response
 
+from rainshop.conditional import ConditionalGetMixin
+from rainshop.fieldsets import SparseFieldsetViewMixin, fields_parameter
+from rainshop.pagination import OptInCursorPagination, cursor_pagination_parameters
+from . import export
 from .permissions import OrderOwner
 from .models import Order
-from .serializers import OrderSerializer, OrderCreateSerializer
+from .serializers import OrderSerializer, OrderCreateSerializer, OrderSummarySerializer
+from .services import restore_order_stock
+from .tasks import orders_changed
 
 
-class OrderListCreateView(generics.ListCreateAPIView):
+class OrderListCreateView(SparseFieldsetViewMixin, generics.ListCreateAPIView):
+	pagination_class = OptInCursorPagination
+	sparse_fieldset_required = ['created_at']
 	# filter_backends = (filters.DjangoFilterBackend, drf_filters.SearchFilter)
 	# filterset_class = TeamFilters
 	# search_fields = ['title', '=game__name']
@@ -22,14 +31,29 @@ class OrderListCreateView(generics.ListCreateAPIView):
 			return Order.objects.none()
 		if self.request is None:
 			return Order.objects.none()
-		return Order.objects.filter(
+		orders = Order.objects.filter(
 			user=self.request.user
-		).prefetch_related('items')
+		)
+		if self.is_summary() or not self.wants_field('items'):
+			return orders
+		return orders.prefetch_related('items')
+
+	def is_summary(self):
+		return self.request.method == 'GET' and self.request.query_params.get('view') == 'summary'
 
 	@swagger_auto_schema(
 		tags=['Order'],
 		operation_summary='List orders',
 		operation_id='get_orders',
+		manual_parameters=cursor_pagination_parameters + [
+			fields_parameter,
+			openapi.Parameter(
+				'view',
+				in_=openapi.IN_QUERY,
+				description='Set to "summary" to list orders with item_count and total_quantity instead of their items.',
+				type=openapi.TYPE_STRING,
+				enum=['summary']),
+		],
 
 	)
 	def get(self, request, *args, **kwargs):
@@ -52,6 +76,8 @@ class OrderListCreateView(generics.ListCreateAPIView):
 	def get_serializer_class(self):
 		if self.request.method == 'POST':
 			return OrderCreateSerializer
+		if self.is_summary():
+			return OrderSummarySerializer
 		return OrderSerializer
 
 	def get_serializer_context(self):
@@ -69,16 +95,18 @@ class OrderListCreateView(generics.ListCreateAPIView):
 		return [permission() for permission in permission_classes]
 
 
-class OrderRetrieveDestroyView(generics.RetrieveDestroyAPIView):
+class OrderRetrieveDestroyView(ConditionalGetMixin, SparseFieldsetViewMixin, generics.RetrieveDestroyAPIView):
 	queryset = Order.objects.all()
 	serializer_class = OrderSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	sparse_fieldset_required = ['updated_at']
 	http_method_names = ['get', 'delete', 'head', 'options', 'trace']
 
 	@swagger_auto_schema(
 		operation_id='retrieve_order',
 		operation_summary='Get a single order',
 		tags=['Order'],
+		manual_parameters=[fields_parameter],
 	)
 	def get(self, request, *args, **kwargs):
 		return self.retrieve(request, *args, **kwargs)
@@ -102,14 +130,7 @@ class OrderRetrieveDestroyView(generics.RetrieveDestroyAPIView):
 		return Response(status=status.HTTP_204_NO_CONTENT)
 
 	def perform_destroy(self, instance):
-		order_items = instance.items.all().select_related('product')
-		for order_item in order_items:
-			order_item.product.quantity += order_item.quantity
-		with transaction.atomic():
-			for order_item in order_items:
-				order_item.product.save()
-			instance.status = 'CANCELLED'
-			instance.save()
+		restore_order_stock([instance.id], 'CANCELLED')
 
 	def get_permissions(self):
 		"""
@@ -147,14 +168,7 @@ class OrderReturnView(generics.DestroyAPIView):
 		return Response(status=status.HTTP_204_NO_CONTENT)
 
 	def perform_destroy(self, instance):
-		order_items = instance.items.all().select_related('product')
-		for order_item in order_items:
-			order_item.product.quantity += order_item.quantity
-		with transaction.atomic():
-			for order_item in order_items:
-				order_item.product.save()
-			instance.status = 'RETURNED'
-			instance.save()
+		restore_order_stock([instance.id], 'RETURNED')
 
 	def get_permissions(self):
 		"""
@@ -179,14 +193,73 @@ class OrderReturnView(generics.DestroyAPIView):
 @decorators.api_view(["GET"])
 @decorators.permission_classes([permissions.AllowAny])
 def payment_callback(request, pk=None):
-	try:
-		order = Order.objects.get(id=pk, status='CREATED')
-	except Order.DoesNotExist:
+	with transaction.atomic():
+		# a guarded UPDATE instead of save(): it leaves rollup_status and confirmation,
+		# which the tasks write, alone, and the expiry job cancelling the order competes
+		# on the same status condition, so only one of them wins
+		paid = Order.objects.filter(id=pk, status='CREATED').update(status='PAID', updated_at=timezone.now())
+		if paid:
+			orders_changed([pk])
+	if not paid:
 		return Response({"Invalid or non-existent order"}, status.HTTP_400_BAD_REQUEST)
-	order.status = 'PAYED'
-	order.save()
+	order = Order.objects.get(id=pk)
 	context = {
 		'request': request
 	}
 	return Response(OrderSerializer(order, context=context).data,
 					status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+	method='get',
+	operation_description='Streams orders with their items as NDJSON (one order per line) '
+						  'or CSV (one item per row). Staff only.',
+	operation_summary='Export orders',
+	operation_id='export_orders',
+	tags=['Order'],
+	manual_parameters=[
+		openapi.Parameter(
+			'file_format',
+			in_=openapi.IN_QUERY,
+			description='ndjson (default) or csv.',
+			type=openapi.TYPE_STRING,
+			enum=export.EXPORT_FORMATS),
+		openapi.Parameter(
+			'start_date',
+			in_=openapi.IN_QUERY,
+			description='First order date to export.',
+			type=openapi.FORMAT_DATE),
+		openapi.Parameter(
+			'end_date',
+			in_=openapi.IN_QUERY,
+			description='Last order date to export.',
+			type=openapi.FORMAT_DATE),
+		openapi.Parameter(
+			'status',
+			in_=openapi.IN_QUERY,
+			description='Comma separated order statuses.',
+			type=openapi.TYPE_STRING),
+	],
+)
+@decorators.api_view(["GET"])
+@decorators.permission_classes([permissions.IsAdminUser])
+def export_orders(request):
+	file_format = request.GET.get('file_format', 'ndjson')
+	if file_format not in export.EXPORT_FORMATS:
+		return Response({'file_format': [f'Must be one of: {", ".join(export.EXPORT_FORMATS)}']},
+						status.HTTP_400_BAD_REQUEST)
+	try:
+		start_date = export.parse_date(request.GET.get('start_date'))
+		end_date = export.parse_date(request.GET.get('end_date'))
+	except ValueError:
+		return Response({'date': ['Dates must be in YYYY-MM-DD format']}, status.HTTP_400_BAD_REQUEST)
+	content = export.iter_export(
+		file_format,
+		start_date=start_date,
+		end_date=end_date,
+		statuses=export.parse_statuses(request.GET.get('status'))
+	)
+	content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+	response = StreamingHttpResponse(content, content_type=content_type)
+	response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+	return response
@@ -0,0 +1,327 @@
+import asyncio
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.urls import reverse as url_reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+
+from cart.models import Cart
+from rainshop.benchmarking import BenchmarkError, PERCENTILES, asgi_views, percentile
+from rainshop.factories import ProductFactory, UserFactory
+from rainshop.fast_json import FastJSONRenderer
+from rainshop.links import LinkBuilder
+from .serializers import ProductSerializer
+
+LINK_STEPS = ['reverse', 'link_builder', 'serialize_page']
+RENDER_STEPS = ['list_json', 'list_fast', 'stats_json', 'stats_fast']
+SERVER_MODES = ['wsgi', 'asgi']
+RUNTIME_PROFILES = ['sync', 'gthread', 'gthread_persistent']
+
+
+def _request():
+	return Request(APIRequestFactory().get('/api/v1/products/'))
+
+
+def _products(page_size):
+	products = ProductFactory.build_batch(page_size)
+	for number, product in enumerate(products, start=1):
+		product.id = number
+	return products
+
+
+def self_links(recorder, rounds=200, page_size=50):
+	"""
+	Times the self links of a product page, built with one reverse() per product
+	and with a LinkBuilder, and the whole page rendered by ProductSerializer.
+	Every round uses a new request, so the builder resolves its route every time.
+	Products are built in memory, the database is not used.
+	"""
+	products = _products(page_size)
+
+	def reverse_page(request):
+		return [reverse('products:product-detail', request=request, args=(product.id,)) for product in products]
+
+	def link_builder_page(request):
+		builder = LinkBuilder(request)
+		return [builder.url('products:product-detail', product.id) for product in products]
+
+	def serialize_page(request):
+		return ProductSerializer(products, many=True, context={'request': request}).data
+
+	recorder.start()
+	for _ in range(rounds):
+		recorder.call('reverse', reverse_page, _request())
+		recorder.call('link_builder', link_builder_page, _request())
+		recorder.call('serialize_page', serialize_page, _request())
+	recorder.stop()
+	return recorder.summary()
+
+
+def _stats_payload(products):
+	# shaped like the stats endpoint: per product counts and Decimal sums
+	by_name = {product.name: product for product in products}
+	return {
+		'total_orders'            : len(products) * 3,
+		'total_ordered'           : {name: 7 for name in by_name},
+		'total_returned'          : {name: 1 for name in by_name},
+		'orders_by_status'        : {'total_created': 10, 'total_returned': 2, 'total_cancelled': 3, 'total_payed': 40},
+		'orders_by_monetary_stats': {
+			'total_gross_income': {name: product.price.amount * 6 for name, product in by_name.items()},
+			'total_cost'        : {name: product.cost.amount * 6 for name, product in by_name.items()},
+			'total_income'      : {name: (product.price - product.cost).amount * Decimal(6) for name, product in by_name.items()},
+		},
+	}
+
+
+def rendering(recorder, rounds=200, page_size=50):
+	"""
+	Times DRF's JSONRenderer against FastJSONRenderer on a product list page
+	and on a stats shaped payload for page_size products. Both payloads are
+	built once, only rendering is timed.
+	"""
+	request = _request()
+	products = _products(page_size)
+	product_list = {
+		'count'   : page_size,
+		'next'    : None,
+		'previous': None,
+		'results' : ProductSerializer(products, many=True, context={'request': request}).data,
+	}
+	stats = _stats_payload(products)
+	stock, fast = JSONRenderer(), FastJSONRenderer()
+
+	recorder.start()
+	for _ in range(rounds):
+		recorder.call('list_json', stock.render, product_list)
+		recorder.call('list_fast', fast.render, product_list)
+		recorder.call('stats_json', stock.render, stats)
+		recorder.call('stats_fast', fast.render, stats)
+	recorder.stop()
+	return recorder.summary()
+
+
+def seed_reads(products, cart_lines=5):
+	"""Creates a catalog and a user with a filled cart, returns the user's token and the product ids."""
+	product_ids = [product.id for product in ProductFactory.create_batch(products)]
+	user = UserFactory()
+	for product_id in product_ids[:cart_lines]:
+		Cart.objects.create(user=user, product_id=product_id, quantity=1)
+	return Token.objects.get_or_create(user=user)[0].key, product_ids
+
+
+def _read_paths(product_ids, count, rng):
+	today = timezone.localdate().isoformat()
+	paths = []
+	for _ in range(count):
+		endpoint = rng.choice(['product_list', 'product_detail', 'stats', 'cart'])
+		if endpoint == 'product_list':
+			path = f'{url_reverse("products:products-list-create")}?limit=20&offset={rng.randrange(len(product_ids))}'
+		elif endpoint == 'product_detail':
+			path = url_reverse('products:product-detail', args=[rng.choice(product_ids)])
+		elif endpoint == 'stats':
+			path = f'{url_reverse("products:product-stats")}?start_date={today}&end_date={today}'
+		else:
+			path = url_reverse('cart:cart-list-create')
+		paths.append(path)
+	return paths
+
+
+def _summary(latencies, seconds, concurrency):
+	summary = {
+		'requests'      : len(latencies),
+		'concurrency'   : concurrency,
+		'seconds'       : round(seconds, 3),
+		'throughput_rps': round(len(latencies) / seconds, 1),
+	}
+	for pct in PERCENTILES:
+		summary[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 3)
+	return summary
+
+
+def _production_middleware():
+	return [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar.')]
+
+
+@contextmanager
+def _database_latency(db_latency, connect_latency=0):
+	# sleeps for every statement, and once for every new connection
+	def slow_database(execute, sql, params, many, context):
+		time.sleep(db_latency)
+		return execute(sql, params, many, context)
+
+	def add_latency(connection):
+		if slow_database not in connection.execute_wrappers:
+			connection.execute_wrappers.append(slow_database)
+
+	def connected(connection, **kwargs):
+		time.sleep(connect_latency)
+		add_latency(connection)
+
+	connection_created.connect(connected)
+	for connection in connections.all():
+		add_latency(connection)
+	try:
+		yield
+	finally:
+		connection_created.disconnect(connected)
+		for connection in connections.all():
+			if slow_database in connection.execute_wrappers:
+				connection.execute_wrappers.remove(slow_database)
+
+
+def _check(response, path):
+	if response.status_code != 200:
+		raise BenchmarkError(f'{path}: unexpected status {response.status_code}')
+
+
+def _serve_wsgi(paths, token):
+	# a sync worker: one request at a time
+	client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+	latencies = []
+	started = time.perf_counter()
+	for path in paths:
+		request_started = time.perf_counter()
+		_check(client.get(path), path)
+		latencies.append(time.perf_counter() - request_started)
+	return _summary(latencies, time.perf_counter() - started, 1)
+
+
+async def _serve_asgi(paths, token, concurrency):
+	# one event loop: up to `concurrency` requests in flight
+	client = AsyncClient()
+	slots = asyncio.Semaphore(concurrency)
+	latencies = []
+
+	async def get(path):
+		async with slots:
+			request_started = time.perf_counter()
+			_check(await client.get(path, authorization=f'Token {token}'), path)
+			latencies.append(time.perf_counter() - request_started)
+
+	started = time.perf_counter()
+	await asyncio.gather(*(get(path) for path in paths))
+	return _summary(latencies, time.perf_counter() - started, concurrency)
+
+
+def read_concurrency(token, product_ids, requests=400, concurrency=16, db_latency=0.001, rng=None):
+	"""
+	Serves the same mix of product list, product detail, stats and cart reads
+	through the WSGI handler one at a time, like a sync gunicorn worker, and
+	through the ASGI handler with `concurrency` requests in flight, like one
+	uvicorn worker. The catalog cache is bypassed so every read hits the database,
+	and db_latency seconds are added to every statement to stand in for the
+	network round trip to a database server (sqlite has none).
+
+	@return: dict of mode -> requests, concurrency, seconds, throughput and latency percentiles
+	"""
+	rng = rng or random.Random(0)
+	paths = _read_paths(product_ids, requests, rng)
+	# without the debug toolbar like production: as a sync only middleware
+	# it would put every ASGI request back on a single thread
+	with _database_latency(db_latency), override_settings(CATALOG_CACHE_TTL=0, MIDDLEWARE=_production_middleware()):
+		report = {'wsgi': _serve_wsgi(paths, token)}
+		with asgi_views():
+			report['asgi'] = asyncio.run(_serve_asgi(paths, token, concurrency))
+		return report
+
+
+def _serve_threads(handler, paths, token, threads):
+	# a gthread worker: `threads` threads taking requests from one queue,
+	# each with its own database connection
+	environs = [
+		RequestFactory().get(path, HTTP_AUTHORIZATION=f'Token {token}').environ for path in paths
+	]
+	pending = queue.Queue()
+	for environ in environs:
+		pending.put(environ)
+	latencies, errors = [], []
+
+	def serve():
+		try:
+			while True:
+				try:
+					environ = pending.get_nowait()
+				except queue.Empty:
+					return
+				request_started = time.perf_counter()
+				response = handler(environ, lambda status, headers: None)
+				try:
+					_check(response, environ['PATH_INFO'])
+					b''.join(response)
+				finally:
+					# fires request_finished, which closes obsolete connections
+					response.close()
+				latencies.append(time.perf_counter() - request_started)
+		except Exception as exc:
+			errors.append(exc)
+		finally:
+			connections.close_all()
+
+	workers = [threading.Thread(target=serve) for _ in range(threads)]
+	started = time.perf_counter()
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+	if errors:
+		raise errors[0]
+	return _summary(latencies, time.perf_counter() - started, threads)
+
+
+def runtime(token, product_ids, requests=400, threads=4, conn_max_age=60, connect_latency=0.005, db_latency=0.001, rng=None):
+	"""
+	Serves a mix of catalog reads through Django's WSGI handler, request signals
+	included, under three worker profiles: 'sync' (one thread, a connection per
+	request, Django's defaults), 'gthread' (`threads` threads, still a connection
+	per request) and 'gthread_persistent' (`threads` threads keeping their
+	connection for conn_max_age seconds, checked by ConnectionHealthMiddleware),
+	the profile gunicorn.conf.py runs. Opening a connection costs connect_latency
+	seconds and every statement db_latency seconds, standing in for a database server.
+	Use a database on disk: connections to an in-memory sqlite database are never closed.
+
+	@return: dict of profile -> requests, seconds, throughput, latency percentiles
+		and connections_opened (connection churn)
+	"""
+	rng = rng or random.Random(0)
+	paths = _read_paths(product_ids, requests, rng)
+	settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+	old_conn_max_age = settings_dict['CONN_MAX_AGE']
+	opened = []
+
+	def count_connection(connection, **kwargs):
+		opened.append(connection.alias)
+
+	report = {}
+	connection_created.connect(count_connection)
+	try:
+		with _database_latency(db_latency, connect_latency), override_settings(CATALOG_CACHE_TTL=0):
+			for profile, profile_threads, max_age in (
+				('sync', 1, 0), ('gthread', threads, 0), ('gthread_persistent', threads, conn_max_age)
+			):
+				# connections pick up CONN_MAX_AGE when they connect
+				connections.close_all()
+				settings_dict['CONN_MAX_AGE'] = max_age
+				with override_settings(MIDDLEWARE=_production_middleware()):
+					handler = WSGIHandler()
+				del opened[:]
+				report[profile] = _serve_threads(handler, paths, token, profile_threads)
+				report[profile]['connections_opened'] = len(opened)
+	finally:
+		connection_created.disconnect(count_connection)
+		settings_dict['CONN_MAX_AGE'] = old_conn_max_age
+		connections.close_all()
+	return report
@@ -0,0 +1,125 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from rainshop.conditional import VALIDATOR_HEADERS
+from rainshop.db_routers import primary_reads
+
+GENERATION_KEY = 'catalog:generation'
+# set for REPLICA_PIN_SECONDS after every change
+RECENT_CHANGE_KEY = 'catalog:changed'
+# version of the sales figures of past days, see products.reports
+STATS_VERSION_KEY = 'stats:version'
+
+
+def catalog_cache():
+	return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _fresh_generation():
+	# starting from the clock means a lost or evicted counter never reuses old keys
+	return int(time.time() * 1000)
+
+
+def _get_counter(key):
+	cache = catalog_cache()
+	value = cache.get(key)
+	if value is None:
+		cache.add(key, _fresh_generation(), timeout=None)
+		value = cache.get(key, _fresh_generation())
+	return value
+
+
+def _bump_counter(key):
+	cache = catalog_cache()
+	try:
+		cache.incr(key)
+	except ValueError:
+		cache.set(key, _fresh_generation(), timeout=None)
+
+
+def get_generation():
+	"""
+	Returns the current catalog generation. Every cached page is keyed by it,
+	so bumping the generation makes all cached pages unreachable at once.
+	"""
+	return _get_counter(GENERATION_KEY)
+
+
+def bump_generation():
+	_bump_counter(GENERATION_KEY)
+	catalog_cache().set(RECENT_CHANGE_KEY, True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def get_stats_version():
+	"""
+	Returns the version of the sales figures of past days. Stats of closed
+	periods are cached under it, see products.reports.
+	"""
+	return _get_counter(STATS_VERSION_KEY)
+
+
+def bump_stats_version():
+	_bump_counter(STATS_VERSION_KEY)
+
+
+def invalidate_closed_stats():
+	"""
+	Drops the cached stats of closed periods once the current transaction commits.
+	Has to be called by everything that changes the sales of a past day or a
+	product name: orders of past days changing status, a rollup rebuild etc.
+	"""
+	transaction.on_commit(bump_stats_version)
+
+
+def invalidate_catalog():
+	"""
+	Drops all cached catalog pages once the current transaction commits.
+	Has to be called by everything that changes products without Product.save(),
+	e.g. queryset updates of the stock.
+	"""
+	transaction.on_commit(bump_generation)
+
+
+def cached_catalog_response(request, build_response):
+	"""
+	Serves a catalog GET request from the cache, building and storing it on a miss.
+	The key covers the full absolute URI, so page parameters and the host used
+	for the hyperlinks in the payload each get their own entry.
+	Validator headers (see rainshop.conditional) are cached with the body, so a
+	revalidation of a cached page is answered without touching the database.
+	Right after a catalog change pages are built from the primary database, a
+	lagging replica would put the old catalog back in the cache for CATALOG_CACHE_TTL.
+
+	@param request: the incoming request
+	@param build_response: callable producing the DRF response on a cache miss
+	"""
+	cache = catalog_cache()
+	uri_hash = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+	key = f'catalog:{get_generation()}:{uri_hash}'
+	cached = cache.get(key)
+	if cached is not None:
+		data, headers = cached
+		response = Response(data, status=status.HTTP_200_OK, headers=headers)
+		return get_conditional_response(
+			request,
+			etag=headers.get('ETag'),
+			last_modified=parse_http_date_safe(headers.get('Last-Modified')),
+			response=response
+		)
+	if cache.get(RECENT_CHANGE_KEY):
+		with primary_reads():
+			response = build_response()
+	else:
+		response = build_response()
+	if response.status_code == status.HTTP_200_OK:
+		headers = {name: response[name] for name in VALIDATOR_HEADERS if response.has_header(name)}
+		cache.set(key, (response.data, headers), timeout=settings.CATALOG_CACHE_TTL)
+	return response
@@ -0,0 +1,30 @@
+import django_filters
+
+from .models import Product
+
+
+class ProductFilter(django_filters.FilterSet):
+	"""
+	Catalog filters. The name search is a case insensitive substring match on every
+	backend; on Postgres it is served by the products_name_trgm_idx trigram index
+	(see migration 0007), elsewhere it scans the table.
+	"""
+	min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte', label='Lowest price')
+	max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte', label='Highest price')
+	in_stock = django_filters.BooleanFilter(method='filter_in_stock', label='Only products in stock')
+	search = django_filters.CharFilter(method='filter_search', label='Part of the product name')
+
+	class Meta:
+		model = Product
+		fields = ['min_price', 'max_price', 'in_stock', 'search']
+
+	def filter_in_stock(self, queryset, name, value):
+		if value:
+			return queryset.filter(quantity__gt=0)
+		return queryset
+
+	def filter_search(self, queryset, name, value):
+		value = value.strip()
+		if not value:
+			return queryset
+		return queryset.filter(name__icontains=value)
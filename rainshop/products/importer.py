@@ -0,0 +1,317 @@
+import csv
+import hashlib
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_catalog, invalidate_closed_stats
+from .models import Product
+
+IMPORT_FORMATS = ['json', 'csv']
+IMPORT_CHUNK_SIZE = 2000
+
+# columns written by the importer, in insert order
+COLUMNS = ['id', 'name', 'cost', 'cost_currency', 'price', 'price_currency', 'quantity', 'created_at', 'updated_at']
+# columns that make up a product's content hash; timestamps are not content
+CONTENT_COLUMNS = ['name', 'cost', 'cost_currency', 'price', 'price_currency', 'quantity']
+# columns overwritten when an existing product changed
+UPDATE_COLUMNS = CONTENT_COLUMNS + ['updated_at']
+
+_CENT = Decimal('0.01')
+_READ_SIZE = 1 << 16
+
+
+class ProductImportError(ValueError):
+	pass
+
+
+def _iter_json(stream):
+	"""
+	Yields the objects of a JSON array (e.g. a loaddata fixture) or of
+	newline delimited JSON, reading the stream in fixed size blocks.
+	Only the current block and one decoded record are held in memory.
+	"""
+	decoder = json.JSONDecoder(parse_float=Decimal)
+	buffer = ''
+	position = 0
+	eof = False
+	while True:
+		# skip the separators between records: whitespace, commas and the array brackets
+		while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+			position += 1
+		if position == len(buffer):
+			if eof:
+				return
+			buffer = stream.read(_READ_SIZE)
+			position = 0
+			eof = not buffer
+			continue
+		try:
+			record, end = decoder.raw_decode(buffer, position)
+		except json.JSONDecodeError as exc:
+			if eof:
+				raise ProductImportError(f'Invalid JSON: {exc}')
+			block = stream.read(_READ_SIZE)
+			eof = not block
+			buffer = buffer[position:] + block
+			position = 0
+			continue
+		position = end
+		yield record
+
+
+def _iter_csv(stream):
+	return csv.DictReader(stream)
+
+
+def _decimal(value, name):
+	try:
+		amount = Decimal(str(value)).quantize(_CENT)
+	except (InvalidOperation, TypeError):
+		raise ProductImportError(f'{name} must be a number, got {value!r}')
+	if not amount.is_finite() or amount < 0 or len(amount.as_tuple().digits) > 10:
+		raise ProductImportError(f'{name} must be a positive amount with at most 8 digits before the point')
+	return amount
+
+
+def _integer(value, name):
+	if isinstance(value, bool):
+		raise ProductImportError(f'{name} must be an integer, got {value!r}')
+	try:
+		number = int(value)
+	except (TypeError, ValueError):
+		raise ProductImportError(f'{name} must be an integer, got {value!r}')
+	if number != Decimal(str(value).strip()) or number < 0:
+		raise ProductImportError(f'{name} must be a positive integer, got {value!r}')
+	return number
+
+
+def _normalize(record, now):
+	"""
+	Turns a fixture record ({"pk": 1, "fields": {...}}) or a flat record
+	({"id": 1, "name": ...}) into a dict keyed by COLUMNS.
+	"""
+	if not isinstance(record, dict):
+		raise ProductImportError('every record must be an object')
+	if 'fields' in record:
+		fields = dict(record['fields'], id=record.get('pk'))
+	else:
+		fields = record
+	if fields.get('id') in (None, ''):
+		raise ProductImportError('id is required')
+	name = fields.get('name')
+	if not isinstance(name, str) or not name.strip() or len(name) > 255:
+		raise ProductImportError('name must be a non empty string of at most 255 characters')
+	created_at = fields.get('created_at') or None
+	if created_at is not None:
+		created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+		if created_at is None:
+			raise ProductImportError('created_at must be an ISO 8601 datetime')
+		if timezone.is_naive(created_at):
+			created_at = timezone.make_aware(created_at, timezone.utc)
+	return {
+		'id'            : _integer(fields['id'], 'id'),
+		'name'          : name,
+		'cost'          : _decimal(fields.get('cost'), 'cost'),
+		'cost_currency' : fields.get('cost_currency') or 'USD',
+		'price'         : _decimal(fields.get('price'), 'price'),
+		'price_currency': fields.get('price_currency') or 'USD',
+		'quantity'      : _integer(fields.get('quantity'), 'quantity'),
+		'created_at'    : created_at or now,
+		'updated_at'    : now,
+	}
+
+
+def content_hash(row):
+	"""
+	Hashes the columns that describe a product, so an incoming record can be
+	compared with the stored row without looking at the individual fields.
+	"""
+	values = []
+	for column in CONTENT_COLUMNS:
+		value = row[column]
+		if isinstance(value, Decimal):
+			value = value.quantize(_CENT)
+		values.append(str(value))
+	return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def _stored_hashes(ids):
+	rows = Product.objects.filter(id__in=ids).values_list('id', *CONTENT_COLUMNS)
+	return {row[0]: content_hash(dict(zip(CONTENT_COLUMNS, row[1:]))) for row in rows}
+
+
+def _supports_upsert():
+	if connection.vendor == 'postgresql':
+		return True
+	if connection.vendor == 'sqlite':
+		# ON CONFLICT ... DO UPDATE needs 3.24
+		return connection.Database.sqlite_version_info >= (3, 24)
+	return False
+
+
+def _quoted(columns):
+	return ', '.join(connection.ops.quote_name(column) for column in columns)
+
+
+def _on_conflict_update():
+	return 'ON CONFLICT (id) DO UPDATE SET ' + ', '.join(
+		f'{connection.ops.quote_name(column)} = excluded.{connection.ops.quote_name(column)}'
+		for column in UPDATE_COLUMNS
+	)
+
+
+def _adapt(row):
+	ops = connection.ops
+	return [
+		row['id'],
+		row['name'],
+		ops.adapt_decimalfield_value(row['cost'], 10, 2),
+		row['cost_currency'],
+		ops.adapt_decimalfield_value(row['price'], 10, 2),
+		row['price_currency'],
+		row['quantity'],
+		ops.adapt_datetimefield_value(row['created_at']),
+		ops.adapt_datetimefield_value(row['updated_at']),
+	]
+
+
+def _values_upsert(rows):
+	"""INSERT ... VALUES ... ON CONFLICT (id) DO UPDATE, as many rows per statement as the backend allows."""
+	table = connection.ops.quote_name(Product._meta.db_table)
+	max_params = connection.features.max_query_params
+	per_statement = max_params // len(COLUMNS) if max_params else len(rows)
+	placeholders = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+	with connection.cursor() as cursor:
+		for start in range(0, len(rows), per_statement):
+			batch = rows[start:start + per_statement]
+			params = []
+			for row in batch:
+				params += _adapt(row)
+			cursor.execute(
+				f'INSERT INTO {table} ({_quoted(COLUMNS)}) VALUES {", ".join([placeholders] * len(batch))} '
+				f'{_on_conflict_update()}',
+				params
+			)
+
+
+def _copy_upsert(rows):
+	"""
+	Postgres only: COPYs the rows into a temporary table and merges it
+	into products with a single INSERT ... SELECT ... ON CONFLICT.
+	"""
+	table = connection.ops.quote_name(Product._meta.db_table)
+	data = io.StringIO()
+	writer = csv.writer(data)
+	for row in rows:
+		writer.writerow([
+			row['id'], row['name'], row['cost'], row['cost_currency'], row['price'],
+			row['price_currency'], row['quantity'], row['created_at'].isoformat(), row['updated_at'].isoformat()
+		])
+	data.seek(0)
+	with connection.cursor() as cursor:
+		cursor.execute(
+			f'CREATE TEMPORARY TABLE IF NOT EXISTS product_import (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+		)
+		cursor.execute('TRUNCATE product_import')
+		cursor.copy_expert(f'COPY product_import ({_quoted(COLUMNS)}) FROM STDIN WITH (FORMAT csv)', data)
+		cursor.execute(
+			f'INSERT INTO {table} ({_quoted(COLUMNS)}) SELECT {_quoted(COLUMNS)} FROM product_import '
+			f'{_on_conflict_update()}'
+		)
+
+
+def _orm_write(created, updated):
+	# fallback for backends without ON CONFLICT; created_at of new rows is set to now
+	Product.objects.bulk_create([
+		Product(**{column: row[column] for column in COLUMNS}) for row in created
+	])
+	Product.objects.bulk_update([
+		Product(**{column: row[column] for column in COLUMNS}) for row in updated
+	], UPDATE_COLUMNS)
+
+
+def _write(created, updated, use_copy):
+	if not created and not updated:
+		return
+	if _supports_upsert():
+		rows = created + updated
+		if use_copy and connection.vendor == 'postgresql':
+			_copy_upsert(rows)
+		else:
+			_values_upsert(rows)
+	else:
+		_orm_write(created, updated)
+
+
+def _reset_sequence():
+	# ids come from the file, so the id sequence has to catch up (as loaddata does)
+	statements = connection.ops.sequence_reset_sql(no_style(), [Product])
+	if statements:
+		with connection.cursor() as cursor:
+			for statement in statements:
+				cursor.execute(statement)
+
+
+def import_products(stream, file_format='json', chunk_size=IMPORT_CHUNK_SIZE, use_copy=True):
+	"""
+	Creates or updates products from a JSON (loaddata fixture, array or NDJSON)
+	or CSV stream, matching them by id. Records are read and written chunk by chunk;
+	each chunk costs one read of the stored rows plus one write of the rows whose
+	content hash changed, so re-importing an unchanged catalog writes nothing.
+	The whole import runs in one transaction.
+
+	@param stream: text file object to read from
+	@param file_format: one of IMPORT_FORMATS
+	@param chunk_size: records compared and written at a time
+	@param use_copy: on Postgres, load each chunk with COPY instead of INSERT ... VALUES
+	@return: dict with the number of read, created, updated and unchanged records and the seconds taken
+	"""
+	started = time.monotonic()
+	records = _iter_csv(stream) if file_format == 'csv' else _iter_json(stream)
+	now = timezone.now()
+	counts = {'read': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+
+	def flush(chunk):
+		stored = _stored_hashes(list(chunk))
+		created, updated = [], []
+		for product_id, row in chunk.items():
+			if product_id not in stored:
+				created.append(row)
+			elif stored[product_id] != content_hash(row):
+				updated.append(row)
+		_write(created, updated, use_copy)
+		counts['created'] += len(created)
+		counts['updated'] += len(updated)
+		counts['unchanged'] += len(chunk) - len(created) - len(updated)
+
+	with transaction.atomic():
+		chunk = {}
+		for number, record in enumerate(records, start=1):
+			try:
+				row = _normalize(record, now)
+			except ProductImportError as exc:
+				raise ProductImportError(f'Record {number}: {exc}')
+			# a later record for the same id wins, like it would with loaddata
+			if row['id'] not in chunk and len(chunk) >= chunk_size:
+				flush(chunk)
+				chunk = {}
+			chunk[row['id']] = row
+			counts['read'] += 1
+		if chunk:
+			flush(chunk)
+		if counts['created']:
+			_reset_sequence()
+		if counts['created'] or counts['updated']:
+			invalidate_catalog()
+			# the rows are written with raw SQL, so no Product signal drops the cached stats
+			invalidate_closed_stats()
+
+	counts['seconds'] = time.monotonic() - started
+	return counts
@@ -0,0 +1,57 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import benchmarks
+from rainshop import benchmarking
+
+
+class Command(BaseCommand):
+	help = (
+		'Serves the catalog read endpoints (product list/detail, stats, cart) through the WSGI handler '
+		'one request at a time and through the ASGI handler with concurrent requests, '
+		'in a throwaway test database, and compares the throughput per worker.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--products', type=int, default=200)
+		parser.add_argument('--requests', type=int, default=400)
+		parser.add_argument('--concurrency', type=int, default=16, help='ASGI requests in flight.')
+		parser.add_argument(
+			'--db-latency-ms', type=float, default=1.0,
+			help='Added to every statement, stands in for the round trip to a database server.'
+		)
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--output', '-o', help='Also write the results to this JSON file.')
+		parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+	def handle(self, *args, **options):
+		for name in ('products', 'requests', 'concurrency'):
+			if options[name] < 1:
+				raise CommandError(f'--{name} must be positive')
+
+		with benchmarking.isolated_database(keepdb=options['keepdb']):
+			token, product_ids = benchmarks.seed_reads(options['products'])
+			try:
+				report = benchmarks.read_concurrency(
+					token,
+					product_ids,
+					requests=options['requests'],
+					concurrency=options['concurrency'],
+					db_latency=options['db_latency_ms'] / 1000,
+					rng=random.Random(options['seed'])
+				)
+			except benchmarking.BenchmarkError as exc:
+				raise CommandError(str(exc))
+			report['environment'] = benchmarking.environment()
+
+		for mode in benchmarks.SERVER_MODES:
+			summary = report[mode]
+			self.stdout.write(
+				f'{mode:<5} {summary["concurrency"]:3} in flight  {summary["throughput_rps"]:8.1f} req/s  '
+				f'p50 {summary["p50_ms"]:8.2f}ms  p95 {summary["p95_ms"]:8.2f}ms'
+			)
+		speedup = report['asgi']['throughput_rps'] / report['wsgi']['throughput_rps']
+		self.stdout.write(self.style.SUCCESS(f'ASGI serves {speedup:.1f}x the reads per worker'))
+		if options['output']:
+			benchmarking.write_report(options['output'], report)
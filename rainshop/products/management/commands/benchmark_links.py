@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from products import benchmarks
+from rainshop import benchmarking
+
+
+class Command(BaseCommand):
+	help = (
+		'Compares building the self links of a product page with reverse() per object '
+		'and with a per request LinkBuilder, and times serializing the whole page.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--rounds', type=int, default=200)
+		parser.add_argument('--page-size', type=int, default=50)
+
+	def handle(self, *args, **options):
+		if options['rounds'] < 1 or options['page_size'] < 1:
+			raise CommandError('--rounds and --page-size must be positive')
+
+		# allows the testserver host of the built requests
+		setup_test_environment(debug=False)
+		try:
+			report = benchmarks.self_links(
+				benchmarking.Recorder(), rounds=options['rounds'], page_size=options['page_size']
+			)
+		finally:
+			teardown_test_environment()
+
+		for step in benchmarks.LINK_STEPS:
+			summary = report['steps'][step]
+			self.stdout.write(
+				f'{step:<14} p50 {summary["p50_ms"]:8.3f}ms  p95 {summary["p95_ms"]:8.3f}ms  '
+				f'mean {summary["mean_ms"]:8.3f}ms'
+			)
+		speedup = report['steps']['reverse']['mean_ms'] / report['steps']['link_builder']['mean_ms']
+		self.stdout.write(self.style.SUCCESS(
+			f'{options["page_size"]} links: LinkBuilder is {speedup:.1f}x faster than reverse()'
+		))
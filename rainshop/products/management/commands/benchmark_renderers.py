@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from products import benchmarks
+from rainshop import benchmarking, fast_json
+
+
+class Command(BaseCommand):
+	help = (
+		'Compares DRF\'s JSONRenderer with FastJSONRenderer on a product list page '
+		'and on a stats shaped payload.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--rounds', type=int, default=200)
+		parser.add_argument('--page-size', type=int, default=50)
+
+	def handle(self, *args, **options):
+		if options['rounds'] < 1 or options['page_size'] < 1:
+			raise CommandError('--rounds and --page-size must be positive')
+
+		# allows the testserver host of the built requests
+		setup_test_environment(debug=False)
+		try:
+			report = benchmarks.rendering(
+				benchmarking.Recorder(), rounds=options['rounds'], page_size=options['page_size']
+			)
+		finally:
+			teardown_test_environment()
+
+		self.stdout.write(f'FastJSONRenderer backend: {"orjson" if fast_json.orjson else "json (orjson not installed)"}')
+		for step in benchmarks.RENDER_STEPS:
+			summary = report['steps'][step]
+			self.stdout.write(
+				f'{step:<11} p50 {summary["p50_ms"]:8.3f}ms  p95 {summary["p95_ms"]:8.3f}ms  '
+				f'mean {summary["mean_ms"]:8.3f}ms'
+			)
+		for payload in ('list', 'stats'):
+			speedup = report['steps'][f'{payload}_json']['mean_ms'] / report['steps'][f'{payload}_fast']['mean_ms']
+			self.stdout.write(self.style.SUCCESS(f'{payload}: FastJSONRenderer is {speedup:.1f}x faster'))
@@ -0,0 +1,64 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import benchmarks
+from rainshop import benchmarking
+
+
+class Command(BaseCommand):
+	help = (
+		'Serves the catalog read endpoints through the WSGI handler as a sync worker, as a gthread worker '
+		'and as a gthread worker with persistent, health checked connections (gunicorn.conf.py), '
+		'in a throwaway test database, and compares the throughput and the connections opened.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--products', type=int, default=200)
+		parser.add_argument('--requests', type=int, default=400)
+		parser.add_argument('--threads', type=int, default=4, help='Threads of the gthread worker.')
+		parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE of the persistent profile.')
+		parser.add_argument(
+			'--connect-latency-ms', type=float, default=5.0,
+			help='Added to every new connection, stands in for the TCP/TLS handshake and authentication.'
+		)
+		parser.add_argument(
+			'--db-latency-ms', type=float, default=1.0,
+			help='Added to every statement, stands in for the round trip to a database server.'
+		)
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--output', '-o', help='Also write the results to this JSON file.')
+		parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+	def handle(self, *args, **options):
+		for name in ('products', 'requests', 'threads'):
+			if options[name] < 1:
+				raise CommandError(f'--{name} must be positive')
+
+		with benchmarking.isolated_database(keepdb=options['keepdb'], on_disk=True):
+			token, product_ids = benchmarks.seed_reads(options['products'])
+			try:
+				report = benchmarks.runtime(
+					token,
+					product_ids,
+					requests=options['requests'],
+					threads=options['threads'],
+					conn_max_age=options['conn_max_age'],
+					connect_latency=options['connect_latency_ms'] / 1000,
+					db_latency=options['db_latency_ms'] / 1000,
+					rng=random.Random(options['seed'])
+				)
+			except benchmarking.BenchmarkError as exc:
+				raise CommandError(str(exc))
+			report['environment'] = benchmarking.environment()
+
+		for profile in benchmarks.RUNTIME_PROFILES:
+			summary = report[profile]
+			self.stdout.write(
+				f'{profile:<18} {summary["throughput_rps"]:8.1f} req/s  p50 {summary["p50_ms"]:8.2f}ms  '
+				f'p95 {summary["p95_ms"]:8.2f}ms  {summary["connections_opened"]:5} connections opened'
+			)
+		speedup = report['gthread_persistent']['throughput_rps'] / report['sync']['throughput_rps']
+		self.stdout.write(self.style.SUCCESS(f'gunicorn.conf.py serves {speedup:.1f}x the reads of a sync worker'))
+		if options['output']:
+			benchmarking.write_report(options['output'], report)
@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import importer
+
+
+class Command(BaseCommand):
+	help = (
+		'Creates or updates products from a JSON (loaddata fixture, array or NDJSON) or CSV file, '
+		'skipping records whose content did not change.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help='File to import.')
+		parser.add_argument(
+			'--format', dest='file_format', choices=importer.IMPORT_FORMATS,
+			help='File format, guessed from the file extension by default.'
+		)
+		parser.add_argument('--chunk-size', type=int, default=importer.IMPORT_CHUNK_SIZE)
+		parser.add_argument(
+			'--no-copy', dest='use_copy', action='store_false',
+			help='On Postgres, write with INSERT ... VALUES instead of COPY.'
+		)
+
+	def handle(self, *args, **options):
+		if options['chunk_size'] < 1:
+			raise CommandError('--chunk-size must be positive')
+		file_format = options['file_format']
+		if file_format is None:
+			file_format = 'csv' if os.path.splitext(options['path'])[1].lower() == '.csv' else 'json'
+		try:
+			with open(options['path'], newline='', encoding='utf-8') as stream:
+				counts = importer.import_products(
+					stream,
+					file_format=file_format,
+					chunk_size=options['chunk_size'],
+					use_copy=options['use_copy']
+				)
+		except OSError as exc:
+			raise CommandError(f'Cannot read {options["path"]}: {exc}')
+		except importer.ProductImportError as exc:
+			raise CommandError(str(exc))
+		rate = counts['read'] / counts['seconds'] if counts['seconds'] else counts['read']
+		self.stdout.write(self.style.SUCCESS(
+			f'Imported {counts["read"]} products in {counts["seconds"]:.2f}s ({rate:.0f} rows/s): '
+			f'{counts["created"]} created, {counts["updated"]} updated, {counts["unchanged"]} unchanged.'
+		))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import rollup
+
+
+class Command(BaseCommand):
+	help = 'Rebuilds the product daily sales rollup used by the stats endpoint from the order history.'
+
+	def handle(self, *args, **options):
+		written = rollup.rebuild()
+		self.stdout.write(self.style.SUCCESS(f'Rebuilt product daily sales: {written} rows.'))
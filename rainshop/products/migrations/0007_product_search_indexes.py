@@ -0,0 +1,38 @@
+# Generated by Django 3.2.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+# matches the expression Django compiles name__icontains to on Postgres
+CREATE_TRIGRAM_INDEX = (
+    'CREATE INDEX IF NOT EXISTS products_name_trgm_idx '
+    'ON products USING gin ((UPPER(name::text)) gin_trgm_ops)'
+)
+DROP_TRIGRAM_INDEX = 'DROP INDEX IF EXISTS products_name_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(CREATE_TRIGRAM_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_TRIGRAM_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='products_price_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -6,6 +6,12 @@ class Product(models.Model):
 	class Meta:
 		db_table = 'products'
 		verbose_name_plural = 'Products'
+		indexes = [
+			# keyset pagination, see rainshop.pagination
+			models.Index(fields=['created_at', 'id'], name='products_created_id_idx'),
+			# price range filter, see products.filters
+			models.Index(fields=['price'], name='products_price_idx'),
+		]
 
 	name = models.CharField(null=False, blank=False, max_length=255)
 	cost = MoneyField(null=False, blank=False, default_currency='USD',
@@ -19,3 +25,39 @@ class Product(models.Model):
 
 	def __str__(self):
 		return self.name
+
+
+class ProductDailySales(models.Model):
+	"""
+	Pre-aggregated order items per product, day and order status.
+	Rows are kept in sync by products.rollup whenever an order changes its status,
+	so the stats endpoint never has to scan order_items.
+	"""
+	class Meta:
+		db_table = 'product_daily_sales'
+		verbose_name_plural = 'Product Daily Sales'
+		constraints = [
+			models.UniqueConstraint(
+				fields=['product', 'day', 'status'],
+				name='product_daily_sales_unique_product_day_status'
+			),
+		]
+		indexes = [
+			models.Index(fields=['day', 'status'], name='pds_day_status_idx'),
+		]
+
+	product = models.ForeignKey(
+		Product,
+		related_name='daily_sales',
+		on_delete=models.CASCADE
+	)
+	day = models.DateField(null=False, blank=False)
+	status = models.CharField(null=False, blank=False, max_length=10)
+	quantity = models.IntegerField(default=0, null=False, blank=False)
+	gross = models.DecimalField(default=0, null=False, blank=False,
+								max_digits=14, decimal_places=2)
+	cost = models.DecimalField(default=0, null=False, blank=False,
+							   max_digits=14, decimal_places=2)
+
+	def __str__(self):
+		return f'{self.product_id} {self.day} {self.status}'
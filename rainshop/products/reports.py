@@ -0,0 +1,211 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import Count, DateField, Exists, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from orders.models import Order
+from rainshop.dates import day_range
+from rainshop.db_routers import primary_reads
+from .cache import catalog_cache, get_stats_version
+from .models import Product, ProductDailySales
+
+GRANULARITIES = ['day', 'week', 'month']
+RETURNED_STATUSES = ['RETURNED', 'CANCELLED']
+PAID_STATUSES = ['PAID']
+
+
+def _sales_total(sales, field, statuses=None):
+	"""
+	Sum of a rollup column per product, as a subquery correlated to the product.
+	Every figure is aggregated on its own from the product's rollup rows, so no
+	sum is multiplied by the rows another one joins in.
+
+	@param sales: ProductDailySales rows of OuterRef('pk'), already limited to the date range
+	@param field: column to sum
+	@param statuses: order statuses to sum, all when None
+	"""
+	if statuses is not None:
+		sales = sales.filter(status__in=statuses)
+	return Subquery(sales.values('product').annotate(total=Sum(field)).values('total'))
+
+
+def _order_counts():
+	return {
+		'total_created'        : Count('id', filter=Q(status='CREATED')),
+		'total_cancelled'      : Count('id', filter=Q(status='CANCELLED')),
+		'total_paid'           : Count('id', filter=Q(status__in=PAID_STATUSES)),
+		'total_all_statuses'   : Count('id'),
+		'total_returned_orders': Count('id', filter=Q(status='RETURNED')),
+	}
+
+
+def _day_filter(start, end):
+	condition = Q()
+	if start is not None:
+		condition &= Q(day__gte=start)
+	if end is not None:
+		condition &= Q(day__lte=end)
+	return condition
+
+
+def _totals(start, end):
+	"""
+	@return: ([(product name, ordered, returned, gross income, cost)], order counts) of the range,
+		all products when the range is open, otherwise those sold in it
+	"""
+	# per product figures are summed from the ProductDailySales rollup,
+	# see products.rollup for how it is maintained
+	sales = ProductDailySales.objects.filter(_day_filter(start, end), product=OuterRef('pk')).order_by()
+	products = Product.objects.all()
+	if start is not None or end is not None:
+		# only products sold in the range
+		products = products.filter(Exists(sales))
+	products = products.annotate(
+		total_ordered=_sales_total(sales, 'quantity'),
+		total_returned=_sales_total(sales, 'quantity', RETURNED_STATUSES),
+		total_gross_income=_sales_total(sales, 'gross', PAID_STATUSES),
+		total_cost=_sales_total(sales, 'cost', PAID_STATUSES)
+	).values_list('name', 'total_ordered', 'total_returned', 'total_gross_income', 'total_cost')
+	orders = Order.objects.filter(day_range('created_at', start, end)).aggregate(**_order_counts())
+	return list(products), orders
+
+
+def _series(start, end, granularity):
+	"""
+	The figures of _totals per period, with one grouped query over the rollup
+	and one over the orders. Periods without orders are left out.
+
+	@return: list of (first day of the period, product figures, order counts)
+	"""
+	sales = ProductDailySales.objects.filter(
+		_day_filter(start, end)
+	).annotate(
+		period=Trunc('day', granularity, output_field=DateField())
+	).values(
+		'period', 'product', 'product__name'
+	).annotate(
+		total_ordered=Sum('quantity'),
+		total_returned=Sum('quantity', filter=Q(status__in=RETURNED_STATUSES)),
+		total_gross_income=Sum('gross', filter=Q(status__in=PAID_STATUSES)),
+		total_cost=Sum('cost', filter=Q(status__in=PAID_STATUSES))
+	).order_by('period', 'product').values_list(
+		'period', 'product__name', 'total_ordered', 'total_returned', 'total_gross_income', 'total_cost'
+	)
+	orders = Order.objects.filter(
+		day_range('created_at', start, end)
+	).annotate(
+		period=Trunc('created_at', granularity, output_field=DateField())
+	).values('period').annotate(**_order_counts()).order_by('period')
+
+	products_by_period = {}
+	for period, *figures in sales:
+		products_by_period.setdefault(period, []).append(tuple(figures))
+	orders_by_period = {counts.pop('period'): counts for counts in orders}
+	return [
+		(period, products_by_period.get(period, []), orders_by_period.get(period, _no_orders()))
+		for period in sorted(set(products_by_period) | set(orders_by_period))
+	]
+
+
+def _no_orders():
+	return {name: 0 for name in _order_counts()}
+
+
+def period_start(day, granularity):
+	"""First day of the period the day falls in, like Trunc does (weeks start on Monday)."""
+	if granularity == 'week':
+		return day - datetime.timedelta(days=day.weekday())
+	if granularity == 'month':
+		return day.replace(day=1)
+	return day
+
+
+def _cached(key, compute):
+	# a miss reads the primary, a lagging replica would cache old figures under the new version
+	cache = catalog_cache()
+	value = cache.get(key)
+	if value is None:
+		with primary_reads():
+			value = compute()
+		cache.set(key, value, timeout=settings.STATS_CACHE_TTL)
+	return value
+
+
+def _render(products, orders):
+	total_ordered_data = {}
+	total_returned_data = {}
+	total_gross_income_data = {}
+	total_cost_data = {}
+	total_clean_income = {}
+
+	for name, total_ordered, total_returned, total_gross_income, total_cost in products:
+		total_ordered_data[name] = total_ordered
+		total_returned_data[name] = total_returned
+		total_gross_income_data[name] = total_gross_income
+		total_cost_data[name] = total_cost
+		if total_cost is not None and total_gross_income is not None:
+			total_clean_income[name] = total_gross_income - total_cost
+		if total_gross_income is None:
+			total_clean_income[name] = None
+
+	return {
+		'total_orders': orders['total_all_statuses'],
+		'total_ordered': total_ordered_data,
+		'total_returned': total_returned_data,
+		'orders_by_status': {
+			'total_created': orders['total_created'],
+			'total_returned': orders['total_returned_orders'],
+			'total_cancelled': orders['total_cancelled'],
+			# the key predates the status being renamed to PAID
+			'total_payed': orders['total_paid'],
+		},
+		'orders_by_monetary_stats': {
+			'total_gross_income': total_gross_income_data,
+			'total_cost': total_cost_data,
+			'total_income': total_clean_income
+		}
+	}
+
+
+def stats_report(start=None, end=None, granularity=None):
+	"""
+	Sales stats per product and order counts per status of a date range, and
+	with a granularity the same figures per day, week or month as 'series'.
+	Figures of closed periods (ending before today) only change when an order
+	of a past day changes its status, which bumps the stats version, so they
+	are cached under (range, granularity, version); today's period is always
+	computed.
+
+	@param start: first day (inclusive), unbounded when None
+	@param end: last day (inclusive), unbounded when None
+	@param granularity: one of GRANULARITIES, no series when None
+	"""
+	today = timezone.localdate()
+	version = get_stats_version()
+	if end is not None and end < today:
+		totals = _cached(f'stats:totals:{start}:{end}:{version}', lambda: _totals(start, end))
+	else:
+		totals = _totals(start, end)
+	report = _render(*totals)
+	if granularity is None:
+		return report
+
+	first_open_day = period_start(today, granularity)
+	series = []
+	if start is None or start < first_open_day:
+		closed_end = first_open_day - datetime.timedelta(days=1)
+		if end is not None and end < closed_end:
+			closed_end = end
+		series += _cached(
+			f'stats:series:{granularity}:{start}:{closed_end}:{version}',
+			lambda: _series(start, closed_end, granularity)
+		)
+	if end is None or end >= first_open_day:
+		series += _series(max(start, first_open_day) if start is not None else first_open_day, end, granularity)
+	report['granularity'] = granularity
+	report['series'] = [
+		{'period': period.isoformat(), **_render(products, orders)} for period, products, orders in series
+	]
+	return report
@@ -0,0 +1,163 @@
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from rainshop.dates import start_of_day
+from .cache import invalidate_closed_stats
+from .models import ProductDailySales
+
+ROLLUP_BATCH_SIZE = 1000
+
+
+def _order_rows(order_ids):
+	"""
+	Aggregates order items of the given orders per product and order day.
+	Costs are the unit costs recorded at checkout, so moving an order between
+	buckets moves exactly the amounts that were added for it.
+
+	@param order_ids: ids of the orders to aggregate
+	@return: list of dicts with product_id, day, quantity, gross and cost
+	"""
+	from orders.models import OrderItem
+
+	return list(
+		OrderItem.objects.filter(
+			order_id__in=order_ids,
+			product__isnull=False
+		).annotate(
+			day=TruncDate('order__created_at')
+		).values(
+			'product_id', 'day'
+		).annotate(
+			total_quantity=Sum('quantity'),
+			total_gross=Sum('product_final_price'),
+			total_cost=Sum(F('quantity') * F('product_cost'), output_field=DecimalField())
+		).order_by()
+	)
+
+
+def _apply(rows, status, sign):
+	"""
+	Adds (sign=1) or subtracts (sign=-1) aggregated rows to the rollup
+	for the given status with a single set-based UPDATE.
+	"""
+	if not rows:
+		return
+	ProductDailySales.objects.bulk_create(
+		[ProductDailySales(product_id=row['product_id'], day=row['day'], status=status) for row in rows],
+		ignore_conflicts=True
+	)
+	match = Q()
+	quantity_cases = []
+	gross_cases = []
+	cost_cases = []
+	for row in rows:
+		row_filter = Q(product_id=row['product_id'], day=row['day'])
+		match |= row_filter
+		quantity_cases.append(When(row_filter, then=Value(sign * row['total_quantity'])))
+		gross_cases.append(When(row_filter, then=Value(sign * (row['total_gross'] or 0))))
+		cost_cases.append(When(row_filter, then=Value(sign * (row['total_cost'] or 0))))
+	decimal_field = DecimalField(max_digits=14, decimal_places=2)
+	ProductDailySales.objects.filter(match, status=status).update(
+		quantity=F('quantity') + Case(*quantity_cases, default=Value(0), output_field=IntegerField()),
+		gross=F('gross') + Case(*gross_cases, default=Value(0), output_field=decimal_field),
+		cost=F('cost') + Case(*cost_cases, default=Value(0), output_field=decimal_field),
+	)
+
+
+def record_orders(order_ids, status):
+	"""
+	Adds the items of newly created orders to the rollup.
+	Use sync_orders unless the caller keeps Order.rollup_status up to date itself.
+	"""
+	_apply(_order_rows(order_ids), status, 1)
+
+
+def move_orders(order_ids, from_status, to_status):
+	"""
+	Moves the items of the given orders from one status bucket to another.
+	Use sync_orders unless the caller keeps Order.rollup_status up to date itself.
+	"""
+	if from_status == to_status:
+		return
+	rows = _order_rows(order_ids)
+	_apply(rows, from_status, -1)
+	_apply(rows, to_status, 1)
+
+
+def sync_orders(order_ids):
+	"""
+	Brings the rollup in line with the current status of the given orders.
+	Every order remembers the status it is counted under (Order.rollup_status),
+	so running this twice, or for status changes arriving out of order, is harmless.
+
+	@param order_ids: ids of the orders that were created or changed their status
+	@return: number of orders whose rollup bucket changed
+	"""
+	from orders.models import Order
+
+	with transaction.atomic():
+		orders = Order.objects.select_for_update().filter(
+			id__in=order_ids
+		).order_by('id').values_list('id', 'status', 'rollup_status', 'created_at')
+		moves = {}
+		today = start_of_day(timezone.localdate())
+		past_days_changed = False
+		for order_id, status, rollup_status, created_at in orders:
+			if status != rollup_status:
+				moves.setdefault((rollup_status, status), []).append(order_id)
+				past_days_changed |= created_at < today
+		if past_days_changed:
+			invalidate_closed_stats()
+		for (from_status, to_status), ids in moves.items():
+			if from_status is None:
+				record_orders(ids, to_status)
+			else:
+				move_orders(ids, from_status, to_status)
+			Order.objects.filter(id__in=ids).update(rollup_status=to_status)
+	return sum(len(ids) for ids in moves.values())
+
+
+def rebuild():
+	"""
+	Recomputes the whole rollup from the order history.
+
+	@return: number of rollup rows written
+	"""
+	from orders.models import Order, OrderItem
+
+	history = OrderItem.objects.filter(
+		product__isnull=False
+	).annotate(
+		day=TruncDate('order__created_at')
+	).values(
+		'product_id', 'day', 'order__status'
+	).annotate(
+		total_quantity=Sum('quantity'),
+		total_gross=Sum('product_final_price'),
+		total_cost=Sum(F('quantity') * F('product_cost'), output_field=DecimalField())
+	).order_by()
+
+	written = 0
+	batch = []
+	with transaction.atomic():
+		invalidate_closed_stats()
+		ProductDailySales.objects.all().delete()
+		Order.objects.update(rollup_status=F('status'))
+		for row in history.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+			batch.append(ProductDailySales(
+				product_id=row['product_id'],
+				day=row['day'],
+				status=row['order__status'],
+				quantity=row['total_quantity'],
+				gross=row['total_gross'] or 0,
+				cost=row['total_cost'] or 0
+			))
+			if len(batch) >= ROLLUP_BATCH_SIZE:
+				ProductDailySales.objects.bulk_create(batch)
+				written += len(batch)
+				batch = []
+		ProductDailySales.objects.bulk_create(batch)
+		written += len(batch)
+	return written
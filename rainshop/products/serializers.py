@@ -3,12 +3,13 @@ from django.db import transaction
 from django.db.models import Q
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
-from rest_framework.reverse import reverse
 from .models import Product
 from djmoney.contrib.django_rest_framework import MoneyField
+from rainshop.fieldsets import SparseFieldsetMixin
+from rainshop.links import link_builder
 
 
-class ProductShortSerializer(serializers.ModelSerializer):
+class ProductShortSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 	name = serializers.CharField(required=True, max_length=255)
 	price = MoneyField(required=True, max_digits=10, decimal_places=2)
 	self = serializers.SerializerMethodField('get_self_link')
@@ -21,13 +22,13 @@ class ProductShortSerializer(serializers.ModelSerializer):
 			'price',
 			'self'
 		]
+		field_sources = {'self': ['id']}
 
 	def get_self_link(self, obj):
-		return reverse('products:product-detail', request=self.context['request'],
-					   args=(obj.id,))
+		return link_builder(self.context['request']).url('products:product-detail', obj.id)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 	name = serializers.CharField(required=True, max_length=255)
 	cost = MoneyField(required=True, max_digits=10, decimal_places=2)
 	price = MoneyField(required=True, max_digits=10, decimal_places=2)
@@ -48,10 +49,10 @@ class ProductSerializer(serializers.ModelSerializer):
 			'price_currency',
 			'self'
 		]
+		field_sources = {'self': ['id']}
 
 	def get_self_link(self, obj):
-		return reverse('products:product-detail', request=self.context['request'],
-					   args=(obj.id,))
+		return link_builder(self.context['request']).url('products:product-detail', obj.id)
 
 
 class ProductUpdateSerializer(serializers.ModelSerializer):
@@ -84,8 +85,7 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
 		]
 
 	def get_self_link(self, obj):
-		return reverse('products:product-detail', request=self.context['request'],
-					   args=(obj.id,))
+		return link_builder(self.context['request']).url('products:product-detail', obj.id)
 
 
 class ProductStatsSerializer(serializers.Serializer):
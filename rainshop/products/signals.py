@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog, invalidate_closed_stats
+from .models import Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+	invalidate_catalog()
+	# stats are keyed by product name, and a deleted product takes its sales along
+	invalidate_closed_stats()
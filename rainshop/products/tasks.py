@@ -0,0 +1,42 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import mail_admins
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# with a shared cache configured, a redelivered task does not alert twice
+ALERT_KEY = 'stock_alert:{product_id}:{quantity}'
+ALERT_KEY_TIMEOUT = 60 * 60 * 24
+
+
+@shared_task(ignore_result=True)
+def alert_low_stock(stock_levels):
+	"""
+	Warns the admins about products whose stock fell to STOCK_ALERT_THRESHOLD or below.
+	Only the change that crossed the threshold alerts, so later orders of an
+	already low product stay quiet.
+
+	@param stock_levels: list of [product id, quantity before, quantity after]
+	@return: ids of the products an alert was sent for
+	"""
+	threshold = settings.STOCK_ALERT_THRESHOLD
+	crossed = {
+		product_id: after for product_id, before, after in stock_levels
+		if after <= threshold < before
+		and cache.add(ALERT_KEY.format(product_id=product_id, quantity=after), True, ALERT_KEY_TIMEOUT)
+	}
+	if not crossed:
+		return []
+	names = dict(Product.objects.filter(id__in=crossed).values_list('id', 'name'))
+	lines = [
+		f'{names.get(product_id, "deleted product")} (#{product_id}): {quantity} left'
+		for product_id, quantity in sorted(crossed.items())
+	]
+	logger.warning('Low stock: %s', '; '.join(lines))
+	mail_admins('Low stock', '\n'.join(lines), fail_silently=True)
+	return sorted(crossed)
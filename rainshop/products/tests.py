@@ -1,3 +1,691 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import datetime
+import unittest
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from djmoney.money import Money
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.reverse import reverse as drf_reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from cart.models import Cart
+from rainshop import db_health, fast_json
+from rainshop.benchmarking import Recorder, asgi_views
+from rainshop.dates import start_of_day
+from rainshop.links import link_builder
+from rainshop.query_plans import ExplainQueriesContext
+from rainshop.query_profiling import QueryProfile, sql_template
+from orders.models import Order, OrderItem
+from . import benchmarks, importer, reports, rollup
+from .cache import catalog_cache, get_generation, get_stats_version
+from .models import Product, ProductDailySales
+
+
+class ProductDailySalesTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=10)
+		self.case = Product.objects.create(name='Case', cost=2, price=15, quantity=10)
+
+	def checkout(self, *lines):
+		for product, quantity in lines:
+			Cart.objects.create(user=self.user, product=product, quantity=quantity)
+		# the rollup is updated by a task queued on commit
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(reverse('orders:order-list-create'), {}, format='json')
+		self.assertEqual(response.status_code, 201, response.data)
+		return Order.objects.get(id=response.data['id'])
+
+	def pay(self, order):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.get(reverse('orders:order-payment-callback', args=(order.id,)))
+
+	def delete(self, url_name, order):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.delete(reverse(url_name, args=(order.id,)))
+
+	def rollup_rows(self):
+		return set(ProductDailySales.objects.values_list('product__name', 'status', 'quantity', 'gross', 'cost'))
+
+	def test_rollup_follows_order_status(self):
+		order = self.checkout((self.phone, 2), (self.case, 3))
+		self.assertEqual(self.rollup_rows(), {
+			('Phone', 'CREATED', 2, Decimal('500.00'), Decimal('200.00')),
+			('Case', 'CREATED', 3, Decimal('45.00'), Decimal('6.00')),
+		})
+
+		self.pay(order)
+		self.assertEqual(self.rollup_rows(), {
+			('Phone', 'CREATED', 0, Decimal('0.00'), Decimal('0.00')),
+			('Case', 'CREATED', 0, Decimal('0.00'), Decimal('0.00')),
+			('Phone', 'PAID', 2, Decimal('500.00'), Decimal('200.00')),
+			('Case', 'PAID', 3, Decimal('45.00'), Decimal('6.00')),
+		})
+
+	def test_rollup_keeps_cost_at_checkout(self):
+		order = self.checkout((self.phone, 2))
+		self.phone.cost = 130
+		self.phone.save()
+
+		self.pay(order)
+		self.assertEqual(self.rollup_rows(), {
+			('Phone', 'CREATED', 0, Decimal('0.00'), Decimal('0.00')),
+			('Phone', 'PAID', 2, Decimal('500.00'), Decimal('200.00')),
+		})
+		call_command('rebuild_daily_sales', stdout=StringIO())
+		self.assertEqual(self.rollup_rows(), {('Phone', 'PAID', 2, Decimal('500.00'), Decimal('200.00'))})
+
+	def test_rebuild_matches_incremental_rollup(self):
+		paid = self.checkout((self.phone, 1), (self.case, 2))
+		self.pay(paid)
+		cancelled = self.checkout((self.case, 1))
+		self.delete('orders:order-detail', cancelled)
+		incremental = {row for row in self.rollup_rows() if row[2] != 0}
+
+		call_command('rebuild_daily_sales', stdout=StringIO())
+		self.assertEqual(self.rollup_rows(), incremental)
+
+	def test_stats_reads_rollup_for_range(self):
+		paid = self.checkout((self.phone, 2), (self.case, 1))
+		self.pay(paid)
+		returned = self.checkout((self.case, 4))
+		self.delete('orders:order-return', returned)
+
+		today = timezone.localdate().isoformat()
+		response = self.client.get(reverse('products:product-stats'), {'start_date': today, 'end_date': today})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['total_orders'], 2)
+		self.assertEqual(response.data['total_ordered'], {'Phone': 2, 'Case': 5})
+		self.assertEqual(response.data['total_returned'], {'Phone': None, 'Case': 4})
+		monetary = response.data['orders_by_monetary_stats']
+		self.assertEqual(monetary['total_gross_income'], {'Phone': Decimal('500.00'), 'Case': Decimal('15.00')})
+		self.assertEqual(monetary['total_income'], {'Phone': Decimal('300.00'), 'Case': Decimal('13.00')})
+
+		response = self.client.get(reverse('products:product-stats'), {'start_date': '2000-01-01', 'end_date': '2000-01-02'})
+		self.assertEqual(response.data['total_orders'], 0)
+		self.assertEqual(response.data['total_ordered'], {})
+
+
+class StatsCrossCheckTests(APITestCase):
+	"""Compares the stats endpoint with sums over the raw order items on random orders."""
+	days = 10
+	statuses = ['CREATED', 'PAID', 'CANCELLED', 'RETURNED']
+
+	def setUp(self):
+		catalog_cache().clear()
+		rng = random.Random(24)
+		user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		products = [
+			Product.objects.create(
+				name=f'Product {number}',
+				cost=Decimal(rng.randint(100, 5000)) / 100,
+				price=Decimal(rng.randint(5000, 20000)) / 100,
+				quantity=1000
+			)
+			for number in range(8)
+		]
+		today = timezone.localdate()
+		self.first_day = today - datetime.timedelta(days=self.days - 1)
+		for _ in range(60):
+			order = Order.objects.create(user=user)
+			# multi item orders, sometimes with the same product twice
+			for product in rng.choices(products[:-1], k=rng.randint(1, 4)):
+				quantity = rng.randint(1, 5)
+				OrderItem.objects.create(
+					order=order,
+					product=product,
+					product_name=product.name,
+					product_price=product.price,
+					product_final_price=product.price * quantity,
+					product_cost=product.cost,
+					quantity=quantity
+				)
+			day = self.first_day + datetime.timedelta(days=rng.randrange(self.days))
+			Order.objects.filter(id=order.id).update(created_at=start_of_day(day) + datetime.timedelta(hours=rng.randint(0, 23)))
+		order_ids = list(Order.objects.values_list('id', flat=True))
+		# through the rollup like checkout and the status changes do
+		rollup.sync_orders(order_ids)
+		for order_id in order_ids:
+			Order.objects.filter(id=order_id).update(status=rng.choice(self.statuses))
+		rollup.sync_orders(order_ids)
+		self.rng = rng
+
+	def reference(self, start=None, end=None):
+		products = {}
+		for item in OrderItem.objects.select_related('order', 'product'):
+			day = timezone.localtime(item.order.created_at).date()
+			if start is not None and not start <= day <= end:
+				continue
+			figures = products.setdefault(item.product.name, {'ordered': 0, 'returned': None, 'gross': None, 'cost': None})
+			figures['ordered'] += item.quantity
+			if item.order.status in ('RETURNED', 'CANCELLED'):
+				figures['returned'] = (figures['returned'] or 0) + item.quantity
+			if item.order.status == 'PAID':
+				figures['gross'] = (figures['gross'] or 0) + item.product_final_price.amount
+				figures['cost'] = (figures['cost'] or 0) + item.quantity * item.product_cost.amount
+		if start is None:
+			for name in Product.objects.exclude(name__in=products).values_list('name', flat=True):
+				products[name] = {'ordered': None, 'returned': None, 'gross': None, 'cost': None}
+		orders = [
+			order for order in Order.objects.all()
+			if start is None or start <= timezone.localtime(order.created_at).date() <= end
+		]
+		return {
+			'total_orders'            : len(orders),
+			'total_ordered'           : {name: figures['ordered'] for name, figures in products.items()},
+			'total_returned'          : {name: figures['returned'] for name, figures in products.items()},
+			'orders_by_status'        : {
+				'total_created'  : sum(order.status == 'CREATED' for order in orders),
+				'total_returned' : sum(order.status == 'RETURNED' for order in orders),
+				'total_cancelled': sum(order.status == 'CANCELLED' for order in orders),
+				'total_payed'    : sum(order.status == 'PAID' for order in orders),
+			},
+			'orders_by_monetary_stats': {
+				'total_gross_income': {name: figures['gross'] for name, figures in products.items()},
+				'total_cost'        : {name: figures['cost'] for name, figures in products.items()},
+				'total_income'      : {
+					name: None if figures['gross'] is None else figures['gross'] - figures['cost']
+					for name, figures in products.items()
+				},
+			},
+		}
+
+	def test_stats_match_order_items(self):
+		ranges = [(None, None), (self.first_day, self.first_day + datetime.timedelta(days=self.days - 1))]
+		for _ in range(5):
+			start = self.first_day + datetime.timedelta(days=self.rng.randrange(self.days))
+			ranges.append((start, start + datetime.timedelta(days=self.rng.randrange(4))))
+		for start, end in ranges:
+			with self.subTest(start=start, end=end):
+				params = {} if start is None else {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+				response = self.client.get(reverse('products:product-stats'), params)
+				self.assertEqual(response.status_code, 200)
+				self.assertEqual(response.data, self.reference(start, end))
+
+	def test_series_match_order_items(self):
+		today = timezone.localdate()
+		for granularity in reports.GRANULARITIES:
+			for start, end in [(self.first_day, today), (self.first_day, today - datetime.timedelta(days=2))]:
+				with self.subTest(granularity=granularity, start=start, end=end):
+					periods = {}
+					for offset in range((end - start).days + 1):
+						day = start + datetime.timedelta(days=offset)
+						periods.setdefault(reports.period_start(day, granularity), []).append(day)
+					expected = []
+					for period, days in sorted(periods.items()):
+						figures = self.reference(days[0], days[-1])
+						if figures['total_orders']:
+							expected.append({'period': period.isoformat(), **figures})
+
+					response = self.client.get(reverse('products:product-stats'), {
+						'start_date': start.isoformat(), 'end_date': end.isoformat(), 'granularity': granularity
+					})
+					self.assertEqual(response.data['series'], expected)
+					self.assertEqual(
+						{key: value for key, value in response.data.items() if key not in ('series', 'granularity')},
+						self.reference(start, end)
+					)
+
+	def test_unknown_granularity(self):
+		response = self.client.get(reverse('products:product-stats'), {'granularity': 'year'})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('granularity', response.data)
+
+	def test_query_count_does_not_depend_on_products(self):
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get(reverse('products:product-stats'))
+		self.assertEqual(len(queries), 2)
+
+	def test_closed_periods_are_cached_until_a_past_order_changes(self):
+		end = timezone.localdate() - datetime.timedelta(days=1)
+		params = {'start_date': self.first_day.isoformat(), 'end_date': end.isoformat(), 'granularity': 'day'}
+		first = self.client.get(reverse('products:product-stats'), params).data
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual(self.client.get(reverse('products:product-stats'), params).data, first)
+		self.assertEqual(len(queries), 0)
+
+		order = Order.objects.filter(created_at__lt=start_of_day(end), status='CREATED').first()
+		Order.objects.filter(id=order.id).update(status='PAID')
+		with self.captureOnCommitCallbacks(execute=True):
+			rollup.sync_orders([order.id])
+		response = self.client.get(reverse('products:product-stats'), params)
+		self.assertEqual(response.data['orders_by_status']['total_payed'], first['orders_by_status']['total_payed'] + 1)
+
+
+class CatalogCacheTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		with self.captureOnCommitCallbacks(execute=True):
+			self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=10)
+
+	def list_products(self, **params):
+		response = self.client.get(reverse('products:products-list-create'), params)
+		self.assertEqual(response.status_code, 200)
+		return response.data
+
+	def test_repeated_pages_are_served_from_cache(self):
+		first = self.list_products(limit=10)
+		self.client.get(reverse('products:product-detail', args=(self.phone.id,)))
+		with self.assertNumQueries(0):
+			self.assertEqual(self.list_products(limit=10), first)
+			self.client.get(reverse('products:product-detail', args=(self.phone.id,)))
+		# a miss costs the ETag validators, the count and the page
+		with self.assertNumQueries(3):
+			self.list_products(limit=10, offset=0)
+
+	def test_product_changes_invalidate_cached_pages(self):
+		self.list_products()
+		self.client.get(reverse('products:product-detail', args=(self.phone.id,)))
+		self.client.force_authenticate(self.user)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.put(
+				reverse('products:product-detail', args=(self.phone.id,)),
+				{'price': '199.00'},
+				format='json'
+			)
+
+		self.assertEqual(self.list_products()['results'][0]['price'], '199.00')
+		detail = self.client.get(reverse('products:product-detail', args=(self.phone.id,)))
+		self.assertEqual(detail.data['price'], '199.00')
+
+	def test_checkout_invalidates_cached_stock(self):
+		self.list_products()
+		self.client.force_authenticate(self.user)
+		Cart.objects.create(user=self.user, product=self.phone, quantity=4)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('orders:order-list-create'), {}, format='json')
+
+		self.assertEqual(self.list_products()['results'][0]['quantity'], 6)
+
+
+class ConditionalGetTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=10)
+
+	def test_list_not_modified_until_a_product_changes(self):
+		url = reverse('products:products-list-create')
+		etag = self.client.get(url)['ETag']
+
+		# served from the catalog cache, validators included
+		with self.assertNumQueries(0):
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.put(reverse('products:product-detail', args=(self.phone.id,)), {'price': '199.00'}, format='json')
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_detail_last_modified(self):
+		url = reverse('products:product-detail', args=(self.phone.id,))
+		response = self.client.get(url)
+		self.assertIn('no-cache', response['Cache-Control'])
+
+		catalog_cache().clear()
+		with self.assertNumQueries(1):
+			not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+		self.assertEqual(not_modified.status_code, 304)
+		self.assertEqual(not_modified.content, b'')
+
+	def test_cart_revalidates_on_product_change(self):
+		Cart.objects.create(user=self.user, product=self.phone, quantity=1)
+		url = reverse('cart:cart-list-create')
+		etag = self.client.get(url)['ETag']
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+		Product.objects.filter(id=self.phone.id).update(quantity=0, updated_at=timezone.now())
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CursorPaginationTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		for i in range(7):
+			Product.objects.create(name=f'Product {i}', cost=1, price=2, quantity=3)
+		# ties on created_at have to be broken by id
+		Product.objects.filter(name__in=['Product 2', 'Product 3', 'Product 4']).update(
+			created_at=Product.objects.get(name='Product 2').created_at
+		)
+
+	def test_walks_whole_catalog_by_cursor(self):
+		url = reverse('products:products-list-create') + '?pagination=cursor&limit=3'
+		pages = []
+		while url:
+			response = self.client.get(url)
+			self.assertEqual(response.status_code, 200)
+			self.assertNotIn('count', response.data)
+			pages.append([product['name'] for product in response.data['results']])
+			url = response.data['next']
+		self.assertEqual(pages, [
+			['Product 0', 'Product 1', 'Product 2'],
+			['Product 3', 'Product 4', 'Product 5'],
+			['Product 6'],
+		])
+
+		previous = self.client.get(response.data['previous'])
+		self.assertEqual([product['name'] for product in previous.data['results']],
+						 ['Product 3', 'Product 4', 'Product 5'])
+
+	def test_limit_offset_is_kept_by_default(self):
+		response = self.client.get(reverse('products:products-list-create'), {'limit': 2, 'offset': 2})
+		self.assertEqual(response.data['count'], 7)
+		self.assertEqual(len(response.data['results']), 2)
+
+	def test_invalid_cursor(self):
+		response = self.client.get(reverse('products:products-list-create'), {'cursor': 'garbage'})
+		self.assertEqual(response.status_code, 404)
+
+
+class SparseFieldsetTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		self.phone = Product.objects.create(name='Phone', cost=100, price=250, quantity=5)
+
+	def test_returns_and_selects_only_requested_fields(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('products:products-list-create'), {'fields': 'id,name,price'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+		select = [query['sql'] for query in queries.captured_queries if 'FROM "products"' in query['sql']][-1]
+		self.assertIn('"price_currency"', select)
+		self.assertNotIn('"cost"', select)
+
+	def test_detail_view(self):
+		response = self.client.get(
+			reverse('products:product-detail', args=(self.phone.id,)), {'fields': 'name,self'}
+		)
+		self.assertEqual(response.data, {
+			'name': 'Phone', 'self': f'http://testserver/api/v1/products/{self.phone.id}/'
+		})
+
+	def test_unknown_field(self):
+		response = self.client.get(reverse('products:products-list-create'), {'fields': 'id,secret'})
+		self.assertEqual(response.status_code, 400)
+
+
+class LinkBuilderTests(APITestCase):
+
+	def test_matches_reverse(self):
+		request = Request(APIRequestFactory().get('/api/v1/products/', secure=True))
+		builder = link_builder(request)
+
+		for view_name, pk in (('products:product-detail', 7), ('orders:order-detail', 12345), ('cart:cart-detail', 1)):
+			self.assertEqual(builder.url(view_name, pk), drf_reverse(view_name, args=(pk,), request=request))
+		self.assertTrue(builder.url('products:product-detail', 7).startswith('https://testserver/'))
+		self.assertIs(link_builder(request), builder)
+
+	def test_benchmark(self):
+		report = benchmarks.self_links(Recorder(), rounds=2, page_size=5)
+		self.assertEqual(set(report['steps']), set(benchmarks.LINK_STEPS))
+		self.assertEqual(report['steps']['link_builder']['requests'], 2)
+
+
+class ProductFilterTests(APITestCase):
+
+	def setUp(self):
+		catalog_cache().clear()
+		Product.objects.create(name='Red Phone', cost=100, price=250, quantity=5)
+		Product.objects.create(name='Phone case', cost=2, price=15, quantity=0)
+		Product.objects.create(name='Charger', cost=5, price=30, quantity=10)
+
+	def names(self, **params):
+		response = self.client.get(reverse('products:products-list-create'), params)
+		self.assertEqual(response.status_code, 200)
+		return sorted(product['name'] for product in response.data['results'])
+
+	def test_filters(self):
+		self.assertEqual(self.names(search='phone'), ['Phone case', 'Red Phone'])
+		self.assertEqual(self.names(search='phone', in_stock='true'), ['Red Phone'])
+		self.assertEqual(self.names(min_price='20', max_price='250'), ['Charger', 'Red Phone'])
+		self.assertEqual(self.names(search='100%'), [])
+
+	def test_invalid_price(self):
+		response = self.client.get(reverse('products:products-list-create'), {'min_price': 'cheap'})
+		self.assertEqual(response.status_code, 400)
+
+	@unittest.skipUnless(connection.vendor == 'postgresql', 'the trigram index only exists on Postgres')
+	def test_search_uses_trigram_index(self):
+		with ExplainQueriesContext(connection) as plans:
+			self.client.get(reverse('products:products-list-create'), {'search': 'phone'})
+		self.assertEqual(plans.table_scans(['products']), [])
+
+
+class FastJSONTests(APITestCase):
+	payload = {
+		'results': [{'name': 'Caf\u00e9 \u2028', 'price': Decimal('12.50'), 'quantity': 3, 'tags': ('a', 'b')}],
+		'total'  : {'Phone': Decimal('300.00'), 'Case': None},
+	}
+
+	def test_matches_drf_renderer(self):
+		expected = JSONRenderer().render(self.payload)
+		self.assertEqual(fast_json.FastJSONRenderer().render(self.payload), expected)
+		with mock.patch.object(fast_json, 'orjson', None):
+			self.assertEqual(fast_json.FastJSONRenderer().render(self.payload), expected)
+		self.assertEqual(
+			fast_json.FastJSONRenderer().render(self.payload, 'application/json; indent=4'),
+			JSONRenderer().render(self.payload, 'application/json; indent=4')
+		)
+
+	def test_money_and_datetimes(self):
+		moment = datetime.datetime(2021, 11, 7, 14, 19, 5, 123456, tzinfo=timezone.utc)
+		rendered = fast_json.FastJSONRenderer().render({
+			'price': Money('9.99', 'USD'), 'at': moment, 'day': moment.date(), 1: 'int key'
+		})
+		self.assertEqual(
+			json.loads(rendered),
+			# like a serializer field: current time zone, DATETIME_FORMAT
+			{'price': 9.99, 'at': timezone.localtime(moment).strftime('%Y-%m-%dT%H:%M:%S%z'),
+			 'day': '2021-11-07', '1': 'int key'}
+		)
+
+	def test_parser(self):
+		parser = fast_json.FastJSONParser()
+		self.assertEqual(parser.parse(BytesIO('{"name": "Caf\u00e9", "quantity": 2}'.encode('utf-8'))),
+						 {'name': 'Caf\u00e9', 'quantity': 2})
+		with self.assertRaises(ParseError):
+			parser.parse(BytesIO(b'{"name": NaN}'))
+
+	def test_benchmark(self):
+		report = benchmarks.rendering(Recorder(), rounds=2, page_size=5)
+		self.assertEqual(set(report['steps']), set(benchmarks.RENDER_STEPS))
+
+
+class ImportProductsTests(APITestCase):
+	fixture_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'products.json')
+
+	def import_fixture(self, **kwargs):
+		out = StringIO()
+		call_command('import_products', self.fixture_path, stdout=out, **kwargs)
+		return out.getvalue()
+
+	def test_imports_fixture_and_skips_unchanged_rows(self):
+		output = self.import_fixture(chunk_size=4)
+		self.assertIn('9 created, 0 updated, 0 unchanged', output)
+		self.assertIn('rows/s', output)
+		product = Product.objects.get(id=6)
+		self.assertEqual(product.name, 'CENTER-AL - AMBROSIA ACANTHICARPA POLLEN')
+		self.assertEqual(product.cost.amount, Decimal('94.00'))
+		self.assertEqual(product.created_at.year, 2020)
+		# ids come from the file, new products must not collide with them
+		self.assertGreater(Product.objects.create(name='New', cost=1, price=2, quantity=1).id, 6)
+
+		generation, stats_version = get_generation(), get_stats_version()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertIn('0 created, 0 updated, 9 unchanged', self.import_fixture())
+		self.assertEqual((get_generation(), get_stats_version()), (generation, stats_version))
+
+	def test_updates_changed_rows(self):
+		self.import_fixture()
+		Product.objects.filter(id=6).update(quantity=1)
+		generation, stats_version = get_generation(), get_stats_version()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertIn('0 created, 1 updated, 8 unchanged', self.import_fixture())
+		self.assertEqual(Product.objects.get(id=6).quantity, 84)
+		self.assertNotEqual(get_generation(), generation)
+		# cached stats of closed periods show the imported names
+		self.assertNotEqual(get_stats_version(), stats_version)
+
+	def test_csv_and_ndjson(self):
+		csv_rows = StringIO(
+			'id,name,cost,price,quantity\n'
+			'1,Phone,100,250.5,3\n'
+			'2,Case,2,15,10\n'
+		)
+		counts = importer.import_products(csv_rows, file_format='csv')
+		self.assertEqual((counts['created'], counts['updated']), (2, 0))
+		self.assertEqual(Product.objects.get(id=1).price.amount, Decimal('250.50'))
+
+		ndjson_rows = StringIO(
+			'{"id": 1, "name": "Phone", "cost": 100, "price": 250.50, "quantity": 3}\n'
+			'{"id": 2, "name": "Case", "cost": 2, "price": 15, "quantity": 7}\n'
+		)
+		counts = importer.import_products(ndjson_rows)
+		self.assertEqual((counts['updated'], counts['unchanged']), (1, 1))
+		self.assertEqual(Product.objects.get(id=2).quantity, 7)
+
+	def test_invalid_record_rolls_back(self):
+		rows = StringIO('[{"id": 1, "name": "Phone", "cost": 1, "price": 2, "quantity": 3}, {"id": 2, "name": "Case"}]')
+		with self.assertRaisesMessage(importer.ProductImportError, 'Record 2: cost must be a number'):
+			importer.import_products(rows, chunk_size=1)
+		self.assertFalse(Product.objects.exists())
+
+
+class AsyncReadTests(TransactionTestCase):
+	"""Reads over ASGI run in worker threads with their own connections, so the data has to be committed."""
+	# the reads go to the replica when one is configured
+	databases = '__all__'
+
+	def setUp(self):
+		catalog_cache().clear()
+		self.token, self.product_ids = benchmarks.seed_reads(3, cart_lines=2)
+
+	@override_settings(QUERY_PROFILING_SAMPLE_RATE=1)
+	async def test_catalog_reads_over_asgi(self):
+		with asgi_views():
+			products = await self.async_client.get(reverse('products:products-list-create'))
+			cart = await self.async_client.get(reverse('cart:cart-list-create'), authorization=f'Token {self.token}')
+
+		self.assertEqual(products.status_code, 200)
+		self.assertEqual(products.json()['count'], 3)
+		self.assertEqual(len(cart.json()['results']), 2)
+		# queries of the worker threads are profiled too
+		self.assertRegex(cart['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+	def test_views_are_only_async_over_asgi(self):
+		path = reverse('products:products-list-create')
+		view = resolve(path).func
+		self.assertFalse(asyncio.iscoroutinefunction(view))
+		with asgi_views():
+			self.assertTrue(asyncio.iscoroutinefunction(resolve(path).func))
+			self.assertEqual(resolve(reverse('products:product-detail', args=(1,))).url_name, 'product-detail')
+		# the URL conf itself was not touched
+		self.assertIs(resolve(path).func, view)
+
+	def test_benchmark(self):
+		report = benchmarks.read_concurrency(self.token, self.product_ids, requests=8, concurrency=4, db_latency=0)
+		self.assertEqual(report['wsgi']['requests'], 8)
+		self.assertEqual(report['asgi']['concurrency'], 4)
+
+
+class ConnectionHealthTests(TransactionTestCase):
+
+	def setUp(self):
+		connection.ensure_connection()
+
+	def test_idle_unusable_connection_is_closed(self):
+		connection.idle_since = None
+		with mock.patch.object(connection, 'is_usable', return_value=False), \
+				mock.patch.object(connection, 'close') as close:
+			db_health.check_connections()
+		close.assert_called_once_with()
+
+	@override_settings(DB_HEALTH_CHECK_IDLE_SECONDS=30)
+	def test_recently_used_connection_is_not_pinged(self):
+		db_health.mark_connections_used()
+		with mock.patch.object(connection, 'is_usable') as is_usable:
+			db_health.check_connections()
+		is_usable.assert_not_called()
+
+	def test_middleware_unused_without_persistent_connections(self):
+		with self.assertRaises(MiddlewareNotUsed):
+			db_health.ConnectionHealthMiddleware(lambda request: None)
+
+	def test_benchmark(self):
+		token, product_ids = benchmarks.seed_reads(3, cart_lines=2)
+		report = benchmarks.runtime(token, product_ids, requests=8, threads=2, connect_latency=0, db_latency=0)
+		self.assertEqual(set(report), set(benchmarks.RUNTIME_PROFILES))
+		self.assertEqual(report['gthread']['requests'], 8)
+		self.assertEqual(report['gthread_persistent']['concurrency'], 2)
+
+
+class QueryProfilingTests(APITestCase):
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(username='buyer', password='buyer')
+		self.client.force_authenticate(self.user)
+		Product.objects.create(name='Phone', cost=100, price=250, quantity=10)
+
+	def test_disabled_by_default(self):
+		response = self.client.get(reverse('products:products-list-create'), {'limit': 1})
+		self.assertNotIn('Server-Timing', response)
+
+	@override_settings(QUERY_PROFILING_SAMPLE_RATE=1, QUERY_PROFILING_DUPLICATE_THRESHOLD=2)
+	def test_reports_queries_and_duplicates(self):
+		with self.assertLogs('rainshop.query_profiling', 'INFO') as logs:
+			response = self.client.get(reverse('products:products-list-create'), {'limit': 1, 'offset': 0})
+		self.assertEqual(response.status_code, 200)
+		self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="\d+ queries", db-slowest;dur=[0-9.]+')
+		record = json.loads(logs.records[0].getMessage())
+		self.assertEqual(record['view'], 'products:products-list-create')
+		self.assertEqual(record['status'], 200)
+		self.assertGreaterEqual(record['db_queries'], 1)
+		self.assertEqual(record['duplicates'], [])
+
+
+	def test_detects_repeated_statements(self):
+		Product.objects.create(name='Case', cost=2, price=15, quantity=10)
+		profile = QueryProfile()
+		with connection.execute_wrapper(profile):
+			for product_id in Product.objects.values_list('id', flat=True):
+				Product.objects.filter(id__in=[product_id, product_id + 1]).count()
+		self.assertEqual(profile.count, 3)
+		[(sql, count)] = profile.duplicates(2)
+		self.assertEqual(count, 2)
+		self.assertIn('IN (%s)', sql)
+
+	def test_sql_template(self):
+		self.assertEqual(
+			sql_template('SELECT * FROM "products" WHERE "id" IN (%s, %s, %s)'),
+			'SELECT * FROM "products" WHERE "id" IN (%s)'
+		)
+		self.assertEqual(sql_template('INSERT INTO t (a) VALUES (%s), (%s)'), 'INSERT INTO t (a) VALUES (%s)')
@@ -1,10 +1,13 @@
 from . import views
 from django.urls import path
 
+from rainshop.async_views import async_view
+from rainshop.db_routers import read_from_replica
+
 app_name = 'products'
 urlpatterns = [
-	path('', views.ProductListCreateView.as_view(), name='products-list-create'),
-	path('<int:pk>/', views.ProductRetrieveUpdateDestroyView.as_view(), name='product-detail'),
-	path('stats/', views.stats, name='product-stats'),
+	path('', async_view(read_from_replica(views.ProductListCreateView.as_view())), name='products-list-create'),
+	path('<int:pk>/', async_view(views.ProductRetrieveUpdateDestroyView.as_view()), name='product-detail'),
+	path('stats/', async_view(read_from_replica(views.stats)), name='product-stats'),
 
 ]
\ No newline at end of file
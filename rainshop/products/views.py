@@ -1,17 +1,28 @@
 import datetime
 
-from django.db.models import Count, Q, Sum
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, permissions, decorators, status
 from rest_framework.response import Response
 
-from orders.models import Order
+from rainshop.conditional import ConditionalGetMixin
+from rainshop.custom_drf_errors import CustomError
+from rainshop.fieldsets import SparseFieldsetViewMixin, fields_parameter
+from rainshop.pagination import OptInCursorPagination, cursor_pagination_parameters
+from .cache import cached_catalog_response
+from .filters import ProductFilter
 from .models import Product
+from .reports import GRANULARITIES, stats_report
 from .serializers import ProductSerializer, ProductUpdateSerializer
 
 
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(ConditionalGetMixin, SparseFieldsetViewMixin, generics.ListCreateAPIView):
+	pagination_class = OptInCursorPagination
+	sparse_fieldset_required = ['created_at']
+	conditional_private = False
+	filter_backends = (DjangoFilterBackend,)
+	filterset_class = ProductFilter
 
 	def get_queryset(self):
 		if getattr(self, "swagger_fake_view", False):
@@ -24,10 +35,11 @@ class ProductListCreateView(generics.ListCreateAPIView):
 		tags=['Products'],
 		operation_summary='List products',
 		operation_id='get_products_list',
+		manual_parameters=cursor_pagination_parameters + [fields_parameter],
 
 	)
 	def get(self, request, *args, **kwargs):
-		return self.list(request, *args, **kwargs)
+		return cached_catalog_response(request, lambda: self.list(request, *args, **kwargs))
 
 	@swagger_auto_schema(
 		request_body=ProductSerializer,
@@ -59,19 +71,23 @@ class ProductListCreateView(generics.ListCreateAPIView):
 		return [permission() for permission in permission_classes]
 
 
-class ProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class ProductRetrieveUpdateDestroyView(ConditionalGetMixin, SparseFieldsetViewMixin,
+									   generics.RetrieveUpdateDestroyAPIView):
 	queryset = Product.objects.all()
 	serializer_class = ProductSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	sparse_fieldset_required = ['updated_at']
+	conditional_private = False
 	http_method_names = ['get', 'put', 'delete', 'head', 'options', 'trace']
 
 	@swagger_auto_schema(
 		operation_id='retrieve_product',
 		operation_summary='Get a single product',
 		tags=['Products'],
+		manual_parameters=[fields_parameter],
 	)
 	def get(self, request, *args, **kwargs):
-		return self.retrieve(request, *args, **kwargs)
+		return cached_catalog_response(request, lambda: self.retrieve(request, *args, **kwargs))
 
 	@swagger_auto_schema(
 		operation_id='update_product',
@@ -122,6 +138,12 @@ class ProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
 			in_=openapi.IN_QUERY,
 			description='End date for the report.',
 			type=openapi.FORMAT_DATE),
+		openapi.Parameter(
+			'granularity',
+			in_=openapi.IN_QUERY,
+			description='Also return the figures per period as "series", one entry per day, week or month with orders.',
+			type=openapi.TYPE_STRING,
+			enum=GRANULARITIES),
 	],
 	responses={200: openapi.Schema(
 		type=openapi.TYPE_OBJECT,
@@ -135,6 +157,10 @@ class ProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
 			'orders_by_monetary_stats': openapi.Schema(
 				type=openapi.TYPE_OBJECT
 			),
+			'series'                  : openapi.Schema(
+				type=openapi.TYPE_ARRAY,
+				items=openapi.Schema(type=openapi.TYPE_OBJECT)
+			),
 		}
 	)}
 )
@@ -146,91 +172,15 @@ def stats(request):
 	try:
 		d_start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
 		d_end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
-		date_filter = Q(order_items__order__created_at__date__gte=d_start,
-						order_items__order__created_at__date__lte=d_end)
-		date_filter_orders = Q(created_at__date__gte=d_start, created_at__date__lte=d_end)
 	except Exception:
-		date_filter = None
-
-	total_ordered = Sum('order_items__quantity')
-	total_returned = Sum('order_items__quantity', filter=Q(order_items__order__status__in=['RETURNED', 'CANCELLED']))
-
-	total_created = Count('id', filter=Q(status='CREATED'))
-	total_all_statuses = Count('id')
-	total_cancelled = Count('id', filter=Q(status='CANCELLED'))
-	total_payed = Count('id', filter=Q(status='PAYED'))
-	total_returned_orders = Count('id', filter=Q(status='RETURNED'))
-
-	total_gross_income = Sum(
-		'order_items__order__order_price',
-		filter=Q(order_items__order__status__in=['PAYED'])
-	)
-	total_cost = Sum(
-		'order_items__product__cost',
-		filter=Q(order_items__order__status__in=['PAYED'])
-	)
-	if date_filter:
-		products = Product.objects.prefetch_related(
-			'order_items', 'order_items__order'
-		).filter(date_filter).annotate(
-			total_ordered=total_ordered,
-			total_returned=total_returned,
-			total_gross_income=total_gross_income,
-			total_cost=total_cost
-		)
-		orders = Order.objects.filter(date_filter_orders).aggregate(
-			total_created=total_created,
-			total_cancelled=total_cancelled,
-			total_payed=total_payed,
-			total_all_statuses=total_all_statuses,
-			total_returned_orders=total_returned_orders
-		)
-	else:
-		products = Product.objects.prefetch_related(
-			'order_items', 'order_items__order'
-		).annotate(
-			total_ordered=total_ordered,
-			total_returned=total_returned,
-			total_gross_income=total_gross_income,
-			total_cost=total_cost
+		d_start = d_end = None
+	granularity = request.GET.get('granularity', None)
+	if granularity is not None and granularity not in GRANULARITIES:
+		raise CustomError(
+			f'Must be one of: {", ".join(GRANULARITIES)}',
+			'granularity',
+			status.HTTP_400_BAD_REQUEST
 		)
-		orders = Order.objects.aggregate(
-			total_created=total_created,
-			total_cancelled=total_cancelled,
-			total_payed=total_payed,
-			total_all_statuses=total_all_statuses,
-			total_returned_orders=total_returned_orders
-		)
-	total_ordered_data = {}
-	total_returned_data = {}
-	total_gross_income_data = {}
-	total_cost_data = {}
-	total_clean_income = {}
-
-	for product in products:
-		total_ordered_data[product.name] = product.total_ordered
-		total_returned_data[product.name] = product.total_returned
-		total_gross_income_data[product.name] = product.total_gross_income
-		total_cost_data[product.name] = product.total_cost
-		if product.total_cost is not None and product.total_gross_income is not None:
-			total_clean_income[product.name] = product.total_gross_income - product.total_cost
-		if product.total_gross_income is None:
-			total_clean_income[product.name] = None
-
-	res = {
-		'total_orders': orders['total_all_statuses'],
-		'total_ordered': total_ordered_data,
-		'total_returned': total_returned_data,
-		'orders_by_status': {
-			'total_created': orders['total_created'],
-			'total_returned': orders['total_returned_orders'],
-			'total_cancelled': orders['total_cancelled'],
-			'total_payed': orders['total_payed'],
-		},
-		'orders_by_monetary_stats': {
-			'total_gross_income': total_gross_income_data,
-			'total_cost': total_cost_data,
-			'total_income': total_clean_income
-		}
-	}
+
+	res = stats_report(d_start, d_end, granularity)
 	return Response(res, status.HTTP_200_OK)
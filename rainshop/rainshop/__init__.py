@@ -0,0 +1,4 @@
+# load the celery app with Django, so shared tasks are bound to it
+from .celery_init import app as celery_app
+
+__all__ = ('celery_app',)
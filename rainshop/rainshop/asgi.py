@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rainshop.settings')
+# the read views become async views, see rainshop.async_views
+os.environ.setdefault('SERVE_ASGI', 'True')
 
 application = get_asgi_application()
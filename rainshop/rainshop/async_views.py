@@ -0,0 +1,77 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+
+from .db_health import check_connections, mark_connections_used, persistent_connections
+
+# only these run in the thread pool, writes keep Django's default single thread
+POOLED_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _run(view, request, *args, **kwargs):
+	response = view(request, *args, **kwargs)
+	if hasattr(response, 'render') and callable(response.render):
+		response.render()
+	return response
+
+
+def _run_pooled(view, request, *args, **kwargs):
+	# a pool thread keeps its connection between requests, so apply CONN_MAX_AGE
+	# and drop broken connections like request_started/request_finished do
+	close_old_connections()
+	health_checks = persistent_connections() and settings.DB_HEALTH_CHECK_IDLE_SECONDS is not None
+	if health_checks:
+		check_connections()
+	try:
+		return _run(view, request, *args, **kwargs)
+	finally:
+		if health_checks:
+			mark_connections_used()
+		close_old_connections()
+
+
+_run_in_request_thread = sync_to_async(_run, thread_sensitive=True)
+_run_in_pool = sync_to_async(_run_pooled, thread_sensitive=False)
+
+
+def async_view(view):
+	"""
+	Turns a sync read view (e.g. a DRF view's as_view()) into an async one when
+	the app is served over ASGI (settings.SERVE_ASGI, set by rainshop.asgi).
+	Django 3.2 has no async ORM, and under ASGI it runs every sync view on one
+	shared thread, one request at a time. Read requests served over ASGI instead
+	run, rendering included, in the event loop's thread pool, so one worker serves
+	as many concurrent reads as the pool has threads, each thread with its own
+	database connection. Writes run on the request's thread as before. Under WSGI
+	the view is returned unchanged: an async view would only add an event loop
+	round trip to every request there.
+
+	@param view: the sync view function
+	@return: async view function keeping the view's attributes (csrf_exempt etc.),
+		or the view itself under WSGI, marked so make_async_view can be applied later
+	"""
+	view.pooled_reads = True
+	if not settings.SERVE_ASGI:
+		return view
+	return make_async_view(view)
+
+
+def make_async_view(view):
+	"""
+	The async view of async_view, regardless of settings.SERVE_ASGI, e.g. for
+	benchmarks serving the ASGI handler from a WSGI process.
+
+	@param view: the sync view function
+	@return: async view function keeping the view's attributes
+	"""
+
+	@functools.wraps(view)
+	async def wrapped(request, *args, **kwargs):
+		if isinstance(request, ASGIRequest) and request.method in POOLED_METHODS:
+			return await _run_in_pool(view, request, *args, **kwargs)
+		return await _run_in_request_thread(view, request, *args, **kwargs)
+
+	return wrapped
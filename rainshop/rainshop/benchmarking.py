@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import types
+import time
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.db import connection, connections
+from django.test.utils import (
+	override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+
+from .async_views import make_async_view
+from .query_profiling import QueryProfile
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values, pct):
+	"""Linear interpolation between the closest ranks, like numpy's default."""
+	if not values:
+		return None
+	ordered = sorted(values)
+	rank = (len(ordered) - 1) * pct / 100
+	low = int(rank)
+	high = min(low + 1, len(ordered) - 1)
+	return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class BenchmarkError(Exception):
+	pass
+
+
+class Recorder:
+	"""
+	Collects latency and query count samples per named step.
+
+	Usage:
+		response = recorder.call('checkout', client.post, url, {}, expected=(201,))
+	"""
+
+	def __init__(self):
+		self.samples = {}
+		self.started = None
+		self.finished = None
+
+	def start(self):
+		self.started = time.perf_counter()
+
+	def stop(self):
+		self.finished = time.perf_counter()
+
+	def call(self, step, func, *args, expected=None, **kwargs):
+		profile = QueryProfile()
+		with ExitStack() as stack:
+			for conn in connections.all():
+				stack.enter_context(conn.execute_wrapper(profile))
+			started = time.perf_counter()
+			result = func(*args, **kwargs)
+			elapsed = time.perf_counter() - started
+		status_code = getattr(result, 'status_code', None)
+		if expected is not None and status_code not in expected:
+			raise BenchmarkError(f'{step}: unexpected status {status_code}: {getattr(result, "data", None)}')
+		latencies, queries = self.samples.setdefault(step, ([], []))
+		latencies.append(elapsed)
+		queries.append(profile.count)
+		return result
+
+	def summary(self):
+		steps = {}
+		for step, (latencies, queries) in self.samples.items():
+			summary = {
+				'requests'      : len(latencies),
+				'mean_ms'       : round(sum(latencies) / len(latencies) * 1000, 3),
+				'queries_mean'  : round(sum(queries) / len(queries), 2),
+				'queries_max'   : max(queries),
+				'throughput_rps': round(len(latencies) / sum(latencies), 1) if sum(latencies) else None,
+			}
+			for pct in PERCENTILES:
+				summary[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 3)
+			steps[step] = summary
+		requests = sum(len(latencies) for latencies, _ in self.samples.values())
+		seconds = (self.finished or time.perf_counter()) - self.started if self.started else 0
+		return {
+			'steps': steps,
+			'total': {
+				'requests'      : requests,
+				'seconds'       : round(seconds, 3),
+				'throughput_rps': round(requests / seconds, 1) if seconds else None,
+			},
+		}
+
+
+def environment():
+	return {
+		'date'    : timezone.now().isoformat(),
+		'python'  : platform.python_version(),
+		'django'  : django.get_version(),
+		'database': connection.vendor,
+		'machine' : platform.machine(),
+	}
+
+
+def compare(report, baseline, tolerance):
+	"""
+	Lists the steps that got slower or run more queries than in the baseline.
+	Latency is compared on p95 with a relative tolerance; query counts are
+	deterministic, so any increase is reported.
+
+	@return: list of human readable regressions, empty when there are none
+	"""
+	regressions = []
+	for step, current in report['steps'].items():
+		previous = baseline.get('steps', {}).get(step)
+		if previous is None:
+			continue
+		if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+			regressions.append(
+				f'{step}: p95 {current["p95_ms"]:.2f}ms, baseline {previous["p95_ms"]:.2f}ms'
+			)
+		if current['queries_mean'] > previous['queries_mean']:
+			regressions.append(
+				f'{step}: {current["queries_mean"]} queries per request, baseline {previous["queries_mean"]}'
+			)
+	return regressions
+
+
+def write_report(path, report):
+	with open(path, 'w') as output:
+		json.dump(report, output, indent=2, sort_keys=True)
+		output.write('\n')
+
+
+def load_report(path):
+	with open(path) as source:
+		return json.load(source)
+
+
+@contextmanager
+def isolated_database(keepdb=False, verbosity=0, on_disk=False):
+	"""
+	Runs the block against a freshly migrated test database, exactly like the test
+	runner does, so benchmarks never touch the configured database's data.
+	DEBUG is switched off like in the test runner, so the debug toolbar and
+	query logging do not distort the numbers.
+	Set USE_POSTGRES to benchmark against Postgres.
+
+	@param on_disk: put a sqlite test database in a file instead of memory, Django
+		never closes connections to an in-memory database
+	"""
+	test_settings = connection.settings_dict['TEST']
+	old_test_name = test_settings['NAME']
+	if on_disk and connection.vendor == 'sqlite' and not old_test_name:
+		test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'rainshop_benchmark.sqlite3')
+	setup_test_environment(debug=False)
+	try:
+		old_config = setup_databases(verbosity, interactive=False, keepdb=keepdb)
+		try:
+			yield
+		finally:
+			teardown_databases(old_config, verbosity, keepdb=keepdb)
+	finally:
+		teardown_test_environment()
+		test_settings['NAME'] = old_test_name
+
+
+def _async_patterns(patterns):
+	rebuilt = []
+	for pattern in patterns:
+		if isinstance(pattern, URLResolver):
+			pattern = URLResolver(
+				pattern.pattern, _async_patterns(pattern.url_patterns), pattern.default_kwargs,
+				pattern.app_name, pattern.namespace
+			)
+		elif getattr(pattern.callback, 'pooled_reads', False) and not asyncio.iscoroutinefunction(pattern.callback):
+			pattern = URLPattern(pattern.pattern, make_async_view(pattern.callback), pattern.default_args, pattern.name)
+		rebuilt.append(pattern)
+	return rebuilt
+
+
+@contextmanager
+def asgi_views():
+	"""
+	Serves the block from a copy of the URL conf with the views of async_view
+	made async, as under ASGI, so the ASGI handler can be tested or benchmarked
+	in a WSGI process. The URL conf modules themselves are left alone.
+	"""
+	urlconf = types.ModuleType('asgi_urlconf')
+	urlconf.urlpatterns = _async_patterns(get_resolver().url_patterns)
+	# changing ROOT_URLCONF clears the URL caches, on the way in and out
+	with override_settings(ROOT_URLCONF=urlconf):
+		yield
@@ -24,5 +24,8 @@ def setup_periodic_tasks(sender, **kwargs):
 	"""
 	This method sets up periodic tasks.
 	"""
-	# handling of the periodic task that deletes all blacklisted tokens
-	sender.add_periodic_task()
+	sender.add_periodic_task(
+		crontab(minute='*/5'),
+		sender.signature('orders.tasks.expire_unpaid_orders'),
+		name='expire unpaid orders'
+	)
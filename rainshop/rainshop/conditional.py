@@ -0,0 +1,84 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+# headers cached along with a response body, see products.cache
+VALIDATOR_HEADERS = ['ETag', 'Last-Modified', 'Cache-Control']
+
+
+def _etag(request, parts):
+	# the media type is part of the representation, e.g. JSON vs the browsable API
+	parts = [getattr(request, 'accepted_media_type', None)] + list(parts)
+	return quote_etag(hashlib.sha1(repr(parts).encode('utf-8')).hexdigest())
+
+
+def queryset_validators(queryset, *extra, updated_at=('updated_at',)):
+	"""
+	Validators of a list: one aggregate query for the row count and the latest
+	updated_at. Every change of a row moves updated_at and deletions change the
+	count, so a new ETag means the list may have changed.
+
+	@param queryset: the filtered queryset the list is built from
+	@param extra: additional values the representation depends on, e.g. the user
+	@param updated_at: updated_at lookups to take the latest of, including those of rendered relations
+	@return: (ETag parts, None); lists have no Last-Modified, a deletion does not move it
+	"""
+	versions = queryset.order_by().aggregate(
+		count=Count('pk'),
+		**{f'updated_at_{number}': Max(lookup) for number, lookup in enumerate(updated_at)}
+	)
+	return [value for _, value in sorted(versions.items())] + list(extra), None
+
+
+def object_validators(instance, *extra):
+	"""
+	@return: (ETag parts, Last-Modified) of a single object with an updated_at field
+	"""
+	return [instance.pk, instance.updated_at, *extra], instance.updated_at
+
+
+class ConditionalGetMixin:
+	"""
+	View mixin for list and retrieve: requests with If-None-Match / If-Modified-Since
+	are compared with the validators before anything is serialized, and a match is
+	answered with 304 Not Modified. Responses carry an ETag (and Last-Modified for
+	single objects) and Cache-Control: no-cache, so clients revalidate on every poll.
+	Set conditional_private = False on views serving the same data to every user.
+	"""
+	conditional_private = True
+
+	def get_list_validators(self):
+		return queryset_validators(self.filter_queryset(self.get_queryset()))
+
+	def conditional_get(self, request, validators, build_response):
+		parts, updated_at = validators
+		etag = _etag(request, parts)
+		last_modified = int(updated_at.timestamp()) if updated_at is not None else None
+		response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+		if response is None:
+			response = build_response()
+			if response.status_code != 200:
+				return response
+		response['ETag'] = etag
+		if last_modified is not None:
+			response['Last-Modified'] = http_date(last_modified)
+		patch_cache_control(response, no_cache=True, private=self.conditional_private)
+		return response
+
+	def list(self, request, *args, **kwargs):
+		return self.conditional_get(
+			request,
+			self.get_list_validators(),
+			lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+		)
+
+	def retrieve(self, request, *args, **kwargs):
+		instance = self.get_object()
+		return self.conditional_get(
+			request,
+			object_validators(instance),
+			lambda: Response(self.get_serializer(instance).data)
+		)
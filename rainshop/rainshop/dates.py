@@ -0,0 +1,26 @@
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def start_of_day(day):
+	"""Midnight of the day in the current time zone, as an aware datetime."""
+	return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def day_range(field, start_date=None, end_date=None):
+	"""
+	Filters a datetime field to whole days, like field__date__gte/lte would,
+	but as a plain range on the column so an index on it can be used.
+
+	@param field: lookup path of the datetime field, e.g. 'order__created_at'
+	@param start_date: first day (inclusive), unbounded when None
+	@param end_date: last day (inclusive), unbounded when None
+	"""
+	condition = Q()
+	if start_date is not None:
+		condition &= Q(**{f'{field}__gte': start_of_day(start_date)})
+	if end_date is not None:
+		condition &= Q(**{f'{field}__lt': start_of_day(end_date + datetime.timedelta(days=1))})
+	return condition
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+
+def check_connections():
+	"""
+	Closes persistent connections that stopped working while they sat idle
+	(database restart, pgbouncer or a firewall dropping them), so the next query
+	reconnects instead of failing. Only connections idle for at least
+	DB_HEALTH_CHECK_IDLE_SECONDS are pinged; busy ones are trusted, which keeps
+	the check off the hot path under load.
+	"""
+	now = time.monotonic()
+	for connection in connections.all():
+		if connection.connection is None or connection.in_atomic_block:
+			continue
+		idle_since = getattr(connection, 'idle_since', None)
+		if idle_since is not None and now - idle_since < settings.DB_HEALTH_CHECK_IDLE_SECONDS:
+			continue
+		if not connection.is_usable():
+			connection.close()
+		connection.idle_since = now
+
+
+def mark_connections_used():
+	now = time.monotonic()
+	for connection in connections.all():
+		if connection.connection is not None:
+			connection.idle_since = now
+
+
+def persistent_connections():
+	return any(database.get('CONN_MAX_AGE') for database in settings.DATABASES.values())
+
+
+class ConnectionHealthMiddleware(MiddlewareMixin):
+	"""
+	Health check for persistent connections (CONN_MAX_AGE), which Django 3.2 lacks
+	(CONN_HEALTH_CHECKS is 4.1+). Not used when no database keeps its connections.
+	Async views running in worker threads check their own connections,
+	see rainshop.async_views.
+	"""
+
+	def __init__(self, get_response):
+		if not persistent_connections() or settings.DB_HEALTH_CHECK_IDLE_SECONDS is None:
+			raise MiddlewareNotUsed()
+		super().__init__(get_response)
+
+	def process_request(self, request):
+		check_connections()
+
+	def process_response(self, request, response):
+		mark_connections_used()
+		return response
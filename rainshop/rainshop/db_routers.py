@@ -0,0 +1,129 @@
+import contextvars
+import functools
+import hashlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+REPLICA_DB_ALIAS = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# a token or session created a moment ago has to authenticate on the next request
+PRIMARY_ONLY_APPS = {'auth', 'authtoken', 'sessions'}
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+	return REPLICA_DB_ALIAS in connections.databases
+
+
+@contextmanager
+def replica_reads():
+	"""Sends the reads of the block to the replica, when one is configured."""
+	token = _replica_reads.set(replica_configured())
+	try:
+		yield
+	finally:
+		_replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+	"""Sends the reads of the block to the primary, also inside replica_reads()."""
+	token = _replica_reads.set(False)
+	try:
+		yield
+	finally:
+		_replica_reads.reset(token)
+
+
+class ReplicaRouter:
+	"""
+	Reads inside replica_reads() go to the 'replica' database, except for users,
+	tokens and sessions. Everything else, writes included, goes to 'default'.
+	Without a replica alias it routes nothing.
+	"""
+
+	def db_for_read(self, model, **hints):
+		if not _replica_reads.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+			return None
+		# a transaction reads its own writes
+		if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+			return None
+		return REPLICA_DB_ALIAS
+
+	def db_for_write(self, model, **hints):
+		# objects read from the replica are saved to the primary, not to their own database
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+		if obj1._state.db in databases and obj2._state.db in databases:
+			return True
+		return None
+
+
+def _pin_key(request):
+	# the credential identifies the client without a database query,
+	# authentication has not happened yet when the routing is decided
+	credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+	if not credential:
+		return None
+	return 'replica-pin:' + hashlib.sha1(credential.encode('utf-8')).hexdigest()
+
+
+def _pin_cache():
+	return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def pin_to_primary(request):
+	key = _pin_key(request)
+	if key is not None:
+		_pin_cache().set(key, True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def pinned_to_primary(request):
+	key = _pin_key(request)
+	return key is not None and _pin_cache().get(key, False)
+
+
+def read_from_replica(view):
+	"""
+	Serves the safe requests of a view from the replica, unless the client wrote
+	within the last REPLICA_PIN_SECONDS, so clients always read their own writes.
+	Other requests, and every request without a replica, use the primary.
+
+	@param view: the view function, e.g. a DRF view's as_view()
+	@return: view function keeping the view's attributes
+	"""
+
+	@functools.wraps(view)
+	def wrapped(request, *args, **kwargs):
+		if request.method not in SAFE_METHODS or not replica_configured() or pinned_to_primary(request):
+			return view(request, *args, **kwargs)
+		with replica_reads():
+			return view(request, *args, **kwargs)
+
+	return wrapped
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+	"""
+	Pins the client of every successful write request to the primary for
+	REPLICA_PIN_SECONDS, long enough for the replica to catch up.
+	Not used without a replica.
+	"""
+
+	def __init__(self, get_response):
+		if not replica_configured():
+			raise MiddlewareNotUsed()
+		super().__init__(get_response)
+
+	def process_response(self, request, response):
+		if request.method not in SAFE_METHODS and response.status_code < 400:
+			pin_to_primary(request)
+		return response
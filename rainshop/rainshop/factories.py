@@ -0,0 +1,28 @@
+import factory
+from factory import fuzzy
+from django.contrib.auth import get_user_model
+from factory.django import DjangoModelFactory
+
+from products.models import Product
+
+PASSWORD = 'benchmark-password'
+
+
+class UserFactory(DjangoModelFactory):
+	class Meta:
+		model = get_user_model()
+		django_get_or_create = ('username',)
+
+	username = factory.Sequence(lambda n: f'user{n}')
+	email = factory.LazyAttribute(lambda user: f'{user.username}@example.com')
+	password = factory.PostGenerationMethodCall('set_password', PASSWORD)
+
+
+class ProductFactory(DjangoModelFactory):
+	class Meta:
+		model = Product
+
+	name = factory.Faker('catch_phrase')
+	cost = fuzzy.FuzzyDecimal(1, 500)
+	price = factory.LazyAttribute(lambda product: product.cost * 2)
+	quantity = 1000
@@ -0,0 +1,89 @@
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from moneyed import Money
+from rest_framework import renderers, parsers, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+_drf_encoder = encoders.JSONEncoder()
+_datetime_field = serializers.DateTimeField()
+_date_field = serializers.DateField()
+_time_field = serializers.TimeField()
+
+
+def default(obj):
+	"""
+	Encodes the values JSON has no type for. Datetimes, dates and times are
+	formatted like serializer fields do (REST_FRAMEWORK['DATETIME_FORMAT'] etc.),
+	Money like its amount; Decimals and everything else like DRF's JSONEncoder.
+	"""
+	# most common first: aggregates are Decimals
+	if isinstance(obj, decimal.Decimal):
+		return float(obj)
+	if isinstance(obj, Money):
+		return float(obj.amount)
+	if isinstance(obj, datetime.datetime):
+		return _datetime_field.to_representation(obj)
+	if isinstance(obj, datetime.date):
+		return _date_field.to_representation(obj)
+	if isinstance(obj, datetime.time):
+		return _time_field.to_representation(obj)
+	return _drf_encoder.default(obj)
+
+
+if orjson is not None:
+	# datetimes go through default() instead of orjson's own RFC 3339 format
+	_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data, indent=None):
+	"""Serializes to UTF-8 bytes with orjson when it is installed and no indent other than 2 is asked for."""
+	if orjson is not None and indent in (None, 2):
+		options = _ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+		return orjson.dumps(data, default=default, option=options)
+	separators = (',', ':') if indent is None else (',', ': ')
+	return json.dumps(
+		data, default=default, ensure_ascii=False, allow_nan=False, indent=indent, separators=separators
+	).encode('utf-8')
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+	"""
+	Drop in replacement for DRF's JSONRenderer using dumps(). The output only
+	differs for raw datetimes in the data, which follow DATETIME_FORMAT.
+	"""
+
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		if data is None:
+			return b''
+		renderer_context = renderer_context or {}
+		indent = self.get_indent(accepted_media_type, renderer_context)
+		ret = dumps(data, indent=indent)
+		# like JSONRenderer, keep the output valid JavaScript
+		return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(parsers.JSONParser):
+	"""JSONParser parsing with orjson when it is installed."""
+	renderer_class = FastJSONRenderer
+
+	def parse(self, stream, media_type=None, parser_context=None):
+		if orjson is None:
+			return super().parse(stream, media_type, parser_context)
+		parser_context = parser_context or {}
+		encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+		try:
+			body = stream.read()
+			if encoding.lower().replace('-', '') != 'utf8':
+				body = body.decode(encoding).encode('utf-8')
+			return orjson.loads(body)
+		except (ValueError, UnicodeError) as exc:
+			raise ParseError('JSON parse error - %s' % str(exc))
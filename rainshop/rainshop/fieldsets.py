@@ -0,0 +1,131 @@
+from django.core.exceptions import FieldDoesNotExist
+from drf_yasg import openapi
+from rest_framework import serializers
+
+from .custom_drf_errors import CustomError
+
+
+class SparseFieldsetMixin:
+	"""
+	Serializer mixin: the `fields` keyword argument limits the representation
+	to the named fields, so unused method fields (hyperlinks, money formatting)
+	are never computed.
+
+	Method fields list the model fields they read in Meta.field_sources,
+	e.g. {'self': ['id']}, so views can trim the queryset with only().
+	"""
+
+	def __init__(self, *args, fields=None, **kwargs):
+		super().__init__(*args, **kwargs)
+		if fields is not None:
+			for name in set(self.fields) - set(fields):
+				self.fields.pop(name)
+
+	def model_fields(self):
+		"""
+		Returns the model field lookups needed to render the kept fields,
+		or None if a field's needs are unknown and nothing should be deferred.
+		"""
+		model = self.Meta.model
+		field_sources = getattr(self.Meta, 'field_sources', {})
+		lookups = []
+		for name, field in self.fields.items():
+			if name in field_sources:
+				lookups += field_sources[name]
+				continue
+			if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+				return None
+			source = field.source.split('.')[0]
+			try:
+				model_field = model._meta.get_field(source)
+			except FieldDoesNotExist:
+				return None
+			if model_field.one_to_many or model_field.many_to_many:
+				# reverse relations are prefetched, not selected
+				continue
+			if model_field.many_to_one or model_field.one_to_one:
+				nested = field if isinstance(field, SparseFieldsetMixin) else None
+				nested_lookups = nested.model_fields() if nested is not None else None
+				if nested_lookups is None:
+					return None
+				lookups.append(source)
+				lookups += [f'{source}__{lookup}' for lookup in nested_lookups]
+				continue
+			lookups.append(model_field.name)
+			# money fields keep their currency in a sibling column
+			try:
+				lookups.append(model._meta.get_field(f'{model_field.name}_currency').name)
+			except FieldDoesNotExist:
+				pass
+		return list(dict.fromkeys(lookups))
+
+
+class SparseFieldsetViewMixin:
+	"""
+	View mixin for GET requests with ?fields=a,b,c: passes the requested fields
+	to a SparseFieldsetMixin serializer and loads only the columns they need.
+	Views list the columns their pagination needs in sparse_fieldset_required.
+	"""
+	fields_query_param = 'fields'
+	sparse_fieldset_required = []
+
+	def get_requested_fields(self):
+		if self.request is None or self.request.method != 'GET':
+			return None
+		value = self.request.query_params.get(self.fields_query_param)
+		if not value:
+			return None
+		return [name.strip() for name in value.split(',') if name.strip()]
+
+	def wants_field(self, name):
+		fields = self.get_requested_fields()
+		return fields is None or name in fields
+
+	def get_sparse_fields(self):
+		"""
+		Returns the requested fields if the serializer supports sparse fieldsets.
+
+		@raise CustomError: 400 if a requested field does not exist
+		"""
+		fields = self.get_requested_fields()
+		if fields is None or not issubclass(self.get_serializer_class(), SparseFieldsetMixin):
+			return None
+		unknown = set(fields) - set(self.get_serializer_class()().fields)
+		if unknown:
+			raise CustomError(
+				detail=f'Unknown fields: {", ".join(sorted(unknown))}',
+				status_code=400,
+				field=self.fields_query_param
+			)
+		return fields
+
+	def get_serializer(self, *args, **kwargs):
+		fields = self.get_sparse_fields()
+		if fields is not None:
+			kwargs['fields'] = fields
+		return super().get_serializer(*args, **kwargs)
+
+	def filter_queryset(self, queryset):
+		queryset = super().filter_queryset(queryset)
+		fields = self.get_sparse_fields()
+		if fields is None:
+			return queryset
+		lookups = self.get_serializer_class()(fields=fields).model_fields()
+		if lookups is None:
+			return queryset
+		lookups += self.sparse_fieldset_required
+		if isinstance(queryset.query.select_related, dict):
+			# a deferred relation cannot be joined, keep only the joins still needed
+			needed = {lookup.split('__')[0] for lookup in lookups}
+			joins = [relation for relation in queryset.query.select_related if relation in needed]
+			queryset = queryset.select_related(None)
+			if joins:
+				queryset = queryset.select_related(*joins)
+		return queryset.only(*lookups)
+
+
+fields_parameter = openapi.Parameter(
+	SparseFieldsetViewMixin.fields_query_param,
+	in_=openapi.IN_QUERY,
+	description='Comma separated list of the fields to return, e.g. "id,name,price".',
+	type=openapi.TYPE_STRING)
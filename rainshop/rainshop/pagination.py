@@ -0,0 +1,136 @@
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from drf_yasg import openapi
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+	"""
+	Keyset pagination over (created_at, id). Each page is a range scan starting
+	right after the previous page's last row, so deep pages cost the same as the first.
+	Cursors are opaque urlsafe base64 tokens.
+	"""
+	cursor_query_param = 'cursor'
+	invalid_cursor_message = 'Invalid cursor'
+
+	def __init__(self, page_size):
+		self.page_size = page_size
+
+	def encode_cursor(self, obj, reverse):
+		position = {
+			't': obj.created_at.isoformat(),
+			'i': obj.id,
+			'r': int(reverse),
+		}
+		token = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+		return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+	def decode_cursor(self, request):
+		token = request.query_params.get(self.cursor_query_param)
+		if not token:
+			return None
+		try:
+			position = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+			return (
+				datetime.datetime.fromisoformat(position['t']),
+				int(position['i']),
+				bool(position['r'])
+			)
+		except (TypeError, ValueError, KeyError, UnicodeError):
+			raise NotFound(self.invalid_cursor_message)
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.base_url = request.build_absolute_uri()
+		cursor = self.decode_cursor(request)
+		reverse = cursor is not None and cursor[2]
+		if reverse:
+			queryset = queryset.order_by('-created_at', '-id')
+		else:
+			queryset = queryset.order_by('created_at', 'id')
+		if cursor is not None:
+			created_at, pk = cursor[0], cursor[1]
+			if reverse:
+				queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+			else:
+				queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+		results = list(queryset[:self.page_size + 1])
+		has_more = len(results) > self.page_size
+		results = results[:self.page_size]
+		if reverse:
+			results.reverse()
+			self.has_next = cursor is not None
+			self.has_previous = has_more
+		else:
+			self.has_next = has_more
+			self.has_previous = cursor is not None
+		self.page = results
+		return results
+
+	def get_next_link(self):
+		if not self.has_next or not self.page:
+			return None
+		return self.encode_cursor(self.page[-1], reverse=False)
+
+	def get_previous_link(self):
+		if not self.has_previous:
+			return None
+		if not self.page:
+			return remove_query_param(self.base_url, self.cursor_query_param)
+		return self.encode_cursor(self.page[0], reverse=True)
+
+	def get_paginated_response(self, data):
+		return Response({
+			'next'    : self.get_next_link(),
+			'previous': self.get_previous_link(),
+			'results' : data
+		})
+
+
+class OptInCursorPagination(LimitOffsetPagination):
+	"""
+	Limit/offset pagination by default. Clients opt in to keyset pagination
+	with ?pagination=cursor and then follow the next/previous links,
+	which carry an opaque ?cursor= token.
+	"""
+	pagination_query_param = 'pagination'
+	cursor_query_param = KeysetCursorPagination.cursor_query_param
+
+	def wants_cursor(self, request):
+		return (
+			request.query_params.get(self.pagination_query_param) == 'cursor'
+			or self.cursor_query_param in request.query_params
+		)
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.cursor_paginator = None
+		if self.wants_cursor(request):
+			self.cursor_paginator = KeysetCursorPagination(self.get_limit(request))
+			return self.cursor_paginator.paginate_queryset(queryset, request, view)
+		return super().paginate_queryset(queryset, request, view)
+
+	def get_paginated_response(self, data):
+		if self.cursor_paginator is not None:
+			return self.cursor_paginator.get_paginated_response(data)
+		return super().get_paginated_response(data)
+
+
+cursor_pagination_parameters = [
+	openapi.Parameter(
+		OptInCursorPagination.pagination_query_param,
+		in_=openapi.IN_QUERY,
+		description='Set to "cursor" to page by (created_at, id) instead of limit/offset.',
+		type=openapi.TYPE_STRING,
+		enum=['cursor']),
+	openapi.Parameter(
+		OptInCursorPagination.cursor_query_param,
+		in_=openapi.IN_QUERY,
+		description='Opaque cursor taken from the next/previous link of a cursor page.',
+		type=openapi.TYPE_STRING),
+]
@@ -0,0 +1,76 @@
+import re
+
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+# "SCAN orders" is a full table scan, "SCAN orders USING INDEX ..." and "SEARCH ..." are not
+_SQLITE_TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+_POSTGRES_TABLE_SCAN = re.compile(r'Seq Scan on "?(\w+)"?')
+
+
+def explain(connection, sql):
+	"""
+	Returns the plan of an already interpolated statement, one line per node.
+	On Postgres sequential scans are disabled for the duration of the EXPLAIN, so
+	the planner only picks one when no index can serve the query, whatever the
+	table size. That makes the plan meaningful on near empty test tables.
+	"""
+	with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+		if connection.vendor == 'postgresql':
+			cursor.execute('SET LOCAL enable_seqscan = off')
+			cursor.execute(f'EXPLAIN {sql}')
+			return [row[0] for row in cursor.fetchall()]
+		if connection.vendor == 'sqlite':
+			cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+			return [row[-1] for row in cursor.fetchall()]
+		cursor.execute(f'EXPLAIN {sql}')
+		return [' '.join(str(value) for value in row) for row in cursor.fetchall()]
+
+
+def table_scans(connection, plan):
+	"""Tables read with a full sequential scan according to the plan."""
+	pattern = _POSTGRES_TABLE_SCAN if connection.vendor == 'postgresql' else _SQLITE_TABLE_SCAN
+	scans = []
+	for line in plan:
+		match = pattern.search(line.strip())
+		if match:
+			scans.append(match.group(1))
+	return scans
+
+
+class ExplainQueriesContext(CaptureQueriesContext):
+	"""
+	Captures the statements run in the block, like CaptureQueriesContext,
+	and EXPLAINs each SELECT, UPDATE and DELETE afterwards.
+
+	Usage:
+		with ExplainQueriesContext(connection) as plans:
+			self.client.get(url)
+		self.assertEqual(plans.table_scans(['orders']), [])
+	"""
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		super().__exit__(exc_type, exc_value, traceback)
+		self.plans = []
+		if exc_type is not None:
+			return
+		for query in self.captured_queries:
+			sql = query['sql']
+			if sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+				self.plans.append((sql, explain(self.connection, sql)))
+
+	def table_scans(self, tables=None):
+		"""
+		Lists the statements that read one of the tables with a full scan.
+
+		@param tables: table names to check, all tables when None
+		@return: list of (table, sql) pairs, empty when every access used an index
+		"""
+		scans = []
+		for sql, plan in self.plans:
+			for table in table_scans(self.connection, plan):
+				if tables is None or table in tables:
+					scans.append((table, sql))
+		return scans
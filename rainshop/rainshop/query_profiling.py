@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('rainshop.query_profiling')
+
+# the QueryProfile of the request being profiled, if any
+_active_profile = ContextVar('query_profile', default=None)
+
+# "IN (%s, %s, %s)" and multi row VALUES lists only differ by their length
+_PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+_VALUES_LIST = re.compile(r'\(\s*%s\s*\)(?:\s*,\s*\(\s*%s\s*\))+')
+
+
+def sql_template(sql):
+	"""
+	Returns the statement with placeholder lists collapsed, so statements that
+	only differ by their parameters (the typical N+1 pattern) share one template.
+	"""
+	sql = _PLACEHOLDER_LIST.sub('%s', sql)
+	return _VALUES_LIST.sub('(%s)', sql)
+
+
+class QueryProfile:
+	"""
+	Database execute wrapper collecting the statements of one request.
+	Only the count, the timings and the SQL templates are kept, never the parameters.
+	"""
+
+	def __init__(self):
+		self.count = 0
+		self.duration = 0.0
+		self.slowest_sql = None
+		self.slowest_duration = 0.0
+		self.templates = Counter()
+
+	def __call__(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			duration = time.perf_counter() - started
+			self.count += 1
+			self.duration += duration
+			if duration >= self.slowest_duration:
+				self.slowest_duration = duration
+				self.slowest_sql = sql
+			self.templates[sql_template(sql)] += 1
+
+	def duplicates(self, threshold):
+		"""Templates executed at least threshold times, most repeated first."""
+		return [(sql, count) for sql, count in self.templates.most_common() if count >= threshold]
+
+	def server_timing(self, duplicates):
+		metrics = [
+			f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"',
+			f'db-slowest;dur={self.slowest_duration * 1000:.2f}',
+		]
+		if duplicates:
+			metrics.append(f'db-duplicates;desc="{len(duplicates)} repeated statements"')
+		return ', '.join(metrics)
+
+
+def _view_name(request):
+	match = getattr(request, 'resolver_match', None)
+	if match is None:
+		return None
+	return match.view_name or match._func_path
+
+
+def _profile_active_request(execute, sql, params, many, context):
+	profile = _active_profile.get()
+	if profile is None:
+		return execute(sql, params, many, context)
+	return profile(execute, sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+	if _profile_active_request not in connection.execute_wrappers:
+		connection.execute_wrappers.append(_profile_active_request)
+
+
+class QueryProfilingMiddleware:
+	"""
+	Production safe replacement for SqlPrintingMiddleware: works with DEBUG off and
+	does not rely on connection.queries. A sample of the requests
+	(QUERY_PROFILING_SAMPLE_RATE, 0 disables the middleware) is profiled through
+	an execute wrapper on every database connection. The result is added as a
+	Server-Timing header and logged as one JSON line to the rainshop.query_profiling
+	logger. Requests running a statement template at least
+	QUERY_PROFILING_DUPLICATE_THRESHOLD times are logged as warnings (likely N+1).
+	Queries run while a streaming response is consumed are not included.
+
+	The profiled request is tracked in a context variable rather than per thread,
+	so the middleware is async capable and also counts the queries async views
+	run in worker threads (see rainshop.async_views).
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.sample_rate = settings.QUERY_PROFILING_SAMPLE_RATE
+		self.duplicate_threshold = settings.QUERY_PROFILING_DUPLICATE_THRESHOLD
+		if self.sample_rate <= 0:
+			raise MiddlewareNotUsed()
+		connection_created.connect(_install)
+		for connection in connections.all():
+			_install(connection)
+		if asyncio.iscoroutinefunction(self.get_response):
+			# marks the instance as a coroutine function for Django, like MiddlewareMixin does
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+	def _sampled(self):
+		return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+	def __call__(self, request):
+		if asyncio.iscoroutinefunction(self.get_response):
+			return self.__acall__(request)
+		if not self._sampled():
+			return self.get_response(request)
+
+		profile = QueryProfile()
+		token = _active_profile.set(profile)
+		started = time.perf_counter()
+		try:
+			response = self.get_response(request)
+		finally:
+			_active_profile.reset(token)
+		return self.report(request, response, profile, time.perf_counter() - started)
+
+	async def __acall__(self, request):
+		if not self._sampled():
+			return await self.get_response(request)
+
+		profile = QueryProfile()
+		token = _active_profile.set(profile)
+		started = time.perf_counter()
+		try:
+			response = await self.get_response(request)
+		finally:
+			_active_profile.reset(token)
+		return self.report(request, response, profile, time.perf_counter() - started)
+
+	def report(self, request, response, profile, elapsed):
+		duplicates = profile.duplicates(self.duplicate_threshold)
+		response['Server-Timing'] = profile.server_timing(duplicates)
+		record = {
+			'method'     : request.method,
+			'path'       : request.path,
+			'view'       : _view_name(request),
+			'status'     : response.status_code,
+			'duration_ms': round(elapsed * 1000, 2),
+			'db_queries' : profile.count,
+			'db_ms'      : round(profile.duration * 1000, 2),
+			'slowest_ms' : round(profile.slowest_duration * 1000, 2),
+			'slowest_sql': profile.slowest_sql,
+			'duplicates' : [{'sql': sql, 'count': count} for sql, count in duplicates],
+		}
+		level = logging.WARNING if duplicates else logging.INFO
+		logger.log(level, json.dumps(record))
+		return response
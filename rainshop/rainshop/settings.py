@@ -1,5 +1,6 @@
 import _locale
 import os
+import sys
 from datetime import timedelta
 from django.core.management.utils import get_random_secret_key
 import environ
@@ -40,6 +41,11 @@ LOGGING = {
 			'level'    : os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
 			'propagate': False,
 		},
+		'rainshop.query_profiling': {
+			'handlers' : ['console'],
+			'level'    : os.getenv('QUERY_PROFILING_LOG_LEVEL', 'INFO'),
+			'propagate': False,
+		},
 	},
 }
 env = environ.Env()
@@ -109,6 +115,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+	'rainshop.query_profiling.QueryProfilingMiddleware',
+	'rainshop.db_health.ConnectionHealthMiddleware',
+	'rainshop.db_routers.PrimaryPinMiddleware',
 	'django.middleware.security.SecurityMiddleware',
 	'django.contrib.sessions.middleware.SessionMiddleware',
 	'corsheaders.middleware.CorsMiddleware',
@@ -134,8 +143,9 @@ AUTH_PASSWORD_VALIDATORS = [
 	},
 ]
 
+# orjson based when it is installed, see rainshop.fast_json
 DEFAULT_RENDERER_CLASSES = (
-	'rest_framework.renderers.JSONRenderer',
+	'rainshop.fast_json.FastJSONRenderer',
 )
 if DEBUG:
 	MIDDLEWARE += [
@@ -162,7 +172,7 @@ REST_FRAMEWORK = {
 		'rest_framework.permissions.AllowAny',
 	],
 	'DEFAULT_PARSER_CLASSES'        : [
-		'rest_framework.parsers.JSONParser',
+		'rainshop.fast_json.FastJSONParser',
 	],
 	'DEFAULT_THROTTLE_CLASSES'      : [
 		'rest_framework.throttling.AnonRateThrottle',
@@ -196,9 +206,23 @@ if USE_POSTGRES:
 			'PORT'    : env('DB_PORT'),
 			'OPTIONS' : {
 				'options': '-c search_path=public'
-			}
+			},
+			# seconds a connection is kept for the next requests of the same worker thread, 0 closes it every request
+			'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+			# behind pgbouncer in transaction pooling mode server side cursors (iterator()) cannot work
+			'DISABLE_SERVER_SIDE_CURSORS': env.bool('DB_PGBOUNCER', default=False),
 		}
 	}
+	if env('DB_REPLICA_HOST', default=None):
+		DATABASES['replica'] = dict(
+			DATABASES['default'],
+			HOST=env('DB_REPLICA_HOST'),
+			PORT=env('DB_REPLICA_PORT', default=env('DB_PORT')),
+			NAME=env('DB_REPLICA_NAME', default=env('DB_NAME')),
+			USER=env('DB_REPLICA_USER', default=env('DB_USER')),
+			PASSWORD=env('DB_REPLICA_PASSWORD', default=env('DB_PASSWORD')),
+			TEST={'MIRROR': 'default'},
+		)
 else:
 	DATABASES = {
 		'default': {
@@ -206,10 +230,35 @@ else:
 			'NAME'  : 'db1.sqlite3',
 		}
 	}
+	# e.g. a copy of db1.sqlite3, stale like a lagging replica
+	if env('DB_REPLICA_NAME', default=None):
+		DATABASES['replica'] = {
+			'ENGINE': 'django.db.backends.sqlite3',
+			'NAME'  : env('DB_REPLICA_NAME'),
+			'TEST'  : {'MIRROR': 'default'},
+		}
+
+# reads of the views wrapped with rainshop.db_routers.read_from_replica go to the 'replica' database
+DATABASE_ROUTERS = ['rainshop.db_routers.ReplicaRouter']
 
 if env.bool('SQL_DEBUG', False):
 	MIDDLEWARE += ['sql_middleware.SqlPrintingMiddleware']
 
+# set by rainshop.asgi: read views are only made async (see rainshop.async_views)
+# when served over ASGI, under WSGI they would pay for an event loop round trip
+SERVE_ASGI = env.bool('SERVE_ASGI', default=False)
+
+# persistent connections idle for this long are pinged before reuse, see rainshop.db_health
+DB_HEALTH_CHECK_IDLE_SECONDS = env.int('DB_HEALTH_CHECK_IDLE_SECONDS', default=30)
+
+# after a write a client reads from the primary for this long, so it sees its own writes despite replication lag
+REPLICA_PIN_SECONDS = env.int('DB_REPLICA_PIN_SECONDS', default=5)
+
+# share of requests profiled by rainshop.query_profiling, between 0 (off) and 1 (all)
+QUERY_PROFILING_SAMPLE_RATE = env.float('QUERY_PROFILING_SAMPLE_RATE', default=0.0)
+# a statement repeated this often within one request is reported as a likely N+1
+QUERY_PROFILING_DUPLICATE_THRESHOLD = env.int('QUERY_PROFILING_DUPLICATE_THRESHOLD', default=5)
+
 if USE_REDIS_CACHE:
 	CACHE_TTL = 60 * 1
 
@@ -221,19 +270,49 @@ if USE_REDIS_CACHE:
 				'CLIENT_CLASS': 'django_redis.client.DefaultClient',
 			},
 			'KEY_PREFIX': 'pr_chc'
+		},
+		'catalog': {
+			'BACKEND'   : 'django_redis.cache.RedisCache',
+			'LOCATION'  : env('CACHE_URL_1'),
+			'OPTIONS'   : {
+				'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+			},
+			'KEY_PREFIX': 'pr_ctlg'
 		}
 	}
 	SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 	SESSION_CACHE_ALIAS = 'default'
+	CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', default=60 * 60)
+	STATS_CACHE_TTL = env.int('STATS_CACHE_TTL', default=60 * 60 * 24)
 
 else:
 	CACHE_TTL = 60 * 1
 	CACHES = {
 		'default': {
 			'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+		},
+		# local memory fallback for tests and single node deployments:
+		# locmem evicts least recently used entries once MAX_ENTRIES is reached.
+		# It is per process, so with several workers a change is only seen
+		# by the other workers after CATALOG_CACHE_TTL.
+		'catalog': {
+			'BACKEND' : 'django.core.cache.backends.locmem.LocMemCache',
+			'LOCATION': 'catalog',
+			'OPTIONS' : {
+				'MAX_ENTRIES'   : env.int('CATALOG_CACHE_MAX_ENTRIES', default=1000),
+				'CULL_FREQUENCY': 10,
+			}
 		}
 	}
 	SESSION_CACHE_ALIAS = 'default'
+	CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', default=CACHE_TTL)
+	STATS_CACHE_TTL = env.int('STATS_CACHE_TTL', default=CACHE_TTL)
+
+# product list/detail responses, invalidated by products.cache on every catalog change,
+# and stats of closed periods, see products.reports
+CATALOG_CACHE_ALIAS = 'catalog'
+# primary pins of rainshop.db_routers, they have to be shared by all workers to hold across them
+REPLICA_PIN_CACHE_ALIAS = 'default' if USE_REDIS_CACHE else CATALOG_CACHE_ALIAS
 
 SITE_ID = 1
 INTERNAL_IPS = ['127.0.0.1', ]
@@ -247,7 +326,8 @@ else:
 MEDIA_ROOT = root('media')
 MEDIA_URL = '/media/'
 
-CELERY_BROKER_URL = env.str("CELERY_BROKER_URL", default='redis://127.0.0.1:6379')
+# celery_init reads these without a namespace, so they use celery's old setting names
+BROKER_URL = env.str("CELERY_BROKER_URL", default='redis://127.0.0.1:6379')
 CELERY_RESULT_BACKEND = env.str('CELERY_RESULT_BACKEND', default='redis://127.0.0.1:6379')
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -266,6 +346,16 @@ CELERY_IGNORE_RESULT = False
 CELERY_TRACK_STARTED = True
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+# tests and local development (DEBUG) run the tasks in process once the transaction
+# commits, deployments send them to the broker for a celery worker
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+CELERY_ALWAYS_EAGER = env.bool('CELERY_ALWAYS_EAGER', default=DEBUG or TESTING)
+CELERY_EAGER_PROPAGATES_EXCEPTIONS = env.bool('CELERY_EAGER_PROPAGATES_EXCEPTIONS', default=False)
+# order post-processing, see orders.tasks
+STOCK_ALERT_THRESHOLD = env.int('STOCK_ALERT_THRESHOLD', default=5)
+# unpaid orders are cancelled and their stock released after this long, see orders.services
+ORDER_EXPIRY_MINUTES = env.int('ORDER_EXPIRY_MINUTES', default=60)
+ORDER_EXPIRY_BATCH_SIZE = env.int('ORDER_EXPIRY_BATCH_SIZE', default=500)
 # AXES SETTINGS
 AXES_FAILURE_LIMIT = 7
 AXES_LOCK_OUT_AT_FAILURE = True